@@ -3,6 +3,9 @@ from multiprocessing.connection import Listener
 
 import numpy as np
 
+from utils.audio_format import AudioFrameDecoder
+from utils.shm_ring import ShmAudioRing
+
 
 class RecorderAdapter(ABC):
     """
@@ -29,7 +32,9 @@ class RecorderAdapter(ABC):
 
 
 class ListenerRecorderAdapter(RecorderAdapter):
-    def __init__(self, address, authkey=None, timeout=0.02, fake_value=0.0):
+    def __init__(
+        self, address, authkey=None, timeout=0.02, fake_value=0.0, sample_rate=16000
+    ):
         self.address = address
         self.authkey = authkey
         self.timeout = timeout
@@ -37,6 +42,8 @@ class ListenerRecorderAdapter(RecorderAdapter):
         self.listener = None
         self.conn = None
         self.buffer = np.empty((0, 1), dtype=np.float32)
+        # 支援帶 header 的 int16 / 任意取樣率幀，伺服器端重取樣到 sample_rate
+        self.decoder = AudioFrameDecoder(sample_rate)
 
     def __enter__(self):
         self.listener = Listener(self.address, authkey=self.authkey)
@@ -79,5 +86,39 @@ class ListenerRecorderAdapter(RecorderAdapter):
         return np.full((size, 1), self.fake_value, dtype=np.float32)
 
     def _to_array(self, data) -> np.ndarray:
-        data = np.frombuffer(data, dtype=np.float32)
-        return data[:, np.newaxis] if data.ndim == 1 else data
+        return self.decoder.decode(data)[:, np.newaxis]
+
+
+class ShmRecorderAdapter(RecorderAdapter):
+    """
+    從共享記憶體環狀緩衝讀取音訊（同機的 web server 以 ShmAudioWriter 寫入）
+    沒有資料時以門鈴等待 timeout 秒，逾時補靜音，行為與 ListenerRecorderAdapter 一致
+    """
+
+    def __init__(
+        self, name, capacity_sec=2.0, sample_rate=16000, timeout=0.02, fake_value=0.0
+    ):
+        self.name = name
+        self.capacity = int(capacity_sec * sample_rate)
+        self.timeout = timeout
+        self.fake_value = fake_value
+        self.ring = None
+
+    def __enter__(self):
+        self.ring = ShmAudioRing.create(self.name, self.capacity)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.ring:
+            if self.ring.dropped:
+                print(f"[ShmRecorderAdapter] 緩衝已滿而丟棄 {self.ring.dropped} 幀")
+            self.ring.close()
+
+    def record(self, block_size: int) -> np.ndarray:
+        out = np.full((block_size, 1), self.fake_value, dtype=np.float32)
+        filled = 0
+        while filled < block_size:
+            if not self.ring.available() and not self.ring.wait(self.timeout):
+                break  # 逾時：其餘部分維持靜音
+            filled += self.ring.read_into(out[filled:, 0])
+        return out
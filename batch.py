@@ -0,0 +1,230 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from utils.common import load_config
+from utils.resample import StreamConverter
+from utils.subtitle import SUBTITLE_EXT, file_header, format_entry
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+AUDIO_EXT = {".wav", ".flac", ".ogg", ".mp3", ".aiff", ".aif"}
+
+
+def collect_files(paths: list[str]) -> list[tuple[Path, Path]]:
+    """
+    展開參數中的檔案與資料夾（資料夾會遞迴搜尋音訊檔）
+    回傳 (音訊檔, 輸出的相對路徑)：資料夾內的檔案保留其相對於該資料夾的子目錄，
+    避免 a/meeting.wav 與 b/meeting.wav 寫到同一個字幕檔
+    """
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(
+                (f, f.relative_to(p))
+                for f in sorted(p.rglob("*"))
+                if f.suffix.lower() in AUDIO_EXT
+            )
+        elif p.is_file():
+            files.append((p, Path(p.name)))
+        else:
+            logger.warning(f"找不到 {p}，略過")
+    return files
+
+
+def find_conflicts(files: list[tuple[Path, Path]]) -> list[list[Path]]:
+    """輸出路徑相同（只差副檔名或來自不同參數）的音訊檔"""
+    groups: dict[Path, list[Path]] = {}
+    for path, rel in files:
+        groups.setdefault(rel.with_suffix(""), []).append(path)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def load_audio(path: Path, sample_rate: int) -> np.ndarray:
+    """逐區塊讀檔並重取樣成單聲道 float32"""
+    import soundfile as sf
+
+    with sf.SoundFile(path) as f:
+        converter = StreamConverter(f.samplerate, sample_rate)
+        parts = [
+            converter(block)[:, 0]
+            for block in f.blocks(f.samplerate * 10, dtype="float32", always_2d=True)
+        ]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+class BatchTranscriber:
+    """
+    大量錄音檔的批次轉錄
+    - Whisper 模型只載入一次，以 faster_whisper 的 BatchedInferencePipeline
+      先用 VAD 切段，再把多段一起送進模型解碼
+    - workers 個執行緒各處理一個檔案，模型以 num_workers 允許同時解碼
+    - 輸出先寫到 .part 再改名，已存在的輸出視為完成，可中斷後續跑
+    """
+
+    def __init__(
+        self, config: dict, out_dir: Path, fmt: str, batch_size: int, workers: int
+    ):
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+        cfg = config["transcribe_config"]
+        self.sample_rate = cfg.get("sample_rate", 16000)
+        lang = cfg.get("language", None)
+        self.language = None if lang == "auto" else lang
+        self.task = cfg.get("task", "transcribe")
+        self.init_prompt = cfg.get("init_prompt", "")
+        self.beam_size = cfg.get("beam_size", 5)
+        self.vad_threshold = cfg.get("vad_threshold", 0.7)
+        self.word_timestamps = cfg.get("word_timestamps", False)
+
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+
+        model = WhisperModel(
+            cfg.get("model_size", "large-v3"),
+            device="cuda",
+            compute_type=cfg.get("compute_type", "auto"),
+            cpu_threads=int(cfg.get("cpu_threads", 0)),
+            num_workers=self.workers,
+        )
+        self.pipeline = BatchedInferencePipeline(model=model)
+
+    def output_path(self, rel: Path) -> Path:
+        return self.out_dir / rel.with_suffix(SUBTITLE_EXT[self.fmt])
+
+    def transcribe_file(self, path: Path, rel: Path) -> dict:
+        t0 = time.perf_counter()
+        audio = load_audio(path, self.sample_rate)
+        duration = len(audio) / self.sample_rate
+
+        segments, _ = self.pipeline.transcribe(
+            audio,
+            language=self.language,
+            task=self.task,
+            initial_prompt=self.init_prompt or None,
+            beam_size=self.beam_size,
+            batch_size=self.batch_size,
+            vad_filter=True,
+            vad_parameters={"threshold": self.vad_threshold},
+            word_timestamps=self.word_timestamps,
+        )
+
+        out = self.output_path(rel)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        part = out.with_name(out.name + ".part")
+        count = 0
+        with open(part, "w", encoding="utf-8") as f:
+            f.write(file_header(self.fmt))
+            for seg in segments:
+                text = seg.text.strip()
+                if not text:
+                    continue
+                count += 1
+                f.write(format_entry(self.fmt, count, seg.start, seg.end, text))
+        os.replace(part, out)
+
+        elapsed = time.perf_counter() - t0
+        return {
+            "file": str(rel),
+            "duration": duration,
+            "elapsed": elapsed,
+            "rtf": elapsed / duration if duration else 0.0,
+            "segments": count,
+        }
+
+    def run(
+        self, files: list[tuple[Path, Path]], overwrite: bool = False
+    ) -> list[dict]:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        todo = [f for f in files if overwrite or not self.output_path(f[1]).exists()]
+        skipped = len(files) - len(todo)
+        if skipped:
+            logger.info(f"略過 {skipped} 個已完成的檔案")
+
+        results = []
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(self.transcribe_file, *f): f for f in todo}
+            for i, fut in enumerate(as_completed(futures), 1):
+                _, rel = futures[fut]
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    logger.error(f"[{i}/{len(todo)}] {rel} 轉錄失敗: {e}")
+                    continue
+                results.append(r)
+                logger.info(
+                    f"[{i}/{len(todo)}] {r['file']} 完成 "
+                    f"({r['duration']:.1f} 秒音訊，RTF {r['rtf']:.3f})"
+                )
+        return results
+
+
+def print_report(results: list[dict], wall: float):
+    if not results:
+        print("沒有轉錄任何檔案")
+        return
+    width = max(len("檔案"), *(len(r["file"]) for r in results))
+    print(
+        f"\n{'檔案':<{width}}  {'音訊(秒)':>10}  {'耗時(秒)':>10}"
+        f"  {'RTF':>7}  {'段數':>6}"
+    )
+    for r in sorted(results, key=lambda r: r["file"]):
+        print(
+            f"{r['file']:<{width}}  {r['duration']:>10.1f}  {r['elapsed']:>10.1f}"
+            f"  {r['rtf']:>7.3f}  {r['segments']:>6}"
+        )
+    audio = sum(r["duration"] for r in results)
+    rtf = wall / audio if audio else 0.0
+    print(
+        f"\n共 {len(results)} 個檔案、{audio:.1f} 秒音訊，"
+        f"總耗時 {wall:.1f} 秒，整體 RTF {rtf:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批次轉錄錄音檔")
+    parser.add_argument("inputs", nargs="+", help="音訊檔或資料夾")
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="自訂設定檔 (json)，預設為 user_config.json",
+        default=None,
+    )
+    parser.add_argument("-o", "--output", default="transcripts", help="輸出資料夾")
+    parser.add_argument(
+        "-f", "--format", default="srt", choices=sorted(SUBTITLE_EXT), help="輸出格式"
+    )
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=16, help="每批解碼的段數"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=2, help="同時處理的檔案數"
+    )
+    parser.add_argument(
+        "--overwrite", action="store_true", help="重新轉錄已完成的檔案"
+    )
+    args = parser.parse_args()
+
+    files = collect_files(args.inputs)
+    if not files:
+        parser.error("沒有找到任何音訊檔")
+    conflicts = find_conflicts(files)
+    if conflicts:
+        listing = "\n".join("  " + ", ".join(map(str, g)) for g in conflicts)
+        parser.error(f"以下檔案會輸出到同一個字幕檔，請分開執行或改名：\n{listing}")
+
+    config = load_config(args.config)
+    transcriber = BatchTranscriber(
+        config, Path(args.output), args.format, args.batch_size, args.workers
+    )
+    t0 = time.perf_counter()
+    results = transcriber.run(files, overwrite=args.overwrite)
+    print_report(results, time.perf_counter() - t0)
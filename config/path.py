@@ -1,7 +1,10 @@
 from pathlib import Path
 
 CONFIG_PATH = Path("config")
+# 專案根目錄：設定檔中的相對路徑以此為準，不受啟動時的工作目錄影響
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_CFG_PATH = CONFIG_PATH.joinpath("default_config.json")
 CHOICES_PATH = CONFIG_PATH.joinpath("config_choices.json")
 USER_CFG_PATH = CONFIG_PATH.joinpath("user_config.json")
 TRANSLATE_MODEL_PATH = CONFIG_PATH.joinpath("translate_model.json")
+POSTPROCESS_RULES_PATH = PROJECT_ROOT / CONFIG_PATH / "postprocess_rules.json"
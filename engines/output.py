@@ -1,17 +1,38 @@
 # engines/output.py
 
 import logging
+import os
 import queue
+import selectors
+import socket
 import threading
 import time
 import tkinter as tk
 from abc import ABC, abstractmethod
-from multiprocessing.connection import Listener
+from collections import deque
+from pathlib import Path
+
+from utils import metrics
+from utils.caption_delta import CaptionDeltaEncoder
+from utils.framing import encode_frame
+from utils.subtitle import SUBTITLE_EXT, file_header, format_entry
+
+from .pipeline import StageQueue
 
 logger = logging.getLogger(__name__)
 
+_SINK_LAG = metrics.histogram(
+    "stt_sink_lag_seconds", "多重輸出時字幕從分派到各 sink 顯示完成的時間", ("sink",)
+)
+_SINK_ERRORS = metrics.counter(
+    "stt_sink_errors_total", "各 sink 輸出失敗的次數", ("sink",)
+)
+
 
 class BaseOutputEngine(ABC):
+    # Tk 等 GUI 必須在主執行緒執行 start()
+    requires_main_thread = False
+
     @abstractmethod
     def start(self):
         pass
@@ -26,15 +47,30 @@ class BaseOutputEngine(ABC):
 
 
 class WindowOutputEngine(BaseOutputEngine):
+    requires_main_thread = True
+
     def __init__(self, config: dict):
         self.font_size = config.get("font_size", 24)
         self.font_color = config.get("font_color", "#00FF99")
         self.transparent_bg = config.get("transparent_bg", True)
         self.wrap_length = config.get("wrap_length", 800)
+        self.refresh_ms = int(config.get("refresh_ms", 30))
         self.text = ""
         self.root = None
         self.label = None
-        self.queue = queue.Queue()
+        self._quit = False
+
+        # ----- 最新值槽：display() 只覆寫，Tk 每幀最多重繪一次 -----
+        self._lock = threading.Lock()
+        self._latest = ""
+        self._latest_final = False
+        self._version = 0
+        self._rendered_version = 0
+        self._rendered_text = None
+
+        # ----- 捲動歷史：固定行數上限，0 表示只顯示目前字幕 -----
+        self.history_lines = int(config.get("history_lines", 0))
+        self._history: deque[str] = deque(maxlen=max(1, self.history_lines))
 
     def _start_move(self, event):
         self._x_offset = event.x
@@ -74,48 +110,503 @@ class WindowOutputEngine(BaseOutputEngine):
 
     def start(self):
         self.root = tk.Tk()
-        self._poll_queue()
+        self._render()
         self._run_window()
 
-    def _poll_queue(self):
+    def _render(self):
+        if self._quit:
+            self.root.quit()
+            return
+        self.root.after(self.refresh_ms, self._render)
+        if self.label is None:
+            return
+        with self._lock:
+            if self._version == self._rendered_version:
+                return
+            self._rendered_version = self._version
+            lines = [*self._history] if self.history_lines else []
+            lines.append(self._latest)
+        text = "\n".join(line for line in lines if line)
+        # 內容相同就不觸發 Tk relayout
+        if text != self._rendered_text:
+            self._rendered_text = text
+            self.label.config(text=text)  # 只在 Tk 執行緒動 GUI
+
+    def display(self, text: str):
+        # 其他執行緒呼叫：只更新最新值，舊的中間結果直接被覆蓋
+        final = getattr(text, "final", False)
+        with self._lock:
+            if text == self._latest:
+                self._latest_final = self._latest_final or final
+                return
+            # 上一則已定稿（或清空）時才移入歷史，同一段被滑動視窗截掉開頭仍是原地更新
+            if self.history_lines and self._latest and (self._latest_final or not text):
+                self._history.append(self._latest)
+            self._latest = text
+            self._latest_final = final
+            self._version += 1
+
+    def stop(self):
+        # 可能由其他執行緒呼叫（例如輸入結束時），交給 Tk 執行緒的 _render 關閉
+        self._quit = True
+
+
+class _Subscriber:
+    def __init__(self, sock: socket.socket, max_pending: int):
+        self.sock = sock
+        self.pending: deque[bytes] = deque(maxlen=max_pending)
+        self.out = b""  # 正在送出的封包剩餘部分
+        self.dropped = 0
+
+    def push(self, frames: list[bytes], keyframe: bytes | None = None):
+        overflow = len(self.pending) + len(frames) - self.pending.maxlen
+        if overflow > 0 and keyframe is not None:
+            # 增量協定不能跳著丟，佇列滿了就整個換成一個 keyframe
+            self.dropped += len(self.pending) + len(frames)
+            self.pending.clear()
+            self.pending.append(keyframe)
+            return
+        if overflow > 0:
+            self.dropped += overflow
+        self.pending.extend(frames)
+
+    def has_data(self) -> bool:
+        return bool(self.out or self.pending)
+
+
+class SocketOutputEngine(BaseOutputEngine):
+    """
+    字幕發布端：以 selector 迴圈接受任意數量的訂閱者
+    - 每個訂閱者有自己的有界送出佇列，滿了丟最舊（latest-wins）
+    - 封包為「4 bytes 長度 + UTF-8 JSON」，與 Connection.recv_bytes() 相容
+    - caption_protocol="delta" 時只送出變動部分（utils/caption_delta.py），
+      新訂閱者連線時先收到 keyframe
+    - display() 只把封包放進佇列，永不等待任何訂閱者
+    """
+
+    def __init__(self, config: dict):
+        self.address = (
+            config.get("host", "localhost"),
+            int(config.get("port", 6001)),
+        )
+        self.max_pending = int(config.get("max_pending", 16))
+        self.delta = config.get("caption_protocol", "delta") == "delta"
+        self.encoder = CaptionDeltaEncoder(config.get("keyframe_interval", 50))
+        self.server = None
+        self.selector = None
+        self._subs: dict[socket.socket, _Subscriber] = {}
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._running = False
+
+    def start(self):
+        self.server = socket.create_server(self.address)
+        self.server.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, "accept")
+        self.selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._running = True
+        logger.info(f"字幕發布端已啟動於 {self.address}")
+
+        try:
+            while self._running:
+                for key, events in self.selector.select(timeout=1):
+                    if key.data == "accept":
+                        self._accept()
+                    elif key.data == "wake":
+                        self._drain_wake()
+                    else:
+                        if events & selectors.EVENT_READ:
+                            self._on_readable(key.fileobj)
+                        if events & selectors.EVENT_WRITE:
+                            self._on_writable(key.fileobj)
+                self._update_interest()
+        finally:
+            for sock in list(self._subs):
+                self._drop(sock)
+            self.server.close()
+            self.selector.close()
+
+    def _accept(self):
+        try:
+            sock, addr = self.server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sub = _Subscriber(sock, self.max_pending)
+        with self._lock:
+            if self.delta:
+                sub.push([encode_frame(self.encoder.keyframe())])
+            self._subs[sock] = sub
+        self.selector.register(sock, selectors.EVENT_READ, "sub")
+        logger.info(f"字幕訂閱者已連線：{addr}（共 {len(self._subs)} 位）")
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _drop(self, sock: socket.socket):
+        with self._lock:
+            sub = self._subs.pop(sock, None)
+        if sub is None:
+            return
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+        logger.info(
+            f"字幕訂閱者已斷線（丟棄 {sub.dropped} 則），剩 {len(self._subs)} 位"
+        )
+
+    def _on_readable(self, sock: socket.socket):
+        # 訂閱者不需要傳資料，收到 EOF 即視為斷線
+        try:
+            if not sock.recv(4096):
+                self._drop(sock)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(sock)
+
+    def _on_writable(self, sock: socket.socket):
+        sub = self._subs.get(sock)
+        if sub is None:
+            return
         try:
             while True:
-                text = self.queue.get_nowait()
-                self.label.config(text=text)  # 只在 Tk 執行緒動 GUI
-        except queue.Empty:
+                if not sub.out:
+                    with self._lock:
+                        if not sub.pending:
+                            return
+                        sub.out = sub.pending.popleft()
+                sent = sock.send(sub.out)
+                sub.out = sub.out[sent:]
+                if sub.out:
+                    return
+        except BlockingIOError:
             pass
-        self.root.after(30, self._poll_queue)  # 30ms 更新一次
+        except OSError:
+            self._drop(sock)
+
+    def _update_interest(self):
+        for sock, sub in list(self._subs.items()):
+            events = selectors.EVENT_READ
+            if sub.has_data():
+                events |= selectors.EVENT_WRITE
+            try:
+                if self.selector.get_key(sock).events != events:
+                    self.selector.modify(sock, events, "sub")
+            except (KeyError, ValueError):
+                pass
+
+    def display(self, text):
+        with self._lock:
+            if not self.delta:
+                frames, key = [encode_frame({"type": "caption", "text": text})], None
+            else:
+                frames = [encode_frame(m) for m in self.encoder.encode(text)]
+                if not frames:
+                    return
+                key = encode_frame(self.encoder.keyframe())
+            for sub in self._subs.values():
+                sub.push(frames, key)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass  # 喚醒用 socket 已滿代表迴圈本來就會醒來
+
+    def stop(self):
+        # 實際的關閉在 selector 迴圈結束時進行
+        self._running = False
+        self._wake()
+
+
+class FileOutputEngine(BaseOutputEngine):
+    """
+    將定稿字幕寫成 SRT / WebVTT / JSONL 檔
+    - display() 只判斷定稿並放入佇列，寫檔、flush、fsync 都在背景執行緒
+    - 轉錄引擎標記一段結束（TextEvent.final）或字幕清空時才寫出一則 cue，
+      同一段的更新（包含滑動視窗截掉開頭）只取代目前內容
+    - 時間碼優先使用轉錄引擎附帶的音訊時間，沒有時以啟動後經過的秒數估計
+    - 可依檔案大小或時間輪替，新檔會重新寫入檔頭
+    """
+
+    def __init__(self, config: dict):
+        self.format = config.get("file_format", "srt")
+        if self.format not in SUBTITLE_EXT:
+            raise ValueError(f"未知的字幕檔格式: {self.format}")
+        self.file_path = config.get("file_path", "transcripts/caption")
+        self.fsync_interval = float(config.get("fsync_interval", 5.0))
+        self.rotate_bytes = int(float(config.get("rotate_mb", 0)) * 1024 * 1024)
+        self.rotate_sec = float(config.get("rotate_minutes", 0)) * 60
+
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+        self._current = ""  # 尚未定稿的字幕
+        self._start = self._end = None
+        self._closed = False
+        self._queue: queue.Queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="subtitle-writer", daemon=True
+        )
+        self._writer.start()
+
+    def start(self):
+        self._stop_event.wait()
 
     def display(self, text: str):
-        # run in other thread to put text for main thread
-        self.queue.put(text)
+        with self._lock:
+            if self._closed:
+                return
+            now = time.monotonic() - self._t0
+            if not text:
+                self._commit()
+                return
+            start = getattr(text, "start", None)
+            end = getattr(text, "end", None)
+            if start is not None:
+                self._start = start
+            elif not self._current:
+                self._start = now
+            self._end = end if end is not None else now
+            self._current = str(text)
+            if getattr(text, "final", False):
+                self._commit()
+
+    def _commit(self):
+        # 呼叫端需持有 self._lock
+        text = self._current.strip()
+        if text:
+            self._queue.put((self._start, max(self._start, self._end), text))
+        self._current = ""
+        self._start = self._end = None
+
+    def _new_path(self) -> Path:
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        ext = SUBTITLE_EXT[self.format]
+        path = Path(f"{self.file_path}_{stamp}{ext}")
+        n = 1
+        while path.exists():
+            path = Path(f"{self.file_path}_{stamp}_{n:03d}{ext}")
+            n += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _should_rotate(self, fh, opened: float) -> bool:
+        if self.rotate_bytes and fh.tell() >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_sec) and time.monotonic() - opened >= self.rotate_sec
+
+    def _write_loop(self):
+        fh = None
+        opened = 0.0
+        index = 0
+        dirty = False
+        last_sync = time.monotonic()
+        done = False
+        try:
+            while not done:
+                try:
+                    item = self._queue.get(timeout=self.fsync_interval or None)
+                except queue.Empty:
+                    item = ()  # 逾時：只做 fsync
+                batch = []
+                while item is not None:
+                    if item:
+                        batch.append(item)
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                done = item is None
+
+                # 單次寫入失敗（磁碟滿、檔案被移走等）只丟棄這批字幕，下一批改寫新檔
+                try:
+                    if batch:
+                        if fh is not None and self._should_rotate(fh, opened):
+                            fh.close()
+                            fh = None
+                        if fh is None:
+                            path = self._new_path()
+                            fh = open(path, "w", encoding="utf-8")
+                            fh.write(file_header(self.format))
+                            opened, index = time.monotonic(), 0
+                            logger.info(f"字幕寫入 {path}")
+                        chunks = []
+                        for start, end, text in batch:
+                            index += 1
+                            chunks.append(
+                                format_entry(self.format, index, start, end, text)
+                            )
+                        fh.write("".join(chunks))
+                        fh.flush()
+                        dirty = True
+
+                    if (
+                        dirty
+                        and self.fsync_interval
+                        and time.monotonic() - last_sync >= self.fsync_interval
+                    ):
+                        os.fsync(fh.fileno())
+                        dirty = False
+                        last_sync = time.monotonic()
+                except OSError as e:
+                    logger.error(f"字幕檔寫入失敗，略過 {len(batch)} 則字幕: {e}")
+                    fh = self._close_quietly(fh)
+                    dirty = False
+        except Exception as e:
+            logger.error(f"字幕寫入執行緒中止: {e}")
+        finally:
+            # 寫入端已結束，之後的字幕不再放入佇列
+            with self._lock:
+                self._closed = True
+            fh = self._close_quietly(fh, sync=True)
+
+    @staticmethod
+    def _close_quietly(fh, sync: bool = False):
+        """關閉檔案並忽略錯誤，回傳 None 供呼叫端重設 fh"""
+        if fh is None:
+            return None
+        try:
+            fh.flush()
+            if sync:
+                os.fsync(fh.fileno())
+        except OSError as e:
+            logger.error(f"字幕檔寫入失敗: {e}")
+        try:
+            fh.close()
+        except OSError:
+            pass  # 緩衝內容已無法寫出，錯誤已於上方記錄
+        return None
 
     def stop(self):
-        if self.root:
-            self.root.quit()
+        with self._lock:
+            if not self._closed:
+                self._commit()  # 最後一段沒有後續字幕，停止時直接定稿
+                self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        self._stop_event.set()
 
 
-class SocketOutputEngine(BaseOutputEngine):
+class CallbackOutputEngine(BaseOutputEngine):
+    """把字幕交給呼叫端提供的函式（例如 web server 內嵌模式直接廣播）"""
+
+    def __init__(self, config: dict, callback=None):
+        self.callback = callback or config.get("callback")
+        if not callable(self.callback):
+            raise ValueError("callback 輸出引擎需要提供 callback 函式")
+        self._stop_event = threading.Event()
+
+    def start(self):
+        self._stop_event.wait()
+
+    def display(self, text: str):
+        self.callback(text)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class _SinkWorker(threading.Thread):
+    """單一 sink 的專屬執行緒與佇列，慢的 sink 不會拖累其他 sink"""
+
+    def __init__(self, name: str, engine: BaseOutputEngine, queue: StageQueue):
+        super().__init__(name=f"sink-{name}", daemon=True)
+        self.sink_name = name
+        self.engine = engine
+        self.queue = queue
+        self.latencies: deque[float] = deque(maxlen=512)
+        self.errors = 0
+
+    def run(self):
+        lag = _SINK_LAG.labels(sink=self.sink_name)
+        errors = _SINK_ERRORS.labels(sink=self.sink_name)
+        for enqueued, text in self.queue:
+            try:
+                self.engine.display(text)
+            except Exception as e:
+                self.errors += 1
+                errors.inc()
+                logger.error(f"[{self.sink_name}] 輸出失敗: {e}")
+                continue
+            latency = time.monotonic() - enqueued
+            self.latencies.append(latency)
+            lag.observe(latency)
+
+    def stats(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(len(lat) * p))] * 1000 if lat else 0.0
+
+        return {
+            **self.queue.stats(),
+            "errors": self.errors,
+            "p50_ms": round(pct(0.5), 2),
+            "p95_ms": round(pct(0.95), 2),
+        }
+
+
+class MultiOutputEngine(BaseOutputEngine):
+    """
+    同時驅動多個 sink（例如懸浮窗 + socket + 檔案）
+    - sinks 以逗號分隔，各 sink 共用 output_config 的其餘設定
+    - 每個 sink 有自己的執行緒、有界佇列與丟棄策略，並記錄送達延遲
+    """
+
     def __init__(self, config: dict):
-        self.address = ("localhost", 6001)
-        self.listener = None
-        self.conn = None
-        self.authkey = None
+        names = [n.strip() for n in config.get("sinks", "").split(",") if n.strip()]
+        if not names or "multi" in names:
+            raise ValueError(f"multi 輸出引擎的 sinks 設定不正確: {names}")
+        queue_size = int(config.get("sink_queue_size", 8))
+        policy = config.get("sink_policy", "drop_oldest")
+
+        self.workers: list[_SinkWorker] = []
+        for name in names:
+            engine = OutputEngineFactory.create({**config, "engine_type": name})
+            self.workers.append(
+                _SinkWorker(name, engine, StageQueue(queue_size, policy))
+            )
+        main_sinks = [w for w in self.workers if w.engine.requires_main_thread]
+        if len(main_sinks) > 1:
+            raise ValueError("只能有一個需要主執行緒的 sink（例如 window）")
+        self._main = main_sinks[0] if main_sinks else None
+        self._stop_event = threading.Event()
 
     def start(self):
-        self.listener = Listener(self.address, authkey=self.authkey)
-        self.conn = self.listener.accept()
-        while True:
-            time.sleep(1)
+        for w in self.workers:
+            w.start()
+            if w is not self._main:
+                threading.Thread(target=w.engine.start, daemon=True).start()
+        if self._main:
+            self._main.engine.start()
+        else:
+            self._stop_event.wait()
 
-    def display(self, text):
-        self.conn.send(text)
+    def display(self, text: str):
+        now = time.monotonic()
+        for w in self.workers:
+            w.queue.put((now, text))
+
+    def stats(self) -> dict:
+        return {w.sink_name: w.stats() for w in self.workers}
 
     def stop(self):
-        if self.conn:
-            self.conn.close()
-        if self.listener:
-            self.listener.close()
+        for w in self.workers:
+            w.queue.close()
+            w.engine.stop()
+        self._stop_event.set()
 
 
 class OutputEngineFactory:
@@ -126,5 +617,11 @@ class OutputEngineFactory:
             return WindowOutputEngine(config)
         elif engine_type == "socket":
             return SocketOutputEngine(config)
+        elif engine_type == "file":
+            return FileOutputEngine(config)
+        elif engine_type == "callback":
+            return CallbackOutputEngine(config)
+        elif engine_type == "multi":
+            return MultiOutputEngine(config)
         else:
             raise ValueError(f"未知的輸出引擎類型: {engine_type}")
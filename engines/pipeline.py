@@ -0,0 +1,468 @@
+# engines/pipeline.py
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+from utils import metrics
+from utils.events import AudioGap
+from utils.tracing import LatencyTracer, Trace, with_trace
+
+logger = logging.getLogger(__name__)
+
+
+class StageQueue:
+    """
+    階段之間的有界佇列
+    - block       : 滿了就等待下游
+    - drop_oldest : 丟掉最舊的一筆（字幕只需要最新結果）
+    - drop_newest : 丟掉新進的一筆
+    """
+
+    POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(self, maxsize: int = 8, policy: str = "drop_oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的佇列策略: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # ----- 統計 -----
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item) -> bool:
+        """放入一筆資料，回傳是否真的被放入"""
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+            self._items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def close(self):
+        """關閉後不再接受資料，讀端取完剩餘資料即結束"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                item = self._items.popleft()
+                self._cond.notify_all()
+            yield item
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def depth(self) -> int:
+        """不上鎖的目前深度，供監控抓取"""
+        return len(self._items)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self),
+            "max_depth": self.max_depth,
+            "put": self.put_count,
+            "dropped": self.dropped,
+        }
+
+
+class PipelineStage(threading.Thread):
+    """
+    以單一執行緒執行 func(iterable) -> iterable，結果送往 output
+    output 可以是 StageQueue，或最後一段的 sink(item) 函式
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Iterable], Iterable] | None,
+        source: Iterable,
+        output: "StageQueue | Callable",
+    ):
+        super().__init__(name=f"stage-{name}", daemon=True)
+        self.stage_name = name
+        self.func = func
+        self.source = source
+        self.output = output
+
+        # ----- 佔用率統計：等待上游以外的時間都算忙碌 -----
+        self._started_at = None
+        self._wait_time = 0.0
+        self.items_out = 0
+        self.error: Exception | None = None
+
+    def _timed_source(self) -> Iterator:
+        it = iter(self.source)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._wait_time += time.perf_counter() - t0
+            yield item
+
+    def run(self):
+        self._started_at = time.perf_counter()
+        stream = self._timed_source()
+        if self.func is not None:
+            stream = self.func(stream)
+        emit = self.output.put if isinstance(self.output, StageQueue) else self.output
+        try:
+            for item in stream:
+                emit(item)
+                self.items_out += 1
+        except Exception as e:
+            self.error = e
+            logger.error(f"[{self.stage_name}] 階段發生錯誤: {e}")
+        finally:
+            if isinstance(self.output, StageQueue):
+                self.output.close()
+
+    def occupancy(self) -> float:
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        if elapsed <= 0:
+            return 0.0
+        return max(0.0, 1.0 - self._wait_time / elapsed)
+
+
+class SpeechPipeline:
+    """
+    錄音 → STT → 翻譯 → 輸出，各階段獨立執行緒並以 StageQueue 串接
+    錄音本身已在 RecorderWorker 執行緒，STT 直接消費其音訊佇列
+    session 為多條管線並行時的名稱，作為指標的 label
+    """
+
+    def __init__(
+        self,
+        input_engine,
+        stt_engine,
+        translator,
+        output_engine,
+        config: dict | None = None,
+        postprocessor=None,
+        session: str = "default",
+    ):
+        config = config or {}
+        self.session = session
+        self.input_engine = input_engine
+        self.stt_engine = stt_engine
+        self.postprocessor = postprocessor
+        self.translator = translator
+        self.output_engine = output_engine
+
+        self.queue_size = int(config.get("queue_size", 8))
+        self.queue_policy = config.get("queue_policy", "drop_oldest")
+        if not getattr(input_engine, "realtime", True):
+            # 離線輸入不需要追上即時，改為等待下游而不丟棄結果
+            self.queue_policy = "block"
+        self.stats_interval = float(config.get("stats_interval", 0))
+        # 每則字幕只多一個小物件與數次 time.monotonic()，預設開啟
+        self.tracer = LatencyTracer() if config.get("trace", True) else None
+        self._last_audio = (0.0, 0.0)  # (錄音時間, STT 取出時間)
+
+        self.queues: dict[str, StageQueue] = {}
+        self.stages: list[PipelineStage] = []
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        input_engine,
+        output_engine,
+        scheduler=None,
+        session: str = "default",
+        translator=None,
+    ) -> "SpeechPipeline":
+        """
+        依完整設定建立 STT / 翻譯 / 後處理引擎，輸入與輸出由呼叫端提供
+        scheduler 為多個 pipeline 共用模型時的 DecodeScheduler
+        translator 為多個 pipeline 共用的翻譯引擎（見 create_translator），未提供時依設定建立
+        """
+        from .factory import TranscribeEngineFactory
+        from .postprocess import TextPostProcessor
+
+        stt_engine = TranscribeEngineFactory.create(
+            config["transcribe_config"], scheduler
+        )
+
+        # === 翻譯器（可選） ===
+        if translator is None:
+            translator = cls.create_translator(config)
+
+        # === 後處理：glossary 取代與幻覺片語移除（可選） ===
+        post_cfg = config.get("postprocess_config", {})
+        if post_cfg.get("enabled", False):
+            lang = config["transcribe_config"].get("language")
+            postprocessor = TextPostProcessor(
+                post_cfg, None if lang == "auto" else lang
+            )
+        else:
+            postprocessor = None
+
+        return cls(
+            input_engine,
+            stt_engine,
+            translator,
+            output_engine,
+            config.get("pipeline_config", {}),
+            postprocessor,
+            session,
+        )
+
+    @staticmethod
+    def create_translator(config: dict):
+        """依 translate_config 建立翻譯引擎，未啟用時回傳 None"""
+        from .factory import TranslateEngineFactory
+
+        trans_cfg = config.get("translate_config", {})
+        if not trans_cfg.get("enabled", False):
+            return None
+        return TranslateEngineFactory.create(trans_cfg)
+
+    def _new_queue(self, name: str) -> StageQueue:
+        q = StageQueue(self.queue_size, self.queue_policy)
+        self.queues[name] = q
+        return q
+
+    def _transcribe(self, audio_stream):
+        if self.tracer:
+            audio_stream = self._mark_audio(audio_stream)
+        stream = self.stt_engine.transcribe_stream(audio_stream)
+        # 後處理成本極低，直接在 STT 執行緒內完成，不另開階段
+        if self.postprocessor:
+            stream = self.postprocessor.process_stream(stream)
+        if self.tracer:
+            stream = self._trace_stt(stream)
+        return stream
+
+    # ----------- 延遲追蹤 -----------
+    def _mark_audio(self, audio_stream):
+        """記住 STT 最近取出的音訊區塊的錄音時間"""
+        for block in audio_stream:
+            if not isinstance(block, AudioGap):
+                now = time.monotonic()
+                self._last_audio = (getattr(block, "captured", None) or now, now)
+            yield block
+
+    def _trace_stt(self, stream):
+        """每則字幕建立 Trace：起點為其所含最新音訊的錄音時間；空白事件原樣傳遞"""
+        for event in stream:
+            if not event:
+                yield event
+                continue
+            captured, pulled = self._last_audio
+            trace = Trace(captured)
+            trace.enter("stt", pulled)
+            trace.exit("stt")
+            yield with_trace(event, trace)
+
+    @staticmethod
+    def _traced(stage: str, func):
+        """包裝中間階段：取出時記錄進入、產出時記錄離開"""
+
+        def enter(source):
+            for event in source:
+                trace = getattr(event, "trace", None)
+                if trace is not None:
+                    trace.enter(stage)
+                yield event
+
+        def run(source):
+            for event in func(enter(source)):
+                trace = getattr(event, "trace", None)
+                if trace is not None:
+                    trace.exit(stage)
+                yield event
+
+        return run
+
+    def _display(self, event):
+        t0 = time.monotonic()
+        self.output_engine.display(event)
+        trace = getattr(event, "trace", None)
+        if trace is not None:
+            done = time.monotonic()
+            trace.enter("output", t0)
+            trace.exit("output", done)
+            self.tracer.record(trace, done)
+
+    def _build(self):
+        text_q = self._new_queue("stt")
+        self.stages.append(
+            PipelineStage(
+                "stt",
+                self._transcribe,
+                self.input_engine.stream_audio(),
+                text_q,
+            )
+        )
+        source = text_q
+
+        if self.translator:
+            trans_q = self._new_queue("translate")
+            translate = self.translator.translate_stream
+            if self.tracer:
+                translate = self._traced("translate", translate)
+            self.stages.append(PipelineStage("translate", translate, source, trans_q))
+            source = trans_q
+
+        sink = self._display if self.tracer else self.output_engine.display
+        self.stages.append(PipelineStage("output", None, source, sink))
+
+    def start(self):
+        self._build()
+        for stage in self.stages:
+            stage.start()
+        metrics.REGISTRY.register(self.collect_metrics)
+        if self.stats_interval > 0:
+            threading.Thread(target=self._report_loop, daemon=True).start()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        等待輸入結束且各階段都處理完畢，回傳是否已全部結束
+        麥克風等即時輸入不會自行結束，只有音訊檔等有限輸入會返回
+        """
+        for stage in self.stages:
+            stage.join(timeout)
+        return not any(stage.is_alive() for stage in self.stages)
+
+    def stats(self) -> dict:
+        stats = {
+            stage.stage_name: {
+                "occupancy": round(stage.occupancy(), 3),
+                "items": stage.items_out,
+                **(
+                    self.queues[stage.stage_name].stats()
+                    if stage.stage_name in self.queues
+                    else {}
+                ),
+            }
+            for stage in self.stages
+        }
+        # 多重輸出時附上各 sink 的佇列與送達延遲
+        if hasattr(self.output_engine, "stats"):
+            stats["sinks"] = self.output_engine.stats()
+        if self.tracer:
+            stats["latency"] = self.tracer.stats()
+        return stats
+
+    def _report_loop(self):
+        while not self._stop_event.wait(self.stats_interval):
+            logger.info(f"pipeline 狀態: {self.stats()}")
+
+    def collect_metrics(self):
+        """/metrics 抓取時呼叫：只讀取既有的計數與直方圖，不拿任何佇列的鎖"""
+        label = {"session": self.session}
+        stages = [({**label, "stage": s.stage_name}, s) for s in self.stages]
+        queues = [
+            (lb, self.queues[s.stage_name])
+            for lb, s in stages
+            if s.stage_name in self.queues
+        ]
+        yield (
+            "stt_stage_occupancy",
+            "gauge",
+            "各階段執行緒的忙碌比例",
+            [(lb, s.occupancy()) for lb, s in stages],
+        )
+        yield (
+            "stt_stage_queue_depth",
+            "gauge",
+            "各階段輸出佇列目前的深度",
+            [(lb, q.depth) for lb, q in queues],
+        )
+        yield (
+            "stt_stage_queue_dropped_total",
+            "counter",
+            "各階段輸出佇列丟棄的筆數",
+            [(lb, q.dropped) for lb, q in queues],
+        )
+
+        get_queue = getattr(self.input_engine, "capture_queue", None)
+        capture = get_queue() if get_queue else None
+        if capture is not None:
+            for name, kind, help, value in (
+                ("queue_depth", "gauge", "錄音佇列目前的幀數", capture.depth),
+                (
+                    "dropped_frames_total",
+                    "counter",
+                    "錄音佇列丟棄的幀數",
+                    capture.dropped_frames,
+                ),
+                (
+                    "dropped_seconds_total",
+                    "counter",
+                    "錄音佇列丟棄的秒數",
+                    capture.dropped_sec,
+                ),
+                ("gaps_total", "counter", "送往 STT 的音訊缺口數", capture.gaps),
+                ("spill_seconds", "gauge", "暫存在磁碟的音訊秒數", capture.spill_sec),
+            ):
+                yield f"stt_capture_{name}", kind, help, [(label, value)]
+
+        if self.tracer:
+            stage_hists, wait_hists, e2e = [], [], []
+            for key, hist in list(self.tracer.histograms.items()):
+                if key == "e2e":
+                    e2e.append((label, hist))
+                elif key.startswith("wait:"):
+                    wait_hists.append(({**label, "stage": key[5:]}, hist))
+                else:
+                    stage_hists.append(({**label, "stage": key}, hist))
+            yield (
+                "stt_stage_seconds",
+                "histogram",
+                "每則字幕在各階段的處理時間（translate 即翻譯延遲）",
+                stage_hists,
+            )
+            yield (
+                "stt_stage_wait_seconds",
+                "histogram",
+                "每則字幕進入各階段前的排隊時間（stt 為錄音佇列）",
+                wait_hists,
+            )
+            yield (
+                "stt_caption_latency_seconds",
+                "histogram",
+                "字幕從錄音到顯示完成的端到端延遲",
+                e2e,
+            )
+
+    def stop(self):
+        metrics.REGISTRY.unregister(self.collect_metrics)
+        self._stop_event.set()
+        for q in self.queues.values():
+            q.close()
@@ -0,0 +1,148 @@
+# engines/postprocess.py
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Iterator
+
+from config.path import POSTPROCESS_RULES_PATH, PROJECT_ROOT
+from utils.aho_corasick import AhoCorasick
+from utils.events import derive
+
+logger = logging.getLogger(__name__)
+
+_ONLY_PUNCT = re.compile(r"^[\W_]*$")
+
+
+def load_rules(path: str | Path, language: str | None) -> tuple[dict, list]:
+    """
+    讀取規則檔，回傳 (glossary 取代表, 幻覺片語清單)
+    規則檔以語言分區，"*" 對所有語言生效；language 為 None（auto）時合併全部語言
+    """
+    rules = json.loads(Path(path).read_text(encoding="utf-8"))
+    sections = rules.keys() if language is None else ("*", language)
+    replace: dict[str, str] = {}
+    strip: list[str] = []
+    for sec in sections:
+        part = rules.get(sec, {})
+        replace.update(part.get("replace", {}))
+        strip.extend(p for p in part.get("strip", []) if p.strip())
+    return replace, strip
+
+
+class TextPostProcessor:
+    """
+    轉錄後、翻譯前的確定性修正（單一 Aho-Corasick 自動機，線性時間）
+    - glossary：專有名詞取代，例如產品名稱
+    - strip   ：整句 / 整段的幻覺片語移除，例如 "thanks for watching"；
+                只在片語就是整段字幕，或位於段尾且前面是標點時移除，句中的一般用法保留
+    規則檔變更時自動重新載入
+    """
+
+    def __init__(self, config: dict, language: str | None = None):
+        self.path = Path(config.get("rules_path") or POSTPROCESS_RULES_PATH)
+        if not self.path.is_absolute():
+            self.path = PROJECT_ROOT / self.path
+        self.language = language
+        self.reload_interval = float(config.get("reload_interval", 1.0))
+        self._mtime = None
+        self._missing = False  # 規則檔不存在的狀態只記錄一次
+        self._last_check = 0.0
+        self._automaton = AhoCorasick([])
+        self._replacements: list[str] = []
+        self._is_strip: list[bool] = []
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            if not self._missing:
+                self._missing = True
+                if self._mtime is None:
+                    logger.error(
+                        f"找不到後處理規則檔 {self.path}，glossary 取代與幻覺片語移除停用"
+                    )
+                else:
+                    logger.warning(f"找不到後處理規則檔 {self.path}，沿用現有規則")
+            return
+        self._missing = False
+        if mtime == self._mtime:
+            return
+        try:
+            replace, strip = load_rules(self.path, self.language)
+        except Exception as e:
+            logger.error(f"後處理規則檔 {self.path} 載入失敗，沿用現有規則: {e}")
+            self._mtime = mtime
+            return
+
+        patterns = [*replace, *strip]
+        self._automaton = AhoCorasick(patterns)
+        # 以自動機實際收錄的模式順序建立對照（空字串會被略過）
+        self._replacements = [replace.get(p, "") for p in self._automaton.patterns]
+        self._is_strip = [p not in replace for p in self._automaton.patterns]
+        self._mtime = mtime
+        logger.info(
+            f"後處理規則已載入：glossary {len(replace)} 筆、幻覺片語 {len(strip)} 筆"
+        )
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.reload_interval:
+            self._last_check = now
+            self._reload()
+
+    def _is_strip_match(self, text: str, start: int, end: int, idx: int) -> bool:
+        return self._is_strip[idx]
+
+    def _is_replace_match(self, text: str, start: int, end: int, idx: int) -> bool:
+        return not self._is_strip[idx]
+
+    def _tail_start(self, text: str) -> int:
+        """
+        段尾可移除的幻覺片語從哪裡開始（沒有時回傳 len(text)）
+        - 片語之後只能有標點或空白，連續重複的片語一併移除
+        - 最前面的片語須位於段首或標點之後，"I will see you next time" 之類保留
+        """
+        tail = []
+        cut = len(text)
+        for start, end, _ in reversed(self._automaton.find(text, self._is_strip_match)):
+            if not _ONLY_PUNCT.match(text[end:cut]):
+                break
+            tail.append(start)
+            cut = start
+        if not tail:
+            return len(text)
+        head = text[: tail[-1]].rstrip()
+        if not head or not head[-1].isalnum():
+            return tail[-1]
+        # 最前面的片語接在一般文字後，只移除其後接續的重複片語
+        return tail[-2] if len(tail) > 1 else len(text)
+
+    def process(self, text: str) -> str:
+        self._maybe_reload()
+        if not text or not len(self._automaton):
+            return text
+
+        cut = self._tail_start(text)
+        head = text[:cut]
+        parts = []
+        pos = 0
+        # glossary 只在保留的部分取代；句中的幻覺片語不影響較短的 glossary 命中
+        for start, end, idx in self._automaton.find(head, self._is_replace_match):
+            parts.append(head[pos:start])
+            parts.append(self._replacements[idx])
+            pos = end
+        if not parts and cut == len(text):
+            return text
+        parts.append(head[pos:])
+        out = "".join(parts).strip()
+        if cut < len(text):
+            out = out.rstrip(",，、;；:：")  # 片語前的逗號等不留在句尾
+        # 移除片語後只剩標點時視為空句
+        return "" if _ONLY_PUNCT.match(out) else derive(text, out)
+
+    def process_stream(self, text_stream: Iterator[str]) -> Iterator[str]:
+        for text in text_stream:
+            yield self.process(text)
@@ -1,7 +1,9 @@
 import logging
+import threading
 import time
 from abc import ABC, abstractmethod
 from collections import deque
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 
 import numpy as np
@@ -10,39 +12,256 @@ from faster_whisper import WhisperModel
 from faster_whisper.tokenizer import Tokenizer
 from funasr import AutoModel
 
+from config.path import POSTPROCESS_RULES_PATH
+from utils import metrics
+from utils.events import AudioGap, TextEvent
+
+from .postprocess import load_rules
 from .translate import OpenCCTranslateEngine
 
 # 將 faster_whisper 的詳盡 debug 訊息關掉，保持輸出乾淨
 logging.getLogger("faster_whisper").setLevel(logging.WARNING)
 
+# ----- 指標（子指標先取好，熱路徑只做一次分片寫入） -----
+_DECODE_RTF = metrics.histogram(
+    "stt_decode_rtf",
+    "每次解碼的耗時 / 音訊長度，大於 1 表示跟不上即時",
+    ("engine",),
+    bounds=metrics.RTF_BOUNDS,
+)
+_WHISPER_RTF = _DECODE_RTF.labels(engine="whisper")
+_FUNASR_RTF = _DECODE_RTF.labels(engine="funasr")
+_PUNC_SECONDS = metrics.histogram("stt_punctuation_seconds", "ct-punc 加標點的耗時")
+_DECODE_WAIT = metrics.histogram(
+    "stt_decode_wait_seconds", "共用模型時等待解碼名額的時間"
+)
+_MODEL_CACHE_LOOKUPS = metrics.counter(
+    "stt_model_cache_lookups_total", "模型快取的查詢次數", ("result",)
+)
+_LANGUAGE_CACHE = metrics.counter(
+    "stt_language_cache_lookups_total",
+    "language = auto 時解碼視窗沿用已鎖定語言 (hit) 或重新偵測 (miss) 的次數",
+    ("result",),
+)
+_LANGUAGE_HIT = _LANGUAGE_CACHE.labels(result="hit")
+_LANGUAGE_MISS = _LANGUAGE_CACHE.labels(result="miss")
+
+# ----- 同一程序內的模型快取：多個 session / 引擎實例共用同一份權重 -----
+_MODEL_CACHE: dict[tuple, object] = {}
+_MODEL_LOCK = threading.Lock()
+
+
+def shared_model(key: tuple, loader) -> tuple[object, bool]:
+    """回傳 (模型, 是否為本次新載入)；相同 key 只會呼叫 loader 一次"""
+    with _MODEL_LOCK:
+        if key in _MODEL_CACHE:
+            _MODEL_CACHE_LOOKUPS.labels(result="hit").inc()
+            return _MODEL_CACHE[key], False
+        _MODEL_CACHE_LOOKUPS.labels(result="miss").inc()
+        model = _MODEL_CACHE[key] = loader()
+        return model, True
+
+
+def punctuate(ct_model, text: str) -> str:
+    """以 ct-punc 加上標點，並記錄耗時"""
+    t0 = time.perf_counter()
+    text = ct_model.generate(input=text)[0]["text"]
+    _PUNC_SECONDS.observe(time.perf_counter() - t0)
+    return text
+
+
+class DecodeScheduler:
+    """
+    多個 session 共用模型時的解碼排程
+    - 同時解碼數上限為 max_concurrent，其餘依到達順序等待
+    - session 以 join() / leave() 登記，使用中的 session 不超過名額時不排隊，
+      單一 session 的解碼不受影響
+    - 記錄等待時間，供觀察是否需要增加名額或減少 session
+    """
+
+    def __init__(self, max_concurrent: int = 1):
+        self.max_concurrent = max(1, max_concurrent)
+        self._sem = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self.sessions = 0
+        self.waits: deque[float] = deque(maxlen=256)
+        self.decodes = 0
+
+    def join(self):
+        with self._lock:
+            self.sessions += 1
+
+    def leave(self):
+        with self._lock:
+            self.sessions = max(0, self.sessions - 1)
+
+    @property
+    def contended(self) -> bool:
+        """使用中的 session 多於名額，解碼需要排隊"""
+        return self.sessions > self.max_concurrent
+
+    @contextmanager
+    def slot(self):
+        if not self.contended:
+            self.decodes += 1
+            yield
+            return
+        t0 = time.monotonic()
+        with self._sem:
+            wait = time.monotonic() - t0
+            self.waits.append(wait)
+            _DECODE_WAIT.observe(wait)
+            self.decodes += 1
+            yield
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+        return {"decodes": self.decodes, "wait_p95_ms": round(p95 * 1000, 2)}
+
+
+class LanguageTracker:
+    """
+    language = auto 時的語言追蹤，避免每個視窗都重新偵測語言
+    - 未鎖定時以 language=None 解碼（偵測語言），同一語言連續 confirm 次
+      機率 ≥ min_prob 即鎖定，之後直接指定該語言解碼
+    - 鎖定後每 reprobe_sec 秒音訊，或片段 avg_logprob 的移動平均低於
+      low_logprob（可能換了語言）時，再偵測一次；偵測到其他語言同樣需連續確認
+    - last_detected 為本程序最近一次鎖定的語言，供暖機選擇音檔
+    """
+
+    last_detected: str | None = None
+
+    def __init__(
+        self,
+        min_prob: float = 0.8,
+        confirm: int = 2,
+        reprobe_sec: float = 30,
+        low_logprob: float = -1.0,
+    ):
+        self.min_prob = min_prob
+        self.confirm = max(1, confirm)
+        self.reprobe_sec = reprobe_sec
+        self.low_logprob = low_logprob
+        self.language: str | None = None
+        self._candidate: str | None = None
+        self._streak = 0
+        self._last_probe = 0.0
+        self._logprob: float | None = None
+        self._reprobe = False
+        self.probes = 0
+
+    def language_for(self, now: float) -> str | None:
+        """本次解碼要指定的語言；回傳 None 代表這次要偵測語言"""
+        if self.language is None or self._reprobe:
+            return None
+        if now - self._last_probe >= self.reprobe_sec:
+            return None
+        return self.language
+
+    def observe_probe(self, info, now: float):
+        """記錄一次偵測結果（model.transcribe 回傳的 info）"""
+        self.probes += 1
+        self._last_probe = now
+        lang, prob = info.language, info.language_probability
+        if prob < self.min_prob:
+            # 信心不足：已鎖定的語言維持不變，下一個視窗再試
+            self._streak = 0
+            return
+        self._streak = self._streak + 1 if lang == self._candidate else 1
+        self._candidate = lang
+        if self._streak < self.confirm:
+            return
+        self._reprobe = False
+        self._logprob = None
+        if lang != self.language:
+            logging.info(f"語言鎖定為 {lang}（機率 {prob:.2f}）")
+            self.language = LanguageTracker.last_detected = lang
+
+    def watch(self, segments):
+        """轉手 segments，同時追蹤解碼信心"""
+        for seg in segments:
+            lp = seg.avg_logprob
+            if self._logprob is not None:
+                lp = 0.7 * self._logprob + 0.3 * lp
+            self._logprob = lp
+            if self.language and self._logprob < self.low_logprob:
+                self._reprobe = True
+            yield seg
+
 
 class BaseTranscribeEngine(ABC):
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, scheduler: DecodeScheduler | None = None):
         self.sample_rate = config.get("sample_rate", 16000)
+        self.scheduler = scheduler
+        self._consumed_samples = 0  # 串流累計樣本數，用於字幕時間碼
 
     @abstractmethod
     def transcribe_stream(self, audio_stream):
         pass
 
+    def _audio(self, audio_stream):
+        """逐一取出音訊並前處理；AudioGap 原樣交出，子類別以 _gap() 處理"""
+        for item in audio_stream:
+            if isinstance(item, AudioGap):
+                yield item
+            else:
+                yield self.process_audio_chunk(item)
+
+    def _gap(self, gap: AudioGap):
+        """缺口：先解碼並送出缺口前尚未解碼的音訊，再重設上下文"""
+        logging.info(f"音訊缺口 {gap.duration:.2f} 秒，重設轉錄上下文")
+        yield from self.flush()
+        self.on_gap(gap)
+
+    def flush(self):
+        """解碼緩衝中尚未解碼的音訊並送出結果，子類別覆寫"""
+        yield from ()
+
+    def on_gap(self, gap: AudioGap):
+        """缺口前後的音訊不連續：時間碼跳過遺失的秒數，子類別另外清掉緩衝與上下文"""
+        self._consumed_samples += round(gap.duration * self.sample_rate)
+
+    def _slot(self):
+        """共用模型時取得解碼名額；單一串流時不排隊"""
+        return self.scheduler.slot() if self.scheduler else nullcontext()
+
     def process_audio_chunk(self, chunk: np.ndarray) -> np.ndarray:
         if chunk.ndim == 2:
-            chunk = np.mean(chunk, axis=1)
+            # 輸入引擎已 down-mix 成 (n, 1)，單聲道時只取 view，不再複製
+            chunk = chunk[:, 0] if chunk.shape[1] == 1 else np.mean(chunk, axis=1)
         return chunk
 
 
 class WhisperBaseTranscribeEngine(BaseTranscribeEngine):
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, scheduler: DecodeScheduler | None = None):
+        super().__init__(config, scheduler)
         # ----- 模型設定 -----
         self.model_size = config.get("model_size", "large-v3")
         self.compute_type = config.get("compute_type", "auto")
-        self.model = WhisperModel(
-            self.model_size, device="cuda", compute_type=self.compute_type
+        cpu_threads = int(config.get("cpu_threads", 0))
+        self.model, fresh = shared_model(
+            ("whisper", self.model_size, self.compute_type, cpu_threads),
+            lambda: WhisperModel(
+                self.model_size,
+                device="cuda",
+                compute_type=self.compute_type,
+                cpu_threads=cpu_threads,
+            ),
         )
 
         # ----- 音訊與語言設定 -----
         self.sample_rate = config.get("sample_rate", 16000)
         lang = config.get("language", None)
         self.language = None if lang == "auto" else lang
+        self.language_tracker = None
+        if self.language is None:
+            self.language_tracker = LanguageTracker(
+                float(config.get("lang_min_prob", 0.8)),
+                int(config.get("lang_confirm", 2)),
+                float(config.get("lang_reprobe_sec", 30)),
+                float(config.get("log_prob_threshold", -1.0)),
+            )
         self.task = config.get("task", "transcribe")
         self.init_prompt = config.get("init_prompt", "")
 
@@ -51,6 +270,8 @@ class WhisperBaseTranscribeEngine(BaseTranscribeEngine):
         self._buffer: deque[np.ndarray] = deque()
         self._total_samples = 0
         self._max_samples = int(self.max_buffer_sec * self.sample_rate)
+        self._undecoded = 0  # 上次解碼後新進的樣本數
+        self._min_flush = int(0.3 * self.sample_rate)  # 太短的尾段不值得解碼
 
         # ----- 解碼與抗幻覺設定 -----
         self.beam_size = config.get("beam_size", 5)
@@ -84,17 +305,19 @@ class WhisperBaseTranscribeEngine(BaseTranscribeEngine):
 
         # ----- 抑制特殊符號與空白 -----
         self.suppress = config.get("suppress", True)
+        self.suppress_phrase_tokens = config.get("suppress_phrase_tokens", False)
         self.init_suppress_tokens()
 
-        # ----- 暖機（提升第一次呼叫速度） -----
-        self.warm_up = config.get("warm_up", True)
+        # ----- 暖機（提升第一次呼叫速度，共用的模型只需暖機一次） -----
+        self.warm_up = config.get("warm_up", True) and fresh
         self.do_warm_up()
 
     def do_warm_up(self):
         if not self.warm_up:
             return
 
-        lang = self.language or "en"
+        # auto 時依本程序先前偵測到的語言選擇暖機音檔
+        lang = self.language or LanguageTracker.last_detected or "en"
         lang_map = {
             "ja": "ja.wav",
             "en": "en.wav",
@@ -117,7 +340,7 @@ class WhisperBaseTranscribeEngine(BaseTranscribeEngine):
             data = np.concatenate(self._buffer)
             segs,_=self.model.transcribe(
                 data,
-                language=self.language,
+                language=lang,
                 task=self.task,
             )
             for _ in segs:
@@ -139,307 +362,393 @@ class WhisperBaseTranscribeEngine(BaseTranscribeEngine):
             self.suppress_tokens = None
             return
 
+        # -1 為 Whisper 的非語音特殊 token
+        self.suppress_tokens = [-1]
+
+        # 片語層級的幻覺改由後處理（engines/postprocess.py）整句移除；
+        # 逐 token 禁用會連帶懲罰一般用字，僅在明確開啟時使用
+        if not self.suppress_phrase_tokens:
+            return
+
         tok = Tokenizer(
             self.model.hf_tokenizer, multilingual=True, task="transcribe", language="en"
         )
-
-        ban_phrases = [
-            # ====== 英文 ======
-            " thanks for watching",
-            " thank you for watching",
-            " thanks for listening",
-            " thank you for listening",
-            " thanks for tuning in",
-            " thanks for joining us",
-            " don't forget to like and subscribe",
-            " please like and subscribe",
-            " remember to like and subscribe",
-            " make sure to subscribe",
-            " hit the bell",
-            " leave a comment",
-            " see you next time",
-            " see you in the next video",
-            " bye bye",
-            " goodbye everyone",
-            " have a great day",
-            # ==== 中文 (繁/簡) ====
-            " 正體中文",
-            " 感謝觀看",
-            "感谢观看",
-            " 感謝收聽",
-            "感谢收听",
-            " 記得訂閱",
-            "记得订阅",
-            " 別忘了訂閱",
-            "别忘了订阅",
-            " 按讚",
-            "点赞",
-            " 留言",
-            " 下次再見",
-            "下一次见",
-            " 拜拜",
-            # ==== Japanese ====
-            " ご視聴ありがとうございました",
-            "ご視聴ありがとうございました",
-            " チャンネル登録よろしくお願いします",
-            " 高評価お願いします",
-            " コメントお願いします",
-            " また次の動画でお会いしましょう",
-            " バイバイ",
-            # ==== Korean ====
-            " 시청해 주셔서 감사합니다",
-            "구독과 좋아요 부탁드립니다",
-            " 댓글 남겨주세요",
-            " 다음 영상에서 만나요",
-            " 안녕히 계세요",
-            # ==== Spanish ====
-            " gracias por ver",
-            " gracias por ver este video",
-            " gracias por escuchar",
-            " no olvides suscribirte",
-            " recuerda suscribirte",
-            " deja un comentario",
-            " nos vemos en el próximo video",
-            " hasta la próxima",
-            " adiós",
-            # ==== French ====
-            " merci d'avoir regardé",
-            " merci pour votre attention",
-            " n'oubliez pas de vous abonner",
-            " pensez à vous abonner",
-            " laissez un commentaire",
-            " à la prochaine",
-            " au revoir",
-            # ==== German ====
-            " danke fürs zuschauen",
-            " danke fürs zuhören",
-            " vergiss nicht zu abonnieren",
-            " abonniere meinen kanal",
-            " lass einen kommentar",
-            " bis zum nächsten mal",
-            " tschüss",
-            # ==== Portuguese ====
-            " obrigado por assistir",
-            " obrigado por escutar",
-            " não esqueça de se inscrever",
-            " deixe um comentário",
-            " até a próxima",
-            " tchau",
-            # ==== Italian ====
-            " grazie per aver guardato",
-            " non dimenticare di iscriverti",
-            " iscriviti al canale",
-            " lascia un commento",
-            " ci vediamo nel prossimo video",
-            " ciao",
-            # ==== Russian ====
-            " спасибо за просмотр",
-            " не забудьте подписаться",
-            " ставьте лайк",
-            " оставьте комментарий",
-            " до следующего раза",
-            " пока",
-            # ==== Hindi ====
-            " देखने के लिए धन्यवाद",
-            " सुनने के लिए धन्यवाद",
-            " सब्सक्राइब करना न भूलें",
-            " लाइक और शेयर करें",
-            " कमेंट करें",
-            " मिलते हैं अगली बार",
-            " अलविदा",
-        ]
+        try:
+            _, ban_phrases = load_rules(POSTPROCESS_RULES_PATH, None)
+        except Exception as e:
+            logging.warning(f"讀取幻覺片語失敗，不禁用片語 token：{e}")
+            return
 
         ban_ids = set()
         for phrase in ban_phrases:
+            ban_ids.update(tok.encode(" " + phrase))
             ban_ids.update(tok.encode(phrase))
 
-        # -1 為 Whisper 的非語音特殊 token
         self.suppress_tokens = [-1, *sorted(ban_ids)]
 
     @abstractmethod
     def transcribe_stream(self, audio_stream):
         """子類別實作串流轉錄的主要邏輯"""
 
-    def process_audio_chunk(self, chunk: np.ndarray) -> np.ndarray:
-        """將雙聲道轉單聲道，或其他前處理"""
-        if chunk.ndim == 2:
-            chunk = np.mean(chunk, axis=1)
-        return chunk
+    def _decode(self, data: np.ndarray):
+        """以目前設定呼叫 model.transcribe，回傳 (segments 產生器, info)"""
+        language = self.language
+        tracker = self.language_tracker
+        if tracker:
+            now = self._consumed_samples / self.sample_rate
+            language = tracker.language_for(now)
+            (_LANGUAGE_HIT if language else _LANGUAGE_MISS).inc()
+        t0 = time.perf_counter()
+        segments, info = self.model.transcribe(
+            data,
+            language=language,
+            # 偵測語言的視窗允許逐段切換語言；已鎖定時不再逐段偵測
+            multilingual=language is None,
+            task=self.task,
+            initial_prompt=self.init_prompt or None,
+            beam_size=self.beam_size,
+            temperature=self.temperature,
+            compression_ratio_threshold=self.compression_ratio_threshold,
+            log_prob_threshold=self.log_prob_threshold,
+            hallucination_silence_threshold=self.hallucination_silence_threshold,
+            repetition_penalty=self.repetition_penalty,
+            no_repeat_ngram_size=self.no_repeat_ngram_size,
+            condition_on_previous_text=self.condition_on_previous_text,
+            prompt_reset_on_temperature=self.prompt_reset_on_temperature,
+            vad_filter=True,
+            vad_parameters={"threshold": self.vad_threshold},
+            no_speech_threshold=self.no_speech_threshold,
+            word_timestamps=self.word_timestamps,
+            suppress_tokens=self.suppress_tokens,
+            suppress_blank=self.suppress,
+        )
+        segments = self._timed(segments, time.perf_counter() - t0, len(data))
+        if tracker:
+            if language is None:
+                tracker.observe_probe(info, now)
+            segments = tracker.watch(segments)
+        return segments, info
+
+    def _timed(self, segments, spent: float, samples: int):
+        """
+        faster_whisper 的 segments 是邊取邊解碼，累計取出各段的時間，
+        全部取完後記錄這個視窗的解碼 RTF（spent 為 transcribe() 本身的耗時）
+        """
+        it = iter(segments)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                seg = next(it)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - t0
+            yield seg
+        if samples:
+            _WHISPER_RTF.observe(spent / (samples / self.sample_rate))
+
+    def _window_offset(self, data: np.ndarray) -> float:
+        """目前解碼視窗開頭在整段串流中的秒數"""
+        return (self._consumed_samples - len(data)) / self.sample_rate
+
+    @staticmethod
+    def _segment_span(seg, offset: float) -> tuple[float, float]:
+        """片段的絕對音訊時間；有字級時間碼時以字為準"""
+        words = getattr(seg, "words", None)
+        if words:
+            return offset + words[0].start, offset + words[-1].end
+        return offset + seg.start, offset + seg.end
+
+    def _append(self, chunk: np.ndarray):
+        self._buffer.append(chunk)
+        self._total_samples += len(chunk)
+        self._consumed_samples += len(chunk)
+        self._undecoded += len(chunk)
+
+    def flush(self):
+        if self._undecoded >= self._min_flush:
+            yield from self._decode_window(np.concatenate(self._buffer))
+
+    @abstractmethod
+    def _decode_window(self, data: np.ndarray):
+        """解碼一個視窗並逐一產出字幕"""
+
+    def on_gap(self, gap: AudioGap):
+        # 缺口前的音訊已由 flush() 解完，不把缺口前後接在同一個視窗解碼
+        super().on_gap(gap)
+        self.reset_buffer()
 
     def reset_buffer(self, full_silence=False):
         """清空緩衝區"""
         self._buffer.clear()
         self._total_samples = 0
+        self._undecoded = 0
         if full_silence:
             self.full_silence()
 
 
 class OverlapTranscribeEngine(WhisperBaseTranscribeEngine):
-    def __init__(self, config: dict):
-        super().__init__(config)
+    def __init__(self, config: dict, scheduler: DecodeScheduler | None = None):
+        super().__init__(config, scheduler)
         self.overlap_sec = config.get("overlap_sec", 1.0)
         self._overlap_samples = int(self.sample_rate * self.overlap_sec)
 
     def transcribe_stream(self, audio_stream):
-        for chunk in audio_stream:
-            chunk = self.process_audio_chunk(chunk)
-            self._buffer.append(chunk)
-            self._total_samples += len(chunk)
+        for chunk in self._audio(audio_stream):
+            if isinstance(chunk, AudioGap):
+                yield from self._gap(chunk)
+                continue
+            self._append(chunk)
 
             if self._total_samples >= self._max_samples:
-                data = np.concatenate(self._buffer)
-
-                segments, _ = self.model.transcribe(
-                    data,
-                    language=self.language,
-                    multilingual=self.language is None,
-                    task=self.task,
-                    initial_prompt=self.init_prompt or None,
-                    beam_size=self.beam_size,
-                    temperature=self.temperature,
-                    compression_ratio_threshold=self.compression_ratio_threshold,
-                    log_prob_threshold=self.log_prob_threshold,
-                    hallucination_silence_threshold=self.hallucination_silence_threshold,
-                    repetition_penalty=self.repetition_penalty,
-                    no_repeat_ngram_size=self.no_repeat_ngram_size,
-                    condition_on_previous_text=self.condition_on_previous_text,
-                    prompt_reset_on_temperature=self.prompt_reset_on_temperature,
-                    vad_filter=True,
-                    vad_parameters={"threshold": self.vad_threshold},
-                    no_speech_threshold=self.no_speech_threshold,
-                    suppress_tokens=self.suppress_tokens,
-                    suppress_blank=self.suppress,
-                )
-
-                yield "".join(seg.text for seg in segments)
-
-                # 保留尾段重疊以保持上下文連續
-                overlap_data = data[-self._overlap_samples :]
-                self._buffer = deque([overlap_data])
-                self._total_samples = len(overlap_data)
+                yield from self._decode_window(np.concatenate(self._buffer))
+
+        # 輸入結束（例如音訊檔讀完）：解完最後不足一個視窗的音訊
+        yield from self.flush()
+
+    def _decode_window(self, data: np.ndarray):
+        offset = self._window_offset(data)
+        with self._slot():
+            segments, _ = self._decode(data)
+            segments = list(segments)
+        text = "".join(seg.text for seg in segments)
+        # 每個視窗各自是一段字幕
+        if segments:
+            start = self._segment_span(segments[0], offset)[0]
+            end = self._segment_span(segments[-1], offset)[1]
+            yield TextEvent(text, start, end, final=True)
+        else:
+            yield TextEvent(text, final=True)
+
+        # 保留尾段重疊以保持上下文連續
+        overlap_data = data[-self._overlap_samples :]
+        self._buffer = deque([overlap_data])
+        self._total_samples = len(overlap_data)
+        self._undecoded = 0
 
 
 class SlidingWindowTranscribeEngine(WhisperBaseTranscribeEngine):
-    def __init__(self, config: dict):
-        super().__init__(config)
+    def __init__(self, config: dict, scheduler: DecodeScheduler | None = None):
+        super().__init__(config, scheduler)
         self.interval_sec = config.get("interval_sec", 3.0)
         self._interval_samples = int(self.sample_rate * self.interval_sec)
-        self.ct_model = AutoModel(
-            model="ct-punc", disable_update=True, hub="hf", disable_pbar=True
+        # 最近一次解碼的片段 (開頭秒數, 結尾秒數, 文字)，開頭滑出視窗時定稿
+        self._segments: list[tuple[float, float, str]] = []
+        self._final_end = 0.0  # 已定稿的音訊結尾秒數
+        self.ct_model, _ = shared_model(
+            ("ct-punc",),
+            lambda: AutoModel(
+                model="ct-punc", disable_update=True, hub="hf", disable_pbar=True
+            ),
         )
 
     def transcribe_stream(self, audio_stream):
-        new_samples = 0
-        for chunk in audio_stream:
-            chunk = self.process_audio_chunk(chunk)
-
-            self._buffer.append(chunk)
-            self._total_samples += len(chunk)
-            new_samples += len(chunk)
+        for chunk in self._audio(audio_stream):
+            if isinstance(chunk, AudioGap):
+                yield from self._gap(chunk)
+                continue
+            self._append(chunk)
 
             # 若 buffer 過長，丟棄最舊資料
+            trimmed = False
             while self._total_samples > self._max_samples:
                 left = self._buffer.popleft()
                 self._total_samples -= len(left)
+                trimmed = True
+            if trimmed:
+                window_start = (
+                    self._consumed_samples - self._total_samples
+                ) / self.sample_rate
+                yield from self._finalize(window_start)
 
             # 每收滿 interval_sec 就解碼一次
-            if new_samples >= self._interval_samples:
-                data = np.concatenate(self._buffer)
-                start_time = time.time()
-                segments, _ = self.model.transcribe(
-                    data,
-                    language=self.language,
-                    multilingual=self.language is None,
-                    task=self.task,
-                    initial_prompt=self.init_prompt or None,
-                    beam_size=self.beam_size,
-                    temperature=self.temperature,
-                    compression_ratio_threshold=self.compression_ratio_threshold,
-                    log_prob_threshold=self.log_prob_threshold,
-                    hallucination_silence_threshold=self.hallucination_silence_threshold,
-                    repetition_penalty=self.repetition_penalty,
-                    no_repeat_ngram_size=self.no_repeat_ngram_size,
-                    condition_on_previous_text=self.condition_on_previous_text,
-                    prompt_reset_on_temperature=self.prompt_reset_on_temperature,
-                    vad_filter=True,
-                    vad_parameters={"threshold": self.vad_threshold},
-                    no_speech_threshold=self.no_speech_threshold,
-                    suppress_tokens=self.suppress_tokens,
-                    suppress_blank=self.suppress,
-                )
-                transcribe_time = time.time() - start_time
-                target_interval = max(self.interval_sec, transcribe_time * 1.5)
-                self._interval_samples = int(target_interval * self.sample_rate)
-
-                new_samples = 0
-                # yield from map(lambda seg:seg.text.strip(), segments)
-                yield from self._sentence(segments)
-
-    def _sentence(self, segments):
+            if self._undecoded >= self._interval_samples:
+                yield from self._decode_window(np.concatenate(self._buffer))
+
+        # 輸入結束：解完最後一次解碼之後新進的音訊
+        yield from self.flush()
+
+    def _decode_window(self, data: np.ndarray):
+        offset = self._window_offset(data)
+        start_time = time.time()
+        with self._slot():
+            segments, _ = self._decode(data)
+            results = self._sentence(segments, offset)
+            if self.scheduler and self.scheduler.contended:
+                # 需要排隊時在名額內解碼完畢，避免等待下游時佔住名額
+                results = list(results)
+        transcribe_time = time.time() - start_time
+        target_interval = max(self.interval_sec, transcribe_time * 1.5)
+        self._interval_samples = int(target_interval * self.sample_rate)
+
+        self._undecoded = 0
+        # yield from map(lambda seg:seg.text.strip(), segments)
+        yield from results
+
+    def flush(self):
+        # 缺口或輸入結束：解完剩餘音訊後，視窗內的片段全部定稿
+        yield from super().flush()
+        yield from self._finalize(float("inf"))
+
+    def _finalize(self, before: float):
+        """開頭已滑出視窗（早於 before 秒）的片段收成一則定稿字幕"""
+        done = [s for s in self._segments if s[0] < before]
+        if not done:
+            return
+        self._segments = self._segments[len(done) :]
+        self._final_end = done[-1][1]
+        with self._slot():
+            text = punctuate(self.ct_model, "".join(s[2] for s in done))
+        yield TextEvent(text, done[0][0], done[-1][1], final=True)
+
+    def _sentence(self, segments, offset: float = 0.0):
         pre_time = time.time()
         sentences = []
+        spans = []
+        start = end = None
         for seg in segments:
             spent_time  = time.time()-pre_time
             pre_time = time.time()
             if spent_time == 0:
                 break
             if seg.text:# and (seg.avg_logprob >= -1.0 or (seg.end - seg.start) / len(seg.text) >= 0.07):
+                seg_start, seg_end = self._segment_span(seg, offset)
+                if seg_end <= self._final_end:
+                    continue  # 整段落在已定稿的音訊內，不重複輸出
                 sentences.append(seg.text)
-                yield self.ct_model.generate(input="".join(sentences))[0]["text"]
+                spans.append((seg_start, seg_end, seg.text))
+                end = seg_end
+                start = seg_start if start is None else start
+                text = punctuate(self.ct_model, "".join(sentences))
+                yield TextEvent(text, start, end)
+        self._segments = spans
         if sentences:
-            yield self.ct_model.generate(input="".join(sentences))[0]["text"]
+            text = punctuate(self.ct_model, "".join(sentences))
+            yield TextEvent(text, start, end)
         else:
             yield ""
 
 
 class FunASRTranscribeEngine(BaseTranscribeEngine):
-    def __init__(self, config: dict):
-        super().__init__(config)
+    def __init__(self, config: dict, scheduler: DecodeScheduler | None = None):
+        super().__init__(config, scheduler)
         self.chunk_size = config.get("chunk_size", [0, 12, 4])
         self.encoder_chunk_look_back = config.get("encoder_chunk_look_back", 4)
         self.decoder_chunk_look_back = config.get("decoder_chunk_look_back", 1)
-        self.model = AutoModel(
-            model="paraformer-zh-streaming",
-            hub="hf",
-            disable_pbar=True,
+        # 串流狀態在 self.cache，模型本身可由多個實例共用
+        self.model, _ = shared_model(
+            ("paraformer-zh-streaming",),
+            lambda: AutoModel(
+                model="paraformer-zh-streaming",
+                hub="hf",
+                disable_pbar=True,
+            ),
         )
-        self.ct_model = AutoModel(
-            model="ct-punc", hub="hf", disable_pbar=True
+        self.ct_model, _ = shared_model(
+            ("ct-punc",),
+            lambda: AutoModel(
+                model="ct-punc", hub="hf", disable_pbar=True
+            ),
         )
 
         self.chunk_samples = self.chunk_size[1] * 960
         self.buffer = np.zeros((0,), dtype=np.float32)
         self.cache = {}
+        self._sentences = deque(maxlen=10)
+        self._start = None  # 目前這句的開頭秒數
+        self._s2tw = OpenCCTranslateEngine({"model": "s2tw"})
+
+    def _caption(self, final: bool = False) -> TextEvent:
+        """以累積的句子加上標點，組成目前的字幕；final 表示這段到此結束"""
+        text = self._s2tw.translate("".join(self._sentences))
+        with self._slot():
+            text = punctuate(self.ct_model, text)
+        end = self._consumed_samples / self.sample_rate
+        return TextEvent(text, self._start, end, final=final)
+
+    def flush(self):
+        """以 is_final 送出剩餘緩衝，讓模型吐出仍在 lookahead 中的字，收完目前這句"""
+        if not len(self.buffer) and not self.cache:
+            if self._sentences:
+                yield self._caption(final=True)
+                self._sentences.clear()
+            return
+        # 緩衝已空時補一小段靜音，只為觸發 is_final，不計入時間碼
+        data = self.buffer if len(self.buffer) else np.zeros(960, dtype=np.float32)
+        chunk_start = self._consumed_samples / self.sample_rate
+        with self._slot():
+            res = self.model.generate(
+                input=data,
+                cache=self.cache,
+                is_final=True,
+                chunk_size=self.chunk_size,
+                encoder_chunk_look_back=self.encoder_chunk_look_back,
+                decoder_chunk_look_back=self.decoder_chunk_look_back,
+                disable_pbar=True,
+            )
+        self._consumed_samples += len(self.buffer)
+        self.buffer = np.zeros((0,), dtype=np.float32)
+        self.cache = {}
+        if res and res[0].get("text", "").strip():
+            if not self._sentences:
+                self._start = chunk_start
+            self._sentences.append(res[0]["text"])
+        if self._sentences:
+            yield self._caption(final=True)
+            self._sentences.clear()
+
+    def on_gap(self, gap: AudioGap):
+        # 缺口前的音訊已由 flush() 收尾；串流狀態與累積的句子都重設
+        super().on_gap(gap)
+        self.buffer = np.zeros((0,), dtype=np.float32)
+        self.cache = {}
+        self._sentences.clear()
 
     def transcribe_stream(self, audio_stream):
-
-        s2tw = OpenCCTranslateEngine({"model": "s2tw"})
-        sentences = deque(maxlen=10)
+        sentences = self._sentences
         count = 0
-        for audio_chunk in audio_stream:
-            chunk = self.process_audio_chunk(audio_chunk)
+        # self._consumed_samples：已送入模型的樣本數，用於字幕時間碼
+        for chunk in self._audio(audio_stream):
+            if isinstance(chunk, AudioGap):
+                yield from self._gap(chunk)
+                continue
             self.buffer = np.concatenate((self.buffer, chunk.flatten()))
 
             while len(self.buffer) >= self.chunk_samples:
                 speech_chunk = self.buffer[: self.chunk_samples]
                 self.buffer = self.buffer[self.chunk_samples :]
-
-                res = self.model.generate(
-                    input=speech_chunk,
-                    cache=self.cache,
-                    is_final=False,
-                    chunk_size=self.chunk_size,
-                    encoder_chunk_look_back=self.encoder_chunk_look_back,
-                    decoder_chunk_look_back=self.decoder_chunk_look_back,
-                    disable_pbar=True,
-                )
+                chunk_start = self._consumed_samples / self.sample_rate
+                self._consumed_samples += len(speech_chunk)
+
+                with self._slot():
+                    t0 = time.perf_counter()
+                    res = self.model.generate(
+                        input=speech_chunk,
+                        cache=self.cache,
+                        is_final=False,
+                        chunk_size=self.chunk_size,
+                        encoder_chunk_look_back=self.encoder_chunk_look_back,
+                        decoder_chunk_look_back=self.decoder_chunk_look_back,
+                        disable_pbar=True,
+                    )
+                    _FUNASR_RTF.observe(
+                        (time.perf_counter() - t0) * self.sample_rate / len(speech_chunk)
+                    )
 
                 if res and res[0].get("text", "").strip():
+                    if len(sentences) == sentences.maxlen:
+                        # 句子已滿：目前這段定稿，新的文字從下一段開始，不從開頭截掉
+                        yield self._caption(final=True)
+                        sentences.clear()
+                    if not sentences:
+                        self._start = chunk_start
                     sentences.append(res[0]["text"])
                     count = 0
                 else:
                     count += 1
-                if count > 3:
+                if count > 3 and sentences:
+                    # 連續靜音：目前這段定稿
+                    yield self._caption(final=True)
                     sentences.clear()
                 if sentences:
                     # remove duplicate character
@@ -448,38 +757,25 @@ class FunASRTranscribeEngine(BaseTranscribeEngine):
                             sentences.pop()
                         else:
                             sentences[-1] = sentences[-1][1:]
-                    res = self.ct_model.generate(
-                        input=s2tw.translate("".join(sentences))
-                    )[0]["text"]
+                    res = self._caption()
                 else:
                     res = ""
                 yield res
 
         # 收尾處理
-        if len(self.buffer) > 0:
-            res = self.model.generate(
-                input=self.buffer,
-                cache=self.cache,
-                is_final=True,
-                chunk_size=self.chunk_size,
-                encoder_chunk_look_back=self.encoder_chunk_look_back,
-                decoder_chunk_look_back=self.decoder_chunk_look_back,
-            )
-            if res and "text" in res[0] and res[0]["text"] and res[0]["text"].strip():
-                sentences.append(res[0]["text"])
-                yield self.ct_model.generate(input=s2tw.translate("".join(sentences)))[0]["text"]
+        yield from self.flush()
 
 
 class TranscribeEngineFactory:
     @staticmethod
-    def create(config: dict):
+    def create(config: dict, scheduler: DecodeScheduler | None = None):
         engine_type = config.get("engine_type", "overlap")
         # engine_type="funasr"
         if engine_type == "overlap":
-            return OverlapTranscribeEngine(config)
+            return OverlapTranscribeEngine(config, scheduler)
         elif engine_type == "sliding":
-            return SlidingWindowTranscribeEngine(config)
+            return SlidingWindowTranscribeEngine(config, scheduler)
         elif engine_type == "funasr":
-            return FunASRTranscribeEngine(config)
+            return FunASRTranscribeEngine(config, scheduler)
         else:
             raise ValueError(f"未知的引擎類型: {engine_type}")
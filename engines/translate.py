@@ -2,11 +2,13 @@ import logging
 import os
 import time
 from abc import ABC, abstractmethod
-from typing import Iterator
+from typing import Callable, Iterator
 
 import ollama
 import opencc
 
+from utils.events import derive
+
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
@@ -17,28 +19,44 @@ class BaseTranslateEngine(ABC):
         self.show_source = config.get("show_source", True)
 
         self.empty_timeout = float(config.get("empty_timeout", 5.0))
-        self._last_non_empty = time.time()
-        self._empty_emitted = False
 
     @abstractmethod
     def translate(self, text: str) -> str:
         pass
 
-    def translate_stream(self, text_stream: Iterator[str]) -> Iterator[str]:
-        for text in text_stream:
+    def _empty_gate(self) -> Callable[[str], str | None]:
+        """
+        空白句節流，每個 translate_stream 各自一份狀態，多個 pipeline 共用引擎時互不影響
+        回傳的函式：None 表示略過，"" 表示輸出空字幕，否則回傳原文
+        """
+        last_non_empty = time.time()
+        emitted = False
+
+        def gate(text: str) -> str | None:
+            nonlocal last_non_empty, emitted
             now = time.time()
             if not text.strip():
-                if (not self._empty_emitted) and (
-                    (now - self._last_non_empty) >= self.empty_timeout
-                ):
-                    yield ""
-                    self._empty_emitted = True
-                continue
-            self._last_non_empty = now
-            self._empty_emitted = False
+                if not emitted and now - last_non_empty >= self.empty_timeout:
+                    emitted = True
+                    return ""
+                return None
+            last_non_empty = now
+            emitted = False
+            return text
 
-            yield text + "\n" + self.translate(text) if self.show_source else self.translate(text)
+        return gate
 
+    def _compose(self, text: str, translated: str) -> str:
+        composed = text + "\n" + translated if self.show_source else translated
+        return derive(text, composed)  # 保留轉錄端的時間資訊
+
+    def translate_stream(self, text_stream: Iterator[str]) -> Iterator[str]:
+        gate = self._empty_gate()
+        for text in text_stream:
+            text = gate(text)
+            if text is None:
+                continue
+            yield self._compose(text, self.translate(text)) if text else ""
 
 
 class AITranslateEngine(BaseTranslateEngine):
@@ -71,13 +89,8 @@ class OllamaTranslateEngine(AITranslateEngine):
             raise RuntimeError(f"翻譯失敗: {e}")
 
 
-class NLLBTranslateEngine(AITranslateEngine):
-    _LANG_CODE_MAP = {
-        # 自行擴充 200 種 FLoRes 語言
-        "英文": "eng_Latn",
-        "日文": "jpn_Jpan",
-        "繁體中文": "zho_Hant",
-    }
+class Seq2SeqTranslateEngine(AITranslateEngine):
+    """NLLB / M2M 共用的生成流程，支援同一目標語言的 pad-batch"""
 
     def _to_code(self, lang_name: str) -> str:
         try:
@@ -85,6 +98,61 @@ class NLLBTranslateEngine(AITranslateEngine):
         except KeyError:
             raise ValueError(f"未定義語言代碼：{lang_name}")
 
+    @abstractmethod
+    def _bos_id(self, dest: str) -> int:
+        """目標語言名稱對應的 forced_bos_token_id"""
+
+    def _prepare_tokenizer(self):
+        """子類別可在編碼前調整 tokenizer 狀態"""
+
+    def translate(self, text: str) -> str:
+        if not text.strip():
+            return ""
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts: list[str], dest: str | None = None) -> list[str]:
+        """一次 generate 翻譯多句；dest 為目標語言名稱，預設使用設定值"""
+        results = [""] * len(texts)
+        # 空字串不送進模型，避免浪費 padding
+        idx = [i for i, t in enumerate(texts) if t.strip()]
+        if not idx:
+            return results
+
+        bos_id = self.bos_id if dest is None else self._bos_id(dest)
+        self._prepare_tokenizer()
+        inputs = self.tokenizer(
+            [texts[i] for i in idx],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=512,
+        ).to(self.device)
+
+        sampling = self.temperature > 0
+        gen_kwargs = {
+            "max_length": 512,
+            "forced_bos_token_id": bos_id,
+            "do_sample": sampling,
+            "temperature": self.temperature if sampling else None,
+        }
+        if not sampling:
+            gen_kwargs["num_beams"] = 4
+        ids = self.model.generate(**inputs, **gen_kwargs)
+
+        decoded = self.tokenizer.batch_decode(ids, skip_special_tokens=True)
+        for i, out in zip(idx, decoded):
+            results[i] = out.strip()
+        return results
+
+
+class NLLBTranslateEngine(Seq2SeqTranslateEngine):
+    _LANG_CODE_MAP = {
+        # 自行擴充 200 種 FLoRes 語言
+        "英文": "eng_Latn",
+        "日文": "jpn_Jpan",
+        "繁體中文": "zho_Hant",
+    }
+
     def __init__(self, config: dict):
         import torch
         from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
@@ -103,31 +171,13 @@ class NLLBTranslateEngine(AITranslateEngine):
             self.model_name, device_map="auto"
         ).to(self.device)
 
-        self.bos_id = self.tokenizer.convert_tokens_to_ids(self._to_code(self.dest))
+        self.bos_id = self._bos_id(self.dest)
 
-    def translate(self, text: str) -> str:
-        if not text.strip():
-            return ""
-
-        inputs = self.tokenizer(
-            text, return_tensors="pt", truncation=True, max_length=512
-        ).to(self.device)
-
-        sampling = self.temperature > 0
-        gen_kwargs = {
-            "max_length": 512,
-            "forced_bos_token_id": self.bos_id,
-            "do_sample": sampling,
-            "temperature": self.temperature if sampling else None,
-        }
-        if not sampling:
-            gen_kwargs["num_beams"] = 4
-        ids = self.model.generate(**inputs, **gen_kwargs)
-
-        return self.tokenizer.batch_decode(ids, skip_special_tokens=True)[0].strip()
+    def _bos_id(self, dest: str) -> int:
+        return self.tokenizer.convert_tokens_to_ids(self._to_code(dest))
 
 
-class M2MTranslateEngine(AITranslateEngine):
+class M2MTranslateEngine(Seq2SeqTranslateEngine):
     _LANG_CODE_MAP = {
         "英文": "en",
         "日文": "ja",
@@ -135,12 +185,6 @@ class M2MTranslateEngine(AITranslateEngine):
         "简体中文": "zh",
     }
 
-    def _to_code(self, lang_name: str) -> str:
-        try:
-            return self._LANG_CODE_MAP[lang_name]
-        except KeyError:
-            raise ValueError(f"未定義語言代碼：{lang_name}")
-
     def __init__(self, config):
         import torch
         from transformers import M2M100ForConditionalGeneration, M2M100Tokenizer
@@ -156,29 +200,13 @@ class M2MTranslateEngine(AITranslateEngine):
         self.model = M2M100ForConditionalGeneration.from_pretrained(self.model_name).to(
             self.device
         )
-        self.bos_id = self.tokenizer.get_lang_id(self.dest_code)
+        self.bos_id = self._bos_id(self.dest)
 
-    def translate(self, text: str) -> str:
-        if not text.strip():
-            return ""
-        self.tokenizer.src_lang = self.src_code
+    def _bos_id(self, dest: str) -> int:
+        return self.tokenizer.get_lang_id(self._to_code(dest))
 
-        inputs = self.tokenizer(
-            text, return_tensors="pt", truncation=True, max_length=512
-        ).to(self.device)
-
-        sampling = self.temperature > 0
-        gen_kwargs = {
-            "max_length": 512,
-            "forced_bos_token_id": self.bos_id,
-            "do_sample": sampling,
-            "temperature": self.temperature if sampling else None,
-        }
-        if not sampling:
-            gen_kwargs["num_beams"] = 4
-        generated = self.model.generate(**inputs, **gen_kwargs)
-
-        return self.tokenizer.decode(generated[0], skip_special_tokens=True).strip()
+    def _prepare_tokenizer(self):
+        self.tokenizer.src_lang = self.src_code
 
 
 class OpenCCTranslateEngine(BaseTranslateEngine):
@@ -198,6 +226,21 @@ class TranslateEngineFactory:
     @staticmethod
     def create(config: dict):
         engine_type = config.get("engine_type", "ollama")
+        # 設定備援鏈時，由 FallbackTranslateEngine 包住主引擎與備援引擎
+        if config.get("fallback_chain", "").strip():
+            from .translate_fallback import FallbackTranslateEngine
+
+            return FallbackTranslateEngine.from_config(config)
+        # 翻譯模型移到獨立子程序執行
+        if config.get("isolate_process", False):
+            from .translate_worker import ProcessTranslateEngine
+
+            return ProcessTranslateEngine(config)
+        # NLLB / M2M 可共用同一個批次翻譯服務
+        if engine_type in ("nllb", "m2m") and int(config.get("batch_size", 1)) > 1:
+            from .translate_server import BatchedTranslateEngine, BatchTranslateServer
+
+            return BatchedTranslateEngine(config, BatchTranslateServer.shared(config))
         if engine_type == "ollama":
             return OllamaTranslateEngine(config)
         elif engine_type == "nllb":
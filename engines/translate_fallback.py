@@ -0,0 +1,184 @@
+# engines/translate_fallback.py
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator
+
+from .translate import BaseTranslateEngine
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class FallbackTranslateEngine(BaseTranslateEngine):
+    """
+    依序排列的翻譯引擎鏈（例如 ollama → m2m → opencc）
+    - 主引擎超過其觀測到的 p90 仍未回應，才對備援引擎發出 hedged 請求
+    - latency_budget_sec 內最先成功回應者勝出，主引擎優先
+    - 主引擎晚到的結果，若字幕尚未被新句取代，會原地覆蓋備援結果
+    """
+
+    def __init__(self, config: dict, engines: list[BaseTranslateEngine], names=None):
+        super().__init__(config)
+        self.engines = engines
+        self.names = names or [type(e).__name__ for e in engines]
+        self.budget = float(config.get("latency_budget_sec", 2.0))
+        self.hedge_percentile = float(config.get("hedge_percentile", 0.9))
+
+        self._latencies = [deque(maxlen=200) for _ in engines]
+        # 每個引擎最多一個進行中的請求，避免慢引擎的請求堆積
+        self._inflight: list[Future | None] = [None] * len(engines)
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(engines), thread_name_prefix="translate-chain"
+        )
+
+    @classmethod
+    def from_config(cls, config: dict) -> "FallbackTranslateEngine":
+        """fallback_chain 格式："m2m, opencc:s2tw"，冒號後為該引擎的 model"""
+        from .translate import TranslateEngineFactory
+
+        base = {**config, "fallback_chain": ""}
+        engines = [TranslateEngineFactory.create(base)]
+        names = [config.get("engine_type", "ollama")]
+        for item in filter(None, map(str.strip, config["fallback_chain"].split(","))):
+            engine_type, _, model = item.partition(":")
+            # 只有主引擎使用子程序隔離，備援引擎在本程序執行
+            sub_cfg = {
+                **base,
+                "engine_type": engine_type.strip(),
+                "isolate_process": False,
+            }
+            sub_cfg.pop("model", None)
+            if model.strip():
+                sub_cfg["model"] = model.strip()
+            try:
+                engines.append(TranslateEngineFactory.create(sub_cfg))
+                names.append(engine_type.strip())
+            except Exception as e:
+                logger.error(f"備援翻譯引擎 {item} 建立失敗，略過: {e}")
+        logger.info(f"翻譯備援鏈: {' → '.join(names)}")
+        return cls(config, engines, names)
+
+    # ----- 延遲統計 -----
+    def _hedge_delay(self) -> float:
+        lat = sorted(self._latencies[0])
+        if len(lat) < 10:
+            # 樣本不足時以預算一半作為 hedge 時間點
+            return self.budget / 2
+        idx = min(len(lat) - 1, int(len(lat) * self.hedge_percentile))
+        return min(lat[idx], self.budget)
+
+    def _submit(self, idx: int, text: str) -> Future | None:
+        busy = self._inflight[idx]
+        if busy is not None and not busy.done():
+            return None
+        t0 = time.monotonic()
+        future = self._executor.submit(self.engines[idx].translate, text)
+
+        def _record(f, idx=idx, t0=t0):
+            if f.exception() is None:
+                self._latencies[idx].append(time.monotonic() - t0)
+            else:
+                logger.warning(f"[{self.names[idx]}] 翻譯失敗: {f.exception()}")
+
+        future.add_done_callback(_record)
+        self._inflight[idx] = future
+        return future
+
+    @staticmethod
+    def _ok(f: Future) -> bool:
+        return f.done() and not f.cancelled() and f.exception() is None
+
+    @staticmethod
+    def _settled(f: Future | None) -> bool:
+        return f is None or f.done()
+
+    def _race(self, text: str) -> tuple[str | None, Future | None]:
+        """回傳 (預算內的結果, 仍在執行的主引擎請求)"""
+        start = time.monotonic()
+        deadline = start + self.budget
+        futures: dict[int, Future] = {}
+
+        primary = self._submit(0, text)
+        if primary is not None:
+            futures[0] = primary
+            wait([primary], timeout=self._hedge_delay())
+            if self._ok(primary):
+                return primary.result(), None
+
+        # 主引擎逾時（或仍忙於前一句），發出 hedged 請求
+        for idx in range(1, len(self.engines)):
+            f = self._submit(idx, text)
+            if f is not None:
+                futures[idx] = f
+
+        while True:
+            for idx in sorted(futures):
+                if self._ok(futures[idx]):
+                    late = primary if idx != 0 and not self._settled(primary) else None
+                    return futures[idx].result(), late
+            pending = [f for f in futures.values() if not f.done()]
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        return None, None if self._settled(primary) else primary
+
+    def translate(self, text: str) -> str:
+        if not text.strip():
+            return ""
+        result, _ = self._race(text)
+        return result if result is not None else text
+
+    # ----- 串流：等待下一句時順便檢查主引擎晚到的結果 -----
+    @staticmethod
+    def _pump(text_stream: Iterator[str], inbox: queue.Queue):
+        try:
+            for text in text_stream:
+                inbox.put(text)
+        finally:
+            inbox.put(_END)
+
+    def translate_stream(self, text_stream: Iterator[str]) -> Iterator[str]:
+        inbox: queue.Queue = queue.Queue()
+        threading.Thread(
+            target=self._pump, args=(text_stream, inbox), daemon=True
+        ).start()
+
+        gate = self._empty_gate()
+        late: tuple[str, Future] | None = None
+        while True:
+            try:
+                text = inbox.get(timeout=0.05 if late else None)
+            except queue.Empty:
+                src, future = late
+                if future.done():
+                    late = None
+                    if self._ok(future):
+                        yield self._compose(src, future.result())
+                continue
+            if text is _END:
+                break
+
+            text = gate(text)
+            if text is None:
+                continue
+            # 新句到達，舊句的晚到結果已無意義
+            late = None
+            if not text:
+                yield ""
+                continue
+
+            result, future = self._race(text)
+            if result is None:
+                # 預算內無任何結果，先顯示原文
+                yield text
+            else:
+                yield self._compose(text, result)
+            if future is not None:
+                late = (text, future)
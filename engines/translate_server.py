@@ -0,0 +1,174 @@
+# engines/translate_server.py
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from utils import metrics
+
+from .translate import BaseTranslateEngine
+
+logger = logging.getLogger(__name__)
+
+_BATCH_LATENCY = metrics.histogram(
+    "stt_translate_batch_seconds", "批次翻譯服務從收到請求到完成的時間"
+)
+_BATCH_SIZE = metrics.histogram(
+    "stt_translate_batch_size",
+    "批次翻譯服務每次 generate 的句數",
+    bounds=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+@dataclass
+class _TranslateRequest:
+    text: str
+    dest: str
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class BatchTranslateServer:
+    """
+    收集多個 translate_stream 呼叫端的請求，依目標語言 pad-batch 後一次 generate
+    - 湊滿 max_batch_size 或等待超過 max_wait_ms 即送出
+    - 結果透過 Future 回傳給各呼叫端
+    """
+
+    _shared: dict[tuple, "BatchTranslateServer"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, engine, max_batch_size: int = 8, max_wait_ms: float = 20):
+        self.engine = engine
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.queue: queue.Queue[_TranslateRequest | None] = queue.Queue()
+
+        # ----- 統計 -----
+        self._latencies: deque[float] = deque(maxlen=1024)
+        self.batches = 0
+        self.sentences = 0
+
+        self._running = True
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def shared(cls, config: dict) -> "BatchTranslateServer":
+        """同一模型 / 來源語言在程序內只載入一次"""
+        from .translate import TranslateEngineFactory
+
+        key = (
+            config.get("engine_type"),
+            config.get("model"),
+            config.get("source_lang"),
+        )
+        with cls._shared_lock:
+            server = cls._shared.get(key)
+            if server is None:
+                engine = TranslateEngineFactory.create({**config, "batch_size": 1})
+                server = cls(
+                    engine,
+                    max_batch_size=config.get("batch_size", 8),
+                    max_wait_ms=config.get("batch_wait_ms", 20),
+                )
+                cls._shared[key] = server
+            return server
+
+    def submit(self, text: str, dest: str | None = None) -> Future:
+        req = _TranslateRequest(text, dest or self.engine.dest)
+        if not self._running:
+            req.future.set_exception(RuntimeError("翻譯服務已停止"))
+        else:
+            self.queue.put(req)
+        return req.future
+
+    def _collect(self) -> list[_TranslateRequest]:
+        first = self.queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if req is None:
+                self._running = False
+                break
+            batch.append(req)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                break
+
+            # 依目標語言分組，每組一次 generate
+            groups: dict[str, list[_TranslateRequest]] = defaultdict(list)
+            for req in batch:
+                groups[req.dest].append(req)
+
+            for dest, reqs in groups.items():
+                try:
+                    results = self.engine.translate_batch([r.text for r in reqs], dest)
+                except Exception as e:
+                    logger.error(f"批次翻譯失敗: {e}")
+                    for r in reqs:
+                        r.future.set_exception(RuntimeError(f"翻譯失敗: {e}"))
+                    continue
+
+                now = time.monotonic()
+                _BATCH_SIZE.observe(len(reqs))
+                for r, res in zip(reqs, results):
+                    self._latencies.append(now - r.enqueued)
+                    _BATCH_LATENCY.observe(now - r.enqueued)
+                    r.future.set_result(res)
+                self.batches += 1
+                self.sentences += len(reqs)
+
+        # 停止後把殘留請求全部結束，避免呼叫端永久等待
+        while True:
+            try:
+                req = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is not None:
+                req.future.set_exception(RuntimeError("翻譯服務已停止"))
+
+    def stats(self) -> dict:
+        lat = sorted(self._latencies)
+        p95 = lat[int(len(lat) * 0.95) - 1] if lat else 0.0
+        return {
+            "batches": self.batches,
+            "sentences": self.sentences,
+            "avg_batch_size": self.sentences / self.batches if self.batches else 0.0,
+            "p95_latency_ms": p95 * 1000,
+            "pending": self.queue.qsize(),
+        }
+
+    def close(self):
+        self._running = False
+        self.queue.put(None)
+        self._worker.join(timeout=3)
+
+
+class BatchedTranslateEngine(BaseTranslateEngine):
+    """把 translate() 轉交給共用的 BatchTranslateServer"""
+
+    def __init__(self, config: dict, server: BatchTranslateServer):
+        super().__init__(config)
+        self.server = server
+
+    def translate(self, text: str) -> str:
+        if not text.strip():
+            return ""
+        return self.server.submit(text, self.dest).result()
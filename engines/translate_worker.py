@@ -0,0 +1,141 @@
+# engines/translate_worker.py
+import logging
+import multiprocessing as mp
+import struct
+import threading
+
+from utils.common import set_cpu_affinity
+
+from .translate import BaseTranslateEngine
+
+logger = logging.getLogger(__name__)
+
+# 封包格式：request id (uint32) + 狀態 (uint8) + UTF-8 文字
+_HEADER = struct.Struct("!IB")
+_OK, _ERROR, _READY = 0, 1, 2
+
+
+def _worker_main(config: dict, conn, cpus: str, threads: int):
+    """子程序：設定 CPU affinity / torch 執行緒數後載入翻譯引擎並處理請求"""
+    logging.basicConfig(level=logging.INFO)
+    set_cpu_affinity(cpus)
+    if threads > 0:
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    from .translate import TranslateEngineFactory
+
+    engine = TranslateEngineFactory.create({**config, "isolate_process": False})
+    conn.send_bytes(_HEADER.pack(0, _READY))
+
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            break
+        req_id, _ = _HEADER.unpack_from(data)
+        text = data[_HEADER.size :].decode("utf-8")
+        try:
+            status, out = _OK, engine.translate(text)
+        except Exception as e:
+            status, out = _ERROR, str(e)
+        conn.send_bytes(_HEADER.pack(req_id, status) + out.encode("utf-8"))
+
+
+class ProcessTranslateEngine(BaseTranslateEngine):
+    """
+    在獨立子程序執行翻譯模型，避免與 Whisper 解碼搶 GIL / CPU 執行緒
+    - worker_cpus / worker_threads 控制子程序的 CPU affinity 與 torch 執行緒數
+    - 子程序異常結束時自動重啟並重送當前請求一次
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.config = config
+        self.cpus = config.get("worker_cpus", "")
+        self.threads = int(config.get("worker_threads", 0))
+        self.timeout = float(config.get("worker_timeout", 30))
+        self.startup_timeout = float(config.get("worker_startup_timeout", 300))
+
+        self._ctx = mp.get_context("spawn")  # CUDA 需使用 spawn
+        self._lock = threading.Lock()
+        self._req_id = 0
+        self.proc = None
+        self.conn = None
+        self.restarts = 0
+        self._start_worker()
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        self.proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self.config, child_conn, self.cpus, self.threads),
+            daemon=True,
+        )
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        if not self.conn.poll(self.startup_timeout):
+            self._kill_worker()
+            raise RuntimeError("翻譯子程序啟動逾時")
+        try:
+            self.conn.recv_bytes()
+        except EOFError:
+            self._kill_worker()
+            raise RuntimeError("翻譯子程序啟動失敗")
+        logger.info(f"翻譯子程序已啟動 (pid={self.proc.pid})")
+
+    def _kill_worker(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+        if self.proc and self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(timeout=3)
+
+    def _restart(self, reason: str):
+        logger.warning(f"翻譯子程序異常（{reason}），重新啟動中…")
+        self._kill_worker()
+        self.restarts += 1
+        self._start_worker()
+
+    def _request(self, text: str) -> str:
+        self._req_id = (self._req_id + 1) & 0xFFFFFFFF
+        req_id = self._req_id
+        self.conn.send_bytes(_HEADER.pack(req_id, _OK) + text.encode("utf-8"))
+        while True:
+            if not self.conn.poll(self.timeout):
+                raise TimeoutError(f"翻譯逾時 {self.timeout}s")
+            data = self.conn.recv_bytes()
+            resp_id, status = _HEADER.unpack_from(data)
+            # 逾時後才送達的舊回應直接丟棄
+            if resp_id != req_id:
+                continue
+            out = data[_HEADER.size :].decode("utf-8")
+            if status == _ERROR:
+                raise RuntimeError(f"翻譯失敗: {out}")
+            return out
+
+    def translate(self, text: str) -> str:
+        if not text.strip():
+            return ""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    return self._request(text)
+                except RuntimeError:
+                    raise
+                except (EOFError, OSError, TimeoutError) as e:
+                    reason = str(e) or type(e).__name__
+                    if attempt:
+                        raise RuntimeError(f"翻譯失敗: {reason}")
+                    self._restart(reason)
+
+    def close(self):
+        with self._lock:
+            self._kill_worker()
@@ -1,11 +1,18 @@
 import logging
+import queue
 import threading
 import time
 
+import numpy as np
 import soundcard as sc
 
-from adapters.recorder_adapter import ListenerRecorderAdapter
-from utils.simple import SimpleThreadDeque
+from adapters.recorder_adapter import ShmRecorderAdapter
+from utils.audio_format import AudioFrameDecoder
+from utils.capture_queue import CaptureQueue
+from utils.events import AudioGap
+from utils.ingest_server import DEFAULT_SESSION, SocketIngestServer
+from utils.resample import StreamConverter
+from utils.tracing import stamp
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -13,13 +20,19 @@ logging.basicConfig(level=logging.INFO)
 
 class RecorderWorker(threading.Thread):
     def __init__(
-        self, recorder, block_size, audio_queue: SimpleThreadDeque, stop_event
+        self,
+        recorder,
+        block_size,
+        audio_queue: CaptureQueue,
+        stop_event,
+        converter: StreamConverter,
     ):
         super().__init__(daemon=True)
         self.recorder = recorder
         self.block_size = block_size
         self.audio_queue = audio_queue
         self.stop_event = stop_event
+        self.converter = converter
 
     def run(self):
         try:
@@ -27,10 +40,10 @@ class RecorderWorker(threading.Thread):
                 while not self.stop_event.is_set():
                     try:
                         data = rec.record(self.block_size)  # float32
-                        # --- 遇到雙聲道時 down-mix ---
-                        if data.ndim == 2:
-                            data = data.mean(axis=1, keepdims=True)
-                        self.audio_queue.append(data)
+                        captured = time.monotonic()  # 區塊最後一個樣本的時間
+                        # --- 唯一一次 down-mix + 重取樣，輸出 (n, 1) 單聲道 ---
+                        block = self.converter(data)
+                        self.audio_queue.append(stamp(block, captured))
                     except Exception as e:
                         logger.error(f"錄音過程中發生錯誤: {e}")
         except Exception as e:
@@ -38,15 +51,31 @@ class RecorderWorker(threading.Thread):
 
 
 class AudioInputStream:
-    def __init__(self, recorder, sample_rate: int, chunk_sec=0.03, max_latency=1.5):
+    def __init__(
+        self,
+        recorder,
+        sample_rate: int,
+        chunk_sec=0.03,
+        max_latency=1.5,
+        capture_rate: int | None = None,
+        policy: str = "drop_oldest",
+        spill_max_sec: float = 600,
+    ):
         # chunk_sec = 每幀 n ms, # max_latency = 允許隊列最多積 n s 的音
+        # capture_rate = 錄音裝置實際取樣率，與 sample_rate 不同時在此重取樣
+        # policy = 隊列滿時的處理方式（見 CaptureQueue）
+        capture_rate = capture_rate or sample_rate
         maxlen = int(max_latency / chunk_sec)
-        self.audio_queue = SimpleThreadDeque(maxlen=maxlen)
+        self.audio_queue = CaptureQueue(maxlen, sample_rate, policy, spill_max_sec)
         self.stop_event = threading.Event()
-        self.block_size = int(sample_rate * chunk_sec)
+        self.block_size = int(capture_rate * chunk_sec)
         self.recorder = recorder
         self.worker = RecorderWorker(
-            recorder, self.block_size, self.audio_queue, self.stop_event
+            recorder,
+            self.block_size,
+            self.audio_queue,
+            self.stop_event,
+            StreamConverter(capture_rate, sample_rate),
         )
 
     def start(self):
@@ -55,14 +84,15 @@ class AudioInputStream:
     def stream(self):
         while not self.stop_event.is_set() or self.audio_queue:
             if self.audio_queue:
-                yield self.audio_queue.popleft()  # float32 ndarray
+                yield self.audio_queue.popleft()  # float32 ndarray 或 AudioGap
             else:
                 time.sleep(0.005)
 
     def stop(self):
         self.stop_event.set()
+        self.audio_queue.close()
         self.worker.join(timeout=3)
-        logger.info("AudioInputStream 已停止並釋放資源")
+        logger.info(f"AudioInputStream 已停止並釋放資源: {self.audio_queue.stats()}")
 
 
 class BaseInputEngine:
@@ -70,12 +100,28 @@ class BaseInputEngine:
         self.sample_rate = sample_rate
         self.streamer: AudioInputStream = None
 
+    @staticmethod
+    def _queue_options(config: dict) -> dict:
+        """錄音佇列溢出時的策略（input_config 的 capture_policy / spill_max_sec）"""
+        return {
+            "policy": config.get("capture_policy", "drop_oldest"),
+            "spill_max_sec": float(config.get("spill_max_sec", 600)),
+        }
+
     def start(self):
         raise NotImplementedError
 
     def stream_audio(self):
         yield from self.streamer.stream()
 
+    def capture_queue(self) -> CaptureQueue | None:
+        """錄音佇列（供監控讀取深度與丟棄數），沒有錄音佇列的引擎回傳 None"""
+        if self.streamer is not None:
+            return self.streamer.audio_queue
+        # 音訊檔輸入的 audio_queue 只是一般的 queue.Queue，沒有監控資訊
+        audio_queue = getattr(self, "audio_queue", None)
+        return audio_queue if isinstance(audio_queue, CaptureQueue) else None
+
     def stop(self):
         if self.streamer:
             self.streamer.stop()
@@ -84,6 +130,9 @@ class BaseInputEngine:
 class MicrophoneInputEngine(BaseInputEngine):
     def __init__(self, config: dict):
         super().__init__(config.get("sample_rate", 16000))
+        # 以裝置原生取樣率錄音，避免 OS 層的重取樣；0 表示直接要求 sample_rate
+        self.capture_rate = int(config.get("capture_rate", 48000)) or self.sample_rate
+        self.queue_options = self._queue_options(config)
         available = [d.name for d in sc.all_microphones(include_loopback=False)]
         name = config.get("device_name", sc.default_microphone().name)
         self.device_name = name if name in available else None
@@ -96,14 +145,22 @@ class MicrophoneInputEngine(BaseInputEngine):
             logger.warning(f"找不到指定麥克風 '{self.device_name}'，改為使用預設: {e}")
             mic = sc.default_microphone(include_loopback=False)
 
-        recorder = mic.recorder(samplerate=self.sample_rate, channels=1)
-        self.streamer = AudioInputStream(recorder, self.sample_rate)
+        # channels=None：使用裝置原生聲道數，由 StreamConverter 統一 down-mix
+        recorder = mic.recorder(samplerate=self.capture_rate, channels=None)
+        self.streamer = AudioInputStream(
+            recorder,
+            self.sample_rate,
+            capture_rate=self.capture_rate,
+            **self.queue_options,
+        )
         self.streamer.start()
 
 
 class SystemAudioInputEngine(BaseInputEngine):
     def __init__(self, config: dict):
         super().__init__(config.get("sample_rate", 16000))
+        self.capture_rate = int(config.get("capture_rate", 48000)) or self.sample_rate
+        self.queue_options = self._queue_options(config)
         available = [m.name for m in sc.all_speakers()]
         name = config.get("device_name", sc.default_speaker().name)
         self.device_name = name if name in available else None
@@ -120,20 +177,411 @@ class SystemAudioInputEngine(BaseInputEngine):
                 sc.default_speaker().name, include_loopback=True
             )
 
-        recorder = sys_mic.recorder(samplerate=self.sample_rate, channels=2)
-        self.streamer = AudioInputStream(recorder, self.sample_rate)
+        recorder = sys_mic.recorder(samplerate=self.capture_rate, channels=None)
+        self.streamer = AudioInputStream(
+            recorder,
+            self.sample_rate,
+            capture_rate=self.capture_rate,
+            **self.queue_options,
+        )
         self.streamer.start()
 
 
 class SocketInputEngine(BaseInputEngine):
+    """
+    接收外部程序（例如 web server）送來的音訊
+    - transport = "socket"：SocketIngestServer 同時接受多個 producer，
+      每個 session 有自己的串流；本引擎的 stream_audio() 為 default session，
+      其餘 session 出現 / 回收時呼叫 on_session(session_id, stream) / on_session_end(session_id)
+    - transport = "shm"：同機共享記憶體環狀緩衝，只有單一串流
+    """
+
     def __init__(self, config: dict):
         super().__init__(config.get("sample_rate", 16000))
-        self.address = ("localhost", 6000)
+        self.config = config
+        self.address = (
+            config.get("host", "localhost"),
+            int(config.get("port", 6000)),
+        )
+        # socket: 經 TCP 逐幀傳送；shm: 同機共享記憶體環狀緩衝
+        self.transport = config.get("transport", "socket")
+        self.shm_name = config.get("shm_name", "stt_audio")
+        self.max_sessions = max(1, int(config.get("max_sessions", 4)))
+        self.idle_timeout = float(config.get("session_idle_timeout", 60))
+        self.sessions: dict[str, _SocketSession] = {}
+        self.server: SocketIngestServer | None = None
+        self.on_session = None
+        self.on_session_end = None
 
     def start(self):
-        recorder = ListenerRecorderAdapter(address=self.address)
-        self.streamer = AudioInputStream(recorder, self.sample_rate)
-        self.streamer.start()
+        if self.transport == "shm":
+            recorder = ShmRecorderAdapter(self.shm_name, sample_rate=self.sample_rate)
+            self.streamer = AudioInputStream(
+                recorder, self.sample_rate, **self._queue_options(self.config)
+            )
+            self.streamer.start()
+            return
+
+        self.sessions[DEFAULT_SESSION] = _SocketSession(self.config)
+        self.sessions[DEFAULT_SESSION].start()
+        self.server = SocketIngestServer(
+            self.address,
+            on_join=self._on_join,
+            on_frame=self._on_frame,
+            on_expire=self._on_expire,
+            idle_timeout=self.idle_timeout,
+        )
+        self.server.start()
+
+    # ----------- SocketIngestServer 回呼（selector 執行緒） -----------
+    def _on_join(self, session_id: str) -> bool:
+        if session_id in self.sessions:
+            return True
+        if len(self.sessions) >= self.max_sessions:
+            return False
+        stream = _SocketSession(self.config)
+        stream.start()
+        self.sessions[session_id] = stream
+        if self.on_session:
+            # 建立管線可能需要數秒，不佔用 selector 執行緒；其間的音訊留在 stream 佇列
+            threading.Thread(
+                target=self.on_session, args=(session_id, stream), daemon=True
+            ).start()
+        return True
+
+    def _on_frame(self, session_id: str, payload: bytes):
+        try:
+            self.sessions[session_id].push(payload)
+        except Exception as e:
+            logger.error(f"無法解析 {session_id} 的音訊幀: {e}")
+
+    def _on_expire(self, session_id: str):
+        stream = self.sessions.pop(session_id, None)
+        if stream:
+            stream.stop()
+        if self.on_session_end:
+            self.on_session_end(session_id)
+
+    def stream_audio(self):
+        if self.transport == "shm":
+            yield from self.streamer.stream()
+        else:
+            yield from self.sessions[DEFAULT_SESSION].stream_audio()
+
+    def capture_queue(self) -> CaptureQueue | None:
+        default = self.sessions.get(DEFAULT_SESSION)
+        return default.capture_queue() if default else super().capture_queue()
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+        for stream in self.sessions.values():
+            stream.stop()
+        super().stop()
+
+
+class MemoryInputEngine(BaseInputEngine):
+    """
+    由程式直接推入音訊的輸入引擎（例如 web server 內嵌模式）
+    - push() 不阻塞，也不經過任何 IPC 或 pickle
+    - 最多保留 max_latency 秒的音訊，超過時依 capture_policy 處理（預設丟棄最舊的幀）
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config.get("sample_rate", 16000))
+        chunk_sec = float(config.get("chunk_sec", 0.02))
+        max_latency = float(config.get("max_latency", 1.5))
+        options = self._queue_options(config)
+        if options["policy"] == "block":
+            # push() 在事件迴圈 / selector 執行緒呼叫，不能等待
+            options["policy"] = "drop_oldest"
+        self.audio_queue = CaptureQueue(
+            int(max_latency / chunk_sec), self.sample_rate, **options
+        )
+        self.stop_event = threading.Event()
+        self.decoder = AudioFrameDecoder(self.sample_rate)
+
+    def start(self):
+        self.stop_event.clear()
+
+    def push(self, data):
+        """放入一幀音訊（utils.audio_format 的 bytes 或 float32 ndarray）"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = self.decoder.decode(data)
+        if data.ndim == 1:
+            data = data[:, np.newaxis]
+        self.audio_queue.append(stamp(data))
+
+    def stream_audio(self):
+        while not self.stop_event.is_set():
+            if self.audio_queue:
+                yield self.audio_queue.popleft()
+            else:
+                time.sleep(0.005)
+
+    def stop(self):
+        self.stop_event.set()
+        self.audio_queue.close()
+
+
+class _SocketSession(MemoryInputEngine):
+    """socket 輸入的一個 session；producer 暫停或斷線時補靜音，維持即時串流"""
+
+    idle_fill_sec = 0.1
+
+    def stream_audio(self):
+        silence = np.zeros(
+            (int(self.sample_rate * self.idle_fill_sec), 1), dtype=np.float32
+        )
+        last = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.audio_queue:
+                last = time.monotonic()
+                yield self.audio_queue.popleft()
+            elif time.monotonic() - last >= self.idle_fill_sec:
+                last = time.monotonic()
+                yield silence
+            else:
+                time.sleep(0.005)
+
+
+class _MixSource:
+    """混音引擎中的一個來源：自己的 RecorderWorker 與對齊用的線性緩衝"""
+
+    def __init__(self, tag: str, engine: BaseInputEngine, gain: float, capacity: int):
+        self.tag = tag
+        self.engine = engine
+        self.gain = gain
+        self.buf = np.zeros(capacity, dtype=np.float32)
+        self.fill = 0
+        self.dropped = 0  # 來源時脈較快、積壓過多而丟棄的樣本數
+        self.padded = 0  # 來源時脈較慢或延遲而補零的樣本數
+        self.gap = False  # 來源的錄音佇列曾經溢出，尚未通知下游
+
+    def drain(self):
+        """把 RecorderWorker 已錄好的區塊搬進緩衝，超出容量時丟最舊的"""
+        queue = self.engine.streamer.audio_queue
+        cap = len(self.buf)
+        while queue:
+            item = queue.popleft()
+            if isinstance(item, AudioGap):
+                self.gap = True  # 遺失的部分由混音時補零，另外通知下游音訊不連續
+                continue
+            chunk = item[:, 0]
+            if len(chunk) >= cap:
+                self.dropped += self.fill + len(chunk) - cap
+                self.buf[:] = chunk[-cap:]
+                self.fill = cap
+                continue
+            overflow = self.fill + len(chunk) - cap
+            if overflow > 0:
+                self._discard(overflow)
+                self.dropped += overflow
+            self.buf[self.fill : self.fill + len(chunk)] = chunk
+            self.fill += len(chunk)
+
+    def take(self, out: np.ndarray, keep: int):
+        """取出 len(out) 個樣本（不足補零），之後最多保留 keep 個樣本的積壓"""
+        n = min(self.fill, len(out))
+        out[:n] = self.buf[:n]
+        out[n:] = 0.0
+        self.padded += len(out) - n
+        self._discard(n)
+        if self.fill > keep:
+            self.dropped += self.fill - keep
+            self._discard(self.fill - keep)
+
+    def _discard(self, n: int):
+        self.buf[: self.fill - n] = self.buf[n : self.fill]
+        self.fill -= n
+
+
+class MixInputEngine(BaseInputEngine):
+    """
+    同時錄製多個裝置（例如麥克風 + 系統音效）並混成一條串流
+    - 每個來源有自己的 RecorderWorker，混音在獨立執行緒進行，不佔用 STT 執行緒
+    - 以牆上時鐘為基準每 chunk_sec 輸出一個區塊，各來源只依到達量對齊
+      （不使用各幀的錄音時間戳）：不足補零（時脈較慢 / 延遲），
+      積壓超過一個區塊就丟最舊的（時脈較快），因此時脈漂移不會累積，額外延遲最多一個區塊
+    - 依 mix_gains 加權混成 (n, 1)，放入 CaptureQueue（依 capture_policy 處理溢出）
+    - 來源的錄音佇列溢出時，遺失的部分已在時間軸上補零，
+      只送出 duration 為 0 的 AudioGap 通知下游重設上下文，不位移時間碼
+    """
+
+    chunk_sec = 0.03
+
+    def __init__(self, config: dict):
+        super().__init__(config.get("sample_rate", 16000))
+        self.block_size = int(self.sample_rate * self.chunk_sec)
+        self.audio_queue = CaptureQueue(
+            int(1.5 / self.chunk_sec), self.sample_rate, **self._queue_options(config)
+        )
+        self.stop_event = threading.Event()
+
+        # mix_sources 格式："microphone, system:喇叭名稱"，冒號後為該來源的裝置名稱
+        items = [
+            s.strip() for s in str(config.get("mix_sources", "")).split(",") if s.strip()
+        ]
+        gains = [
+            float(g) for g in str(config.get("mix_gains", "")).split(",") if g.strip()
+        ]
+        if not items:
+            raise ValueError("mix 輸入引擎至少需要一個來源 (mix_sources)")
+
+        self.sources: list[_MixSource] = []
+        for i, item in enumerate(items):
+            engine_type, _, device = item.partition(":")
+            engine_type = engine_type.strip()
+            sub_cfg = {**config, "engine_type": engine_type, "device_name": device.strip()}
+            if engine_type == "microphone":
+                engine = MicrophoneInputEngine(sub_cfg)
+            elif engine_type == "system":
+                engine = SystemAudioInputEngine(sub_cfg)
+            else:
+                raise ValueError(f"mix 不支援的來源類型: {engine_type}")
+            gain = gains[i] if i < len(gains) else 1.0
+            self.sources.append(
+                _MixSource(item, engine, gain, capacity=3 * self.block_size)
+            )
+        self.gains = np.array([s.gain for s in self.sources], dtype=np.float32)
+        self._thread = threading.Thread(target=self._mix_loop, daemon=True)
+
+    def start(self):
+        for source in self.sources:
+            source.engine.start()
+        self._thread.start()
+
+    def _mix_loop(self):
+        try:
+            self._mix()
+        except Exception as e:
+            logger.error(f"混音執行緒中止: {e}")
+        finally:
+            self.stop_event.set()  # 讓 stream_audio() 結束，不讓下游無聲地一直等待
+
+    def _mix(self):
+        frame = np.empty((len(self.sources), self.block_size), dtype=np.float32)
+        # 先等一個區塊吸收各來源的抖動
+        next_t = time.monotonic() + self.chunk_sec
+        while not self.stop_event.is_set():
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            elif delay < -10 * self.chunk_sec:
+                # 執行緒被延誤太久：重新對時，不補送過去的區塊
+                next_t = time.monotonic()
+            next_t += self.chunk_sec
+
+            gap = False
+            for i, source in enumerate(self.sources):
+                source.drain()
+                source.take(frame[i], keep=self.block_size)
+                gap, source.gap = gap or source.gap, False
+            if gap:
+                self.audio_queue.append(AudioGap(time.time()))
+            self.audio_queue.append(stamp((self.gains @ frame)[:, np.newaxis]))
+
+    def stream_audio(self):
+        while not self.stop_event.is_set() or self.audio_queue:
+            if self.audio_queue:
+                yield self.audio_queue.popleft()
+            else:
+                time.sleep(0.005)
+
+    def stats(self) -> dict:
+        return {
+            s.tag: {"dropped": s.dropped, "padded": s.padded} for s in self.sources
+        }
+
+    def stop(self):
+        self.stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=3)
+        self.audio_queue.close()
+        for source in self.sources:
+            source.engine.stop()
+        logger.info(
+            f"MixInputEngine 已停止，各來源對齊統計: {self.stats()}，"
+            f"混音佇列: {self.audio_queue.stats()}"
+        )
+
+
+class FileInputEngine(BaseInputEngine):
+    """
+    讀取錄音檔 (WAV / FLAC 等 soundfile 支援的格式) 做離線轉錄
+    - 逐區塊讀檔並重取樣，不會把整個檔案載入記憶體
+    - 讀檔在獨立執行緒預先讀取，佇列滿了就等待，不丟任何音訊
+    - file_speed = 0：依辨識引擎的消化速度送入（越快越好）；
+      > 0：模擬即時錄音，1.0 為原速、2.0 為兩倍速
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config.get("sample_rate", 16000))
+        self.path = config.get("input_file", "")
+        self.speed = float(config.get("file_speed", 0))
+        # 不模擬即時時，管線改用不丟資料的佇列策略
+        self.realtime = self.speed > 0
+        self.chunk_sec = 0.03 if self.realtime else 0.5
+        self.audio_queue: queue.Queue = queue.Queue(maxsize=16)
+        self.stop_event = threading.Event()
+        self.duration = 0.0
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+
+    def start(self):
+        import soundfile as sf
+
+        self._file = sf.SoundFile(self.path)
+        self.duration = self._file.frames / self._file.samplerate
+        logger.info(
+            f"讀取音訊檔: {self.path} ({self.duration:.1f} 秒, "
+            f"{self._file.samplerate} Hz, {self._file.channels} 聲道)"
+        )
+        self._thread.start()
+
+    def _read_loop(self):
+        converter = StreamConverter(self._file.samplerate, self.sample_rate)
+        block = int(self._file.samplerate * self.chunk_sec)
+        t0 = time.monotonic()
+        sent = 0.0  # 已送出的音訊秒數（模擬即時用）
+        try:
+            with self._file as f:
+                for data in f.blocks(block, dtype="float32", always_2d=True):
+                    if self.stop_event.is_set():
+                        break
+                    if self.realtime:
+                        delay = t0 + sent / self.speed - time.monotonic()
+                        if delay > 0 and self.stop_event.wait(delay):
+                            break
+                        sent += len(data) / f.samplerate
+                    self._put(stamp(converter(data)))
+        except Exception as e:
+            logger.error(f"讀取音訊檔失敗: {e}")
+        finally:
+            self._put(None)  # 檔案結束
+            logger.info(f"音訊檔讀取完畢，耗時 {time.monotonic() - t0:.1f} 秒")
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.audio_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def stream_audio(self):
+        while not self.stop_event.is_set():
+            try:
+                chunk = self.audio_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def stop(self):
+        self.stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=3)
 
 
 class VoiceInputEngineFactory:
@@ -146,5 +594,11 @@ class VoiceInputEngineFactory:
             return SystemAudioInputEngine(config)
         elif engine_type == "socket":
             return SocketInputEngine(config)
+        elif engine_type == "memory":
+            return MemoryInputEngine(config)
+        elif engine_type == "mix":
+            return MixInputEngine(config)
+        elif engine_type == "file":
+            return FileInputEngine(config)
         else:
             raise ValueError(f"未知的輸入引擎類型: {engine_type}")
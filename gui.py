@@ -220,15 +220,62 @@ class ConfigGUI(tk.Tk):
                     visible = engine_type not in ["gemini", "ollama", "opencc"]
                 elif key == "temperature":
                     visible = engine_type != "opencc"
+                elif key in ("batch_size", "batch_wait_ms"):
+                    visible = engine_type in ("nllb", "m2m")
             elif section == "input_config" and key == "device_name":
-                visible = engine_type != "socket"
+                visible = engine_type in ("microphone", "system")
+            elif section == "input_config" and key == "capture_rate":
+                visible = engine_type in ("microphone", "system", "mix")
+            elif section == "input_config" and key in ("input_file", "file_speed"):
+                visible = engine_type == "file"
+            elif section == "input_config" and key in (
+                "capture_policy",
+                "spill_max_sec",
+            ):
+                visible = engine_type != "file"
+            elif section == "input_config" and key in (
+                "mix_sources",
+                "mix_gains",
+            ):
+                visible = engine_type == "mix"
+            elif section == "input_config" and key in (
+                "transport",
+                "shm_name",
+                "host",
+                "port",
+                "max_sessions",
+                "session_idle_timeout",
+            ):
+                visible = engine_type == "socket"
             elif section == "output_config" and key in (
                 "transparent_bg",
                 "font_size",
                 "font_color",
                 "wrap_length",
+                "history_lines",
+            ):
+                visible = engine_type in ("window", "multi")
+            elif section == "output_config" and key in (
+                "file_format",
+                "file_path",
+                "fsync_interval",
+                "rotate_mb",
+                "rotate_minutes",
+            ):
+                visible = engine_type in ("file", "multi")
+            elif section == "output_config" and key in (
+                "host",
+                "port",
+                "caption_protocol",
+                "keyframe_interval",
+            ):
+                visible = engine_type in ("socket", "multi")
+            elif section == "output_config" and key in (
+                "sinks",
+                "sink_queue_size",
+                "sink_policy",
             ):
-                visible = engine_type != "socket"
+                visible = engine_type == "multi"
 
             row.grid() if visible else row.grid_remove()
 
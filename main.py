@@ -1,27 +1,15 @@
 import argparse
-import json
 import signal
 import sys
 import threading
-from pathlib import Path
 
-from config.path import DEFAULT_CFG_PATH, USER_CFG_PATH
-from engines.factory import (OutputEngineFactory, TranscribeEngineFactory,
-                             TranslateEngineFactory, VoiceInputEngineFactory)
-from utils.common import deep_update
-
-
-def load_config(path: str | Path | None) -> dict:
-    default_cfg = json.loads(DEFAULT_CFG_PATH.read_text(encoding="utf-8"))
-    user_cfg = {}
-    # 優先用 CLI 指定的檔；沒有就找 user_config.json
-    if path:
-        user_cfg_path = Path(path)
-    else:
-        user_cfg_path = Path(USER_CFG_PATH)
-    if user_cfg_path.is_file():
-        user_cfg = json.loads(user_cfg_path.read_text(encoding="utf-8"))
-    return deep_update(default_cfg, user_cfg)
+from engines.factory import OutputEngineFactory, VoiceInputEngineFactory
+from engines.output import CallbackOutputEngine
+from engines.pipeline import SpeechPipeline
+from engines.voice_input import SocketInputEngine
+from utils import metrics
+from utils.common import load_config, set_cpu_affinity
+from utils.events import derive
 
 
 if __name__ == "__main__":
@@ -36,14 +24,28 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     config = load_config(args.config)
+    # STT 所在的主程序可綁定到獨立的 CPU，翻譯子程序另由 worker_cpus 設定
+    set_cpu_affinity(config["transcribe_config"].get("cpu_affinity", ""))
 
-    # ---------- Ctrl-C 處理 ---------- #
-    def signal_handler(sig, frame):
-        print("\n🛑 偵測到 Ctrl+C，中止...\n")
+    input_engine = output_engine = pipeline = metrics_server = None
+    session_pipelines: dict[str, SpeechPipeline] = {}
+
+    def shutdown():
+        if pipeline:
+            pipeline.stop()
+        for p in list(session_pipelines.values()):
+            p.stop()
         if input_engine:
             input_engine.stop()
         if output_engine:
             output_engine.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+
+    # ---------- Ctrl-C 處理 ---------- #
+    def signal_handler(sig, frame):
+        print("\n🛑 偵測到 Ctrl+C，中止...\n")
+        shutdown()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
@@ -59,26 +61,68 @@ if __name__ == "__main__":
 
     # === 執行流程 ===
     print("\n📡 開始錄音中，請說話...（Ctrl+C 可中止）")
-    stt_engine = TranscribeEngineFactory.create(config["transcribe_config"])
-    input_engine.start()
-    # === 翻譯器（可選） ===
-    trans_cfg = config.get("translate_config", {})
-    if trans_cfg.get("enabled", False):
-        translator = TranslateEngineFactory.create(trans_cfg)
-    else:
-        translator = None
-
     # === 輸出 ===
     output_engine = OutputEngineFactory.create(config["output_config"])
 
-    def create_stream():
-        raw_stream = stt_engine.transcribe_stream(input_engine.stream_audio())
-        return translator.translate_stream(raw_stream) if translator else raw_stream
+    # === 指標：headless 執行時供 Prometheus 抓取 ===
+    pipeline_cfg = config.get("pipeline_config", {})
+    metrics_port = int(pipeline_cfg.get("metrics_port", 0))
+    if metrics_port:
+        metrics.gauge("stt_sessions", "正在轉錄的 session 數").set_function(
+            lambda: 1 + len(session_pipelines)
+        )
+        metrics_host = pipeline_cfg.get("metrics_host", "localhost")
+        metrics_server = metrics.start_http_server(metrics_port, metrics_host)
+        print(f"📈 指標端點：http://{metrics_host}:{metrics_port}/metrics")
+
+    # 錄音 → STT → 翻譯 → 輸出，各階段獨立執行緒並以有界佇列串接
+    # 翻譯引擎只建立一次，所有 session 的管線共用（NLLB / M2M 模型、翻譯子程序不重複載入）
+    translator = SpeechPipeline.create_translator(config)
+    scheduler = None
+    if isinstance(input_engine, SocketInputEngine) and input_engine.max_sessions > 1:
+        # socket 輸入的每個 session 各自一條管線，共用模型並依序解碼
+        from engines.transcribe import DecodeScheduler
+
+        # 預設管線算一個 session；只有在其他 producer 連上時才需要排隊解碼
+        scheduler = DecodeScheduler(1)
+        scheduler.join()
+
+        def on_session(session_id, stream):
+            def show(text, prefix=f"[{session_id}] "):
+                output_engine.display(derive(text, prefix + text))
+
+            p = SpeechPipeline.from_config(
+                config,
+                stream,
+                CallbackOutputEngine({}, show),
+                scheduler,
+                session_id,
+                translator,
+            )
+            session_pipelines[session_id] = p
+            scheduler.join()
+            p.start()
+
+        def on_session_end(session_id):
+            p = session_pipelines.pop(session_id, None)
+            if p:
+                p.stop()
+                scheduler.leave()
+
+        input_engine.on_session = on_session
+        input_engine.on_session_end = on_session_end
+
+    pipeline = SpeechPipeline.from_config(
+        config, input_engine, output_engine, scheduler, translator=translator
+    )
+    input_engine.start()
+    pipeline.start()
 
-    def stt_worker():
-        stream = create_stream()  # 錄音 + STT + 翻譯
-        for text in stream:
-            output_engine.display(text)  # 把結果推進 queue
+    def wait_input_end():
+        # 音訊檔等有限輸入讀完且字幕都送出後，停止輸出（定稿最後一段）並結束
+        pipeline.wait()
+        print("\n✅ 輸入已結束，所有字幕已輸出")
+        shutdown()
 
-    threading.Thread(target=stt_worker, daemon=True).start()
-    output_engine.start()  # main thread
+    threading.Thread(target=wait_input_end, daemon=True).start()
+    output_engine.start()  # main thread，stop() 後返回
@@ -0,0 +1,122 @@
+from collections import deque
+from typing import Iterable
+
+
+class AhoCorasick:
+    """
+    多模式字串比對自動機（Aho-Corasick）
+    - 建置 O(總模式長度)，比對 O(文字長度 + 命中數)
+    - ignore_case=True 時以小寫比對，但取代時保留原文其餘部分
+
+    使用範例
+    --------
+    ac = AhoCorasick(["thanks for watching", "輝達"])
+    ac.replace("輝達 thanks for watching", {"輝達": "NVIDIA"})
+    """
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self.patterns: list[str] = []
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 每個節點命中的模式 index（含 fail 鏈上的），依長度由長到短
+        self._out: list[list[int]] = [[]]
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _norm(self, text: str) -> str:
+        if not self.ignore_case:
+            return text
+        lowered = text.lower()
+        # 少數字元小寫後長度會改變，此時退回原文以維持位置對應
+        return lowered if len(lowered) == len(text) else text
+
+    def _add(self, pattern: str):
+        key = self._norm(pattern)
+        if not key:
+            return
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+            # BFS 保證 fail 節點的輸出已完成，這裡只需排序
+            self._out[node].sort(key=lambda i: -len(self.patterns[i]))
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def iter_matches(self, text: str):
+        """逐一產生 (start, end, pattern_index)，同一結尾位置由長到短"""
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(self._norm(text)):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                yield i + 1 - len(self.patterns[idx]), i + 1, idx
+
+    def find(self, text: str, accept=None) -> list[tuple[int, int, int]]:
+        """
+        最左最長、互不重疊的命中結果
+        accept(text, start, end, idx) 回傳 False 的命中不列入，同一起點改取次長的命中
+        """
+        best: dict[int, tuple[int, int]] = {}
+        for start, end, idx in self.iter_matches(text):
+            if accept is not None and not accept(text, start, end, idx):
+                continue
+            cur = best.get(start)
+            if cur is None or end > cur[0]:
+                best[start] = (end, idx)
+
+        matches = []
+        pos = 0
+        for start in sorted(best):
+            if start < pos:
+                continue
+            end, idx = best[start]
+            matches.append((start, end, idx))
+            pos = end
+        return matches
+
+    def replace(self, text: str, replacements: dict[str, str] | list[str]) -> str:
+        """
+        以模式對應的取代字串改寫文字
+        replacements 可為 {pattern: 取代字串} 或與 patterns 同順序的 list
+        """
+        if not self.patterns:
+            return text
+        if isinstance(replacements, dict):
+            replacements = [replacements.get(p, "") for p in self.patterns]
+        parts = []
+        pos = 0
+        for start, end, idx in self.find(text):
+            parts.append(text[pos:start])
+            parts.append(replacements[idx])
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
@@ -0,0 +1,82 @@
+"""
+音訊幀格式
+
+    "AUD1" | sample_rate (uint32) | encoding (uint8) | channels (uint8)
+           | 保留 (uint16) | payload bytes (uint32)
+    後接 payload（little-endian，多聲道為交錯排列）
+
+encoding 沿用 WAV 的格式代碼：1 = int16 PCM、3 = float32
+沒有 header 的訊息視為舊格式：16 kHz 單聲道 float32
+一則訊息可包含多個相接的幀（AudioForwarder 會合併）
+"""
+
+import struct
+
+import numpy as np
+
+from .resample import StreamResampler
+
+AUDIO_MAGIC = b"AUD1"
+AUDIO_HEADER = struct.Struct("<4sIBBHI")
+ENCODING_INT16 = 1
+ENCODING_FLOAT32 = 3
+_DTYPES = {ENCODING_INT16: np.dtype("<i2"), ENCODING_FLOAT32: np.dtype("<f4")}
+
+
+def encode_audio_frame(
+    samples: np.ndarray, sample_rate: int, int16: bool = True
+) -> bytes:
+    """把 (n,) 或 (n, channels) 的 float32 音訊編成一個幀"""
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    if int16:
+        payload = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        encoding = ENCODING_INT16
+    else:
+        payload = samples.astype("<f4").tobytes()
+        encoding = ENCODING_FLOAT32
+    header = AUDIO_HEADER.pack(
+        AUDIO_MAGIC, sample_rate, encoding, channels, 0, len(payload)
+    )
+    return header + payload
+
+
+class AudioFrameDecoder:
+    """
+    解析音訊幀並轉成目標取樣率的單聲道 float32
+    - 每條串流各用一個 decoder，重取樣器狀態跨幀保留
+    - 來源取樣率改變時重建重取樣器
+    """
+
+    def __init__(self, target_rate: int = 16000):
+        self.target_rate = target_rate
+        self._resampler: StreamResampler | None = None
+
+    def decode(self, data: bytes) -> np.ndarray:
+        if data[:4] != AUDIO_MAGIC:
+            # 舊格式：已是目標取樣率的 float32
+            return np.frombuffer(data, dtype=np.float32)
+
+        parts = []
+        view = memoryview(data)
+        pos = 0
+        while pos + AUDIO_HEADER.size <= len(view):
+            magic, rate, encoding, channels, _, size = AUDIO_HEADER.unpack_from(
+                view, pos
+            )
+            if magic != AUDIO_MAGIC or encoding not in _DTYPES:
+                raise ValueError(f"無法解析的音訊幀 (encoding={encoding})")
+            pos += AUDIO_HEADER.size
+            raw = np.frombuffer(view[pos : pos + size], dtype=_DTYPES[encoding])
+            pos += size
+            parts.append(self._convert(raw, rate, encoding, max(1, channels)))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _convert(self, raw, rate, encoding, channels) -> np.ndarray:
+        samples = raw.astype(np.float32)
+        if encoding == ENCODING_INT16:
+            samples *= 1.0 / 32768
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+        if self._resampler is None or self._resampler.src_rate != rate:
+            self._resampler = StreamResampler(rate, self.target_rate)
+        return self._resampler.process(samples)
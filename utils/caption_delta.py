@@ -0,0 +1,126 @@
+"""
+字幕增量協定
+
+訊息種類
+--------
+{"type": "delta", "seg": 3, "pos": 12, "text": "..."}  第 3 段從第 12 字起改為 text
+{"type": "delta", "seg": 3, "trim": 5, "pos": 7, ...}  先刪掉開頭 5 字（滑動視窗），再從第 7 字起改為 text
+{"type": "commit", "seg": 3}                           第 3 段定稿，之後開始新段落
+{"type": "key", "seg": 3, "text": "..."}               完整狀態（新訂閱者 / 週期性 / 掉包後）
+{"type": "caption", "text": "..."}                     舊格式：整句字幕
+"""
+
+
+# 尋找開頭被截掉的位置時，以新字幕的前幾個字在舊字幕中定位
+_ANCHOR_LEN = 8
+_MAX_ANCHORS = 4
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class CaptionDeltaEncoder:
+    """
+    將整句字幕轉成增量訊息
+    - 同一段的更新只送出變動的尾段；開頭被滑動視窗截掉時另以 trim 表示
+    - 上一則為定稿（TextEvent.final）或清空時送出 commit，段落編號 +1
+    - 每 keyframe_interval 則訊息補一個 keyframe 讓晚加入或掉包的客戶端同步
+    """
+
+    def __init__(self, keyframe_interval: int = 50):
+        self.keyframe_interval = max(0, int(keyframe_interval))
+        self.seg = 0
+        self.text = ""
+        self._final = False  # 目前這段已定稿，下一則字幕開始新段落
+        self._since_key = 0
+
+    def encode(self, text: str) -> list[dict]:
+        final = getattr(text, "final", False)
+        if text == self.text:
+            self._final = self._final or final
+            return []
+        msgs = []
+        if self.text and (self._final or not text):
+            msgs.append({"type": "commit", "seg": self.seg})
+            self.seg += 1
+            self.text = ""
+        if text:
+            msgs.append(self._delta(str(text)))
+            self.text = str(text)
+        self._final = final
+
+        self._since_key += 1
+        if self.keyframe_interval and self._since_key >= self.keyframe_interval:
+            msgs.append(self.keyframe())
+            self._since_key = 0
+        return msgs
+
+    def _delta(self, text: str) -> dict:
+        """送出字數最少的更新：直接改尾段，或先截掉開頭再改尾段"""
+        old = self.text
+        trim, pos = 0, common_prefix_len(old, text)
+        anchor = text[:_ANCHOR_LEN]
+        i = old.find(anchor, 1) if pos < len(anchor) else -1
+        for _ in range(_MAX_ANCHORS):
+            if i < 0:
+                break
+            n = common_prefix_len(old[i:], text)
+            if n > pos:
+                trim, pos = i, n
+            i = old.find(anchor, i + 1)
+        msg = {"type": "delta", "seg": self.seg, "pos": pos, "text": text[pos:]}
+        if trim:
+            msg["trim"] = trim
+        return msg
+
+    def keyframe(self) -> dict:
+        return {"type": "key", "seg": self.seg, "text": self.text}
+
+
+class CaptionDeltaDecoder:
+    """
+    套用增量訊息還原目前字幕；與編碼端不同步時等待下一個 keyframe
+    apply() 回傳目前字幕，無法套用時回傳 None
+    """
+
+    def __init__(self):
+        self.seg = None
+        self.text = ""
+
+    def apply(self, msg: dict) -> str | None:
+        kind = msg.get("type")
+        if kind == "caption":
+            self.text = msg.get("text", "")
+            return self.text
+        if kind == "key":
+            self.seg = msg["seg"]
+            self.text = msg["text"]
+            return self.text
+        if self.seg is None or msg.get("seg") != self.seg:
+            if kind == "delta" and msg.get("pos") == 0 and self.seg is not None:
+                # 新段落的第一個 delta，可直接接上
+                self.seg = msg["seg"]
+                self.text = msg["text"]
+                return self.text
+            return None
+        if kind == "commit":
+            self.seg += 1
+            self.text = ""
+            return self.text
+        if kind == "delta":
+            text = self.text[msg.get("trim", 0) :]
+            pos = msg["pos"]
+            if pos > len(text):
+                self.seg = None  # 掉包，等待 keyframe
+                return None
+            self.text = text[:pos] + msg["text"]
+            return self.text
+        return None
+
+    def keyframe(self) -> dict:
+        return {"type": "key", "seg": self.seg or 0, "text": self.text}
@@ -0,0 +1,267 @@
+import logging
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .events import AudioGap
+from .tracing import stamp
+
+logger = logging.getLogger(__name__)
+
+# 暫存檔的每筆紀錄：樣本數 + 錄音時間 + float32 音訊；
+# 樣本數為 0 時後接 AudioGap 的 (at, duration)
+_SPILL_HEADER = struct.Struct("<Id")
+_SPILL_GAP = struct.Struct("<dd")
+
+
+class CaptureQueue:
+    """
+    錄音執行緒與 STT 之間的音訊佇列，消費端跟不上時依 policy 處理：
+    - drop_oldest : 丟最舊的幀（預設，維持即時）
+    - drop_newest : 丟新進的幀
+    - block       : 錄音執行緒等待（由驅動層決定是否丟失）
+    - spill       : 超出的幀寫到暫存檔，消費端依序讀回，不丟任何音訊；
+                    暫存超過 spill_max_sec 秒後改為丟新進的幀
+    丟棄時在原位置放入 AudioGap，下游據此重設上下文並校正時間碼
+    生產端也可直接 append(AudioGap)：相鄰的缺口合併，缺口不佔佇列容量
+    與 deque 相同的 append / popleft / len 介面
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest", "block", "spill")
+
+    def __init__(
+        self,
+        maxlen: int,
+        sample_rate: int,
+        policy: str = "drop_oldest",
+        spill_max_sec: float = 600,
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的錄音佇列策略: {policy}")
+        self.maxlen = max(2, int(maxlen))
+        self.sample_rate = sample_rate
+        self.policy = policy
+        self._q: deque = deque()
+        self._queued_gaps = 0  # 佇列中的 AudioGap 數，不計入容量
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # ----- spill：記憶體滿了之後的幀依序寫到暫存檔 -----
+        self.spill_max_samples = int(spill_max_sec * sample_rate)
+        self._spill = None
+        self._spill_read = self._spill_write = 0
+        self._spill_frames = 0
+        self._spill_samples = 0
+        self._spill_gap: AudioGap | None = None  # 暫存檔最後一筆若是缺口，可繼續累加
+        self._spill_gap_pos = 0
+
+        # ----- 統計 -----
+        self.dropped_frames = 0
+        self.dropped_sec = 0.0
+        self.gaps = 0
+        self.spilled_frames = 0
+        self._last_log = 0.0
+
+    # ----------- 錄音執行緒 -----------
+    def append(self, frame: np.ndarray | AudioGap):
+        with self._cond:
+            if self._closed:
+                return
+            if isinstance(frame, AudioGap):
+                self._append_gap(frame)
+                return
+            if self._spill_frames or self._frames() >= self.maxlen:
+                if self.policy == "drop_oldest":
+                    self._drop_front()
+                elif self.policy == "drop_newest":
+                    self._drop_back(frame)
+                    return
+                elif self.policy == "spill":
+                    if self._spill_samples + len(frame) > self.spill_max_samples:
+                        self._spill_drop(frame)
+                    else:
+                        self._spill_out(frame)
+                    return
+                else:
+                    while self._frames() >= self.maxlen and not self._closed:
+                        self._cond.wait(0.1)
+                    if self._closed:
+                        return
+            self._q.append(frame)
+            self._cond.notify_all()
+
+    def _frames(self) -> int:
+        return len(self._q) - self._queued_gaps
+
+    @staticmethod
+    def _merge(gap: AudioGap, other: AudioGap):
+        gap.at = min(gap.at, other.at)
+        gap.duration += other.duration
+
+    def _append_gap(self, gap: AudioGap):
+        """生產端送來的缺口：不等待也不丟棄，有暫存時寫進暫存檔以維持順序"""
+        if self._spill_frames:
+            if self._spill_gap is None:
+                self._spill_mark(gap)
+            else:
+                self._merge(self._spill_gap, gap)
+                self._spill_sync_gap()
+        elif self._q and isinstance(self._q[-1], AudioGap):
+            self._merge(self._q[-1], gap)
+        else:
+            self._q.append(gap)
+            self._queued_gaps += 1
+            self._cond.notify_all()
+
+    def _gap(self) -> AudioGap:
+        self.gaps += 1
+        now = time.monotonic()
+        if now - self._last_log >= 5:  # 持續過載時不要每幀都寫 log
+            self._last_log = now
+            logger.warning(
+                f"音訊佇列已滿（{self.policy}），丟棄音訊；"
+                f"此前已丟棄 {self.dropped_frames} 幀 / {self.dropped_sec:.2f} 秒"
+            )
+        return AudioGap(time.time())
+
+    def _count(self, gap: AudioGap, frame: np.ndarray):
+        sec = len(frame) / self.sample_rate
+        gap.duration += sec
+        self.dropped_frames += 1
+        self.dropped_sec += sec
+
+    def _drop_front(self):
+        if isinstance(self._q[0], AudioGap):
+            gap = self._q.popleft()
+        else:
+            gap = self._gap()
+            self._queued_gaps += 1
+        item = self._q.popleft()
+        while isinstance(item, AudioGap):  # 丟棄後相鄰的缺口合併成一個
+            self._merge(gap, item)
+            self._queued_gaps -= 1
+            item = self._q.popleft()
+        self._count(gap, item)
+        while self._q and isinstance(self._q[0], AudioGap):
+            self._merge(gap, self._q.popleft())
+            self._queued_gaps -= 1
+        self._q.appendleft(gap)
+
+    def _drop_back(self, frame: np.ndarray):
+        if self._q and isinstance(self._q[-1], AudioGap):
+            gap = self._q[-1]
+        else:
+            gap = self._gap()
+            self._q.append(gap)
+            self._queued_gaps += 1
+        self._count(gap, frame)
+        self._cond.notify_all()
+
+    def _open_spill(self):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix="stt_spill_")
+            logger.warning("音訊佇列已滿，超出的音訊暫存到磁碟")
+        self._spill.seek(self._spill_write)
+
+    def _spill_out(self, frame: np.ndarray):
+        self._open_spill()
+        data = np.ascontiguousarray(frame, dtype=np.float32)
+        captured = getattr(frame, "captured", None) or 0.0
+        self._spill.write(_SPILL_HEADER.pack(len(data), captured) + data.tobytes())
+        self._spill_write = self._spill.tell()
+        self._spill_gap = None
+        self._spill_frames += 1
+        self._spill_samples += len(data)
+        self.spilled_frames += 1
+
+    def _spill_drop(self, frame: np.ndarray):
+        """暫存檔已滿：丟棄新進的幀，缺口標記也寫進暫存檔以維持順序"""
+        if self._spill_gap is None:
+            self._spill_mark(self._gap())
+        self._count(self._spill_gap, frame)
+        self._spill_sync_gap()
+
+    def _spill_mark(self, gap: AudioGap):
+        """在暫存檔尾端寫入缺口標記，之後的缺口可累加到這一筆"""
+        self._open_spill()
+        self._spill_gap = gap
+        self._spill_gap_pos = self._spill_write
+        self._spill.write(
+            _SPILL_HEADER.pack(0, 0) + _SPILL_GAP.pack(gap.at, gap.duration)
+        )
+        self._spill_write = self._spill.tell()
+        self._spill_frames += 1
+
+    def _spill_sync_gap(self):
+        gap = self._spill_gap
+        self._spill.seek(self._spill_gap_pos + _SPILL_HEADER.size)
+        self._spill.write(_SPILL_GAP.pack(gap.at, gap.duration))
+
+    def _spill_in(self):
+        """暫存檔中最舊的一筆讀回記憶體佇列"""
+        self._spill.seek(self._spill_read)
+        n, captured = _SPILL_HEADER.unpack(self._spill.read(_SPILL_HEADER.size))
+        if n:
+            data = np.frombuffer(self._spill.read(n * 4), dtype=np.float32)
+            item = stamp(data[:, np.newaxis], captured or None)
+        else:
+            item = AudioGap(*_SPILL_GAP.unpack(self._spill.read(_SPILL_GAP.size)))
+            self._spill_gap = None
+            self._queued_gaps += 1
+        self._spill_read = self._spill.tell()
+        self._spill_frames -= 1
+        self._spill_samples -= n
+        if not self._spill_frames:
+            # 讀完即從頭重用暫存檔
+            self._spill_read = self._spill_write = 0
+            self._spill.truncate(0)
+        self._q.append(item)
+
+    # ----------- 消費端 -----------
+    def popleft(self):
+        with self._cond:
+            item = self._q.popleft()
+            if isinstance(item, AudioGap):
+                self._queued_gaps -= 1
+            while self._spill_frames and self._frames() < self.maxlen:
+                self._spill_in()
+            self._cond.notify_all()
+            return item
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._q)
+
+    @property
+    def depth(self) -> int:
+        """不上鎖的目前深度，供監控抓取，不與錄音執行緒搶鎖"""
+        return len(self._q)
+
+    @property
+    def spill_sec(self) -> float:
+        return self._spill_samples / self.sample_rate
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "depth": len(self),
+            "dropped_frames": self.dropped_frames,
+            "dropped_sec": round(self.dropped_sec, 3),
+            "gaps": self.gaps,
+            "spilled_frames": self.spilled_frames,
+            "spill_sec": round(self.spill_sec, 3),
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+                self._spill_frames = self._spill_samples = 0
+                self._spill_gap = None
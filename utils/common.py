@@ -1,4 +1,12 @@
+import json
+import logging
+import os
 from copy import deepcopy
+from pathlib import Path
+
+from config.path import DEFAULT_CFG_PATH, USER_CFG_PATH
+
+logger = logging.getLogger(__name__)
 
 
 def deep_update(base: dict, patch: dict) -> dict:
@@ -9,3 +17,45 @@ def deep_update(base: dict, patch: dict) -> dict:
         else:
             merged[k] = v
     return merged
+
+
+def load_config(path: str | Path | None) -> dict:
+    default_cfg = json.loads(DEFAULT_CFG_PATH.read_text(encoding="utf-8"))
+    user_cfg = {}
+    # 優先用 CLI 指定的檔；沒有就找 user_config.json
+    if path:
+        user_cfg_path = Path(path)
+    else:
+        user_cfg_path = Path(USER_CFG_PATH)
+    if user_cfg_path.is_file():
+        user_cfg = json.loads(user_cfg_path.read_text(encoding="utf-8"))
+    return deep_update(default_cfg, user_cfg)
+
+
+def parse_cpu_list(spec: str) -> list[int]:
+    """將 "0-3,6" 這類字串轉成 [0, 1, 2, 3, 6]"""
+    cpus = []
+    for part in filter(None, map(str.strip, str(spec).split(","))):
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return sorted(set(cpus))
+
+
+def set_cpu_affinity(spec: str) -> bool:
+    """把目前程序綁定到指定 CPU，空字串表示不設定"""
+    cpus = parse_cpu_list(spec)
+    if not cpus:
+        return False
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        else:
+            # Windows / macOS 需要 psutil（選用套件）
+            import psutil
+
+            psutil.Process().cpu_affinity(cpus)
+    except Exception as e:
+        logger.warning(f"無法設定 CPU affinity {cpus}: {e}")
+        return False
+    logger.info(f"CPU affinity 已設定為 {cpus}")
+    return True
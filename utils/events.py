@@ -0,0 +1,48 @@
+class TextEvent(str):
+    """
+    帶有音訊時間資訊的字幕字串
+    - 行為與 str 完全相同，可直接交給既有的翻譯 / 輸出流程
+    - start / end 為相對於串流開頭的音訊秒數，未知時為 None
+    - trace 為延遲追蹤紀錄（utils.tracing.Trace），未追蹤時為 None
+    - final 為 True 表示這是該段的最終版本，下一則字幕開始新的段落；
+      其餘字幕都是同一段的更新，即使開頭被滑動視窗截掉也不代表換段
+    """
+
+    def __new__(
+        cls,
+        text: str,
+        start: float | None = None,
+        end: float | None = None,
+        trace=None,
+        final: bool = False,
+    ):
+        obj = super().__new__(cls, text)
+        obj.start = start
+        obj.end = end
+        obj.trace = trace
+        obj.final = final
+        return obj
+
+
+class AudioGap:
+    """
+    音訊串流中的缺口標記（錄音佇列溢出而丟棄音訊時插入）
+    - 前後的音訊不連續，轉錄引擎應重設上下文，不可把兩段接在一起解碼
+    - at 為開始丟棄的 time.time()，duration 為遺失的音訊秒數
+    """
+
+    __slots__ = ("at", "duration")
+
+    def __init__(self, at: float, duration: float = 0.0):
+        self.at = at
+        self.duration = duration
+
+    def __repr__(self):
+        return f"AudioGap(at={self.at:.3f}, duration={self.duration:.3f})"
+
+
+def derive(src: str, text: str) -> str:
+    """以 src 的時間與追蹤資訊包裝新文字（src 不是 TextEvent 時原樣回傳 text）"""
+    if isinstance(src, TextEvent):
+        return TextEvent(text, src.start, src.end, src.trace, src.final)
+    return text
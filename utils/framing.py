@@ -0,0 +1,18 @@
+import json
+import struct
+
+# 與 multiprocessing.connection 的 send_bytes / recv_bytes 相同：4 bytes big-endian 長度
+FRAME_HEADER = struct.Struct("!i")
+
+
+def encode_frame(message: dict) -> bytes:
+    """將訊息編成「長度 + UTF-8 JSON」封包"""
+    payload = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_payload(payload: bytes) -> dict:
+    """解開封包內容（不含長度 header）"""
+    return json.loads(payload.decode("utf-8"))
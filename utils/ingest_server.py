@@ -0,0 +1,194 @@
+import logging
+import re
+import selectors
+import socket
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 與 multiprocessing.connection 的 send_bytes 相同：4 bytes big-endian 長度，
+# 超過 2 GiB 時長度為 -1，後接 8 bytes 長度
+_LEN = struct.Struct("!i")
+_LEN64 = struct.Struct("!Q")
+
+# 單一封包的上限，約 5 秒 48 kHz 雙聲道 float32；超過視為異常的 producer 並斷線
+MAX_FRAME = 2 * 1024 * 1024
+
+SESSION_MAGIC = b"SID1"
+SESSION_ID_RE = re.compile(r"[\w-]{1,64}")
+DEFAULT_SESSION = "default"
+
+
+def session_hello(session_id: str) -> bytes:
+    """producer 連線後的第一則訊息：宣告要加入的 session"""
+    return SESSION_MAGIC + session_id.encode("utf-8")
+
+
+class _Producer:
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        self.buf = bytearray()
+        self.session: str | None = None  # 收到第一則訊息後決定
+
+
+class SocketIngestServer:
+    """
+    音訊輸入端：以 selector 迴圈接受任意數量的 producer
+    - 封包格式與 Connection.send_bytes() 相同，既有的 Client 不需修改
+    - 第一則訊息為 session_hello() 時加入該 session，否則加入 default
+    - 同一 session 斷線後以相同名稱重新連線即接續原本的串流；
+      沒有任何連線超過 idle_timeout 秒的 session（default 除外）會被回收
+    - 宣告的封包長度超過 max_frame 時直接斷線，不會為其配置緩衝
+    - 回呼皆在 selector 執行緒呼叫：
+      on_join(session) -> bool、on_frame(session, payload)、on_expire(session)
+    """
+
+    def __init__(
+        self,
+        address,
+        on_join,
+        on_frame,
+        on_expire=None,
+        idle_timeout: float = 60,
+        max_frame: int = MAX_FRAME,
+    ):
+        self.address = address
+        self.max_frame = max_frame
+        self.on_join = on_join
+        self.on_frame = on_frame
+        self.on_expire = on_expire
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.selector = None
+        self._producers: dict[socket.socket, _Producer] = {}
+        self._clients: dict[str, int] = {}  # session → 目前連線數
+        self._idle_since: dict[str, float] = {}
+        self._running = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.server = socket.create_server(self.address)
+        self.server.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, "accept")
+        self._running = True
+        self._thread.start()
+        logger.info(f"音訊輸入端已啟動於 {self.address}")
+
+    def _loop(self):
+        try:
+            while self._running:
+                for key, _ in self.selector.select(timeout=1):
+                    if key.data == "accept":
+                        self._accept()
+                    else:
+                        self._on_readable(key.fileobj)
+                self._reap()
+        finally:
+            for sock in list(self._producers):
+                self._drop(sock)
+            self.server.close()
+            self.selector.close()
+
+    def _accept(self):
+        try:
+            sock, addr = self.server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._producers[sock] = _Producer(sock, addr)
+        self.selector.register(sock, selectors.EVENT_READ, "producer")
+
+    def _on_readable(self, sock: socket.socket):
+        producer = self._producers.get(sock)
+        if producer is None:
+            return
+        try:
+            data = sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(sock)
+            return
+        producer.buf += data
+        try:
+            for payload in self._split(producer):
+                if producer.session is None and not self._join(producer, payload):
+                    self._drop(sock)
+                    return
+                if payload[:4] != SESSION_MAGIC:
+                    self.on_frame(producer.session, payload)
+        except ValueError as e:
+            logger.warning(f"{e}，中斷 {producer.addr}")
+            self._drop(sock)
+
+    def _split(self, producer: _Producer):
+        """從接收緩衝切出完整的封包；長度不合法時丟出 ValueError"""
+        buf = producer.buf
+        while len(buf) >= _LEN.size:
+            (size,), header = _LEN.unpack_from(buf), _LEN.size
+            if size == -1:
+                if len(buf) < _LEN.size + _LEN64.size:
+                    return
+                (size,), header = _LEN64.unpack_from(buf, _LEN.size), 12
+            if not 0 <= size <= self.max_frame:
+                raise ValueError(f"封包長度 {size} 超出上限 {self.max_frame}")
+            if len(buf) < header + size:
+                return
+            payload = bytes(buf[header : header + size])
+            del buf[: header + size]
+            yield payload
+
+    def _join(self, producer: _Producer, payload: bytes) -> bool:
+        session = DEFAULT_SESSION
+        if payload[:4] == SESSION_MAGIC:
+            session = payload[4:].decode("utf-8", "replace")
+            if not SESSION_ID_RE.fullmatch(session):
+                logger.warning(f"不合法的 session 名稱，拒絕 {producer.addr}")
+                return False
+        if not self.on_join(session):
+            logger.warning(f"session 已達上限，拒絕 {producer.addr} ({session})")
+            return False
+        producer.session = session
+        self._clients[session] = self._clients.get(session, 0) + 1
+        self._idle_since.pop(session, None)
+        logger.info(f"音訊來源已連線：{producer.addr} → {session}")
+        return True
+
+    def _drop(self, sock: socket.socket):
+        producer = self._producers.pop(sock, None)
+        if producer is None:
+            return
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+        session = producer.session
+        if session is not None:
+            self._clients[session] -= 1
+            if self._clients[session] <= 0:
+                self._idle_since[session] = time.monotonic()
+            logger.info(f"音訊來源已斷線：{producer.addr} ({session})")
+
+    def _reap(self):
+        now = time.monotonic()
+        for session, since in list(self._idle_since.items()):
+            if session == DEFAULT_SESSION or now - since < self.idle_timeout:
+                continue
+            del self._idle_since[session]
+            del self._clients[session]
+            logger.info(f"回收閒置的 session {session}")
+            if self.on_expire:
+                self.on_expire(session)
+
+    def stop(self):
+        # 實際的關閉在 selector 迴圈結束時進行
+        self._running = False
+        if self._thread.is_alive():
+            self._thread.join(timeout=3)
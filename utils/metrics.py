@@ -0,0 +1,306 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+from .tracing import LATENCY_BOUNDS, Histogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 解碼即時率（解碼耗時 / 音訊長度）的桶，1 以上表示跟不上即時
+RTF_BOUNDS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+# collector 產出的指標家族：(名稱, 類型, 說明, [(labels, 數值或 Histogram), ...])
+Family = tuple[str, str, str, list[tuple[dict, object]]]
+
+
+class _Shards:
+    """
+    依寫入執行緒分片的狀態：每個執行緒只寫自己的分片，熱路徑不上鎖也不會互相覆蓋
+    只有執行緒第一次寫入時需要上鎖登記分片
+    """
+
+    def __init__(self, new: Callable):
+        self._new = new
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.all: list = []
+
+    def get(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._new()
+            with self._lock:
+                self.all.append(shard)
+            return shard
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(lambda: [0.0])
+
+    def inc(self, amount: float = 1):
+        self._shards.get()[0] += amount
+
+    def value(self) -> float:
+        return sum(s[0] for s in list(self._shards.all))
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._func: Callable[[], float] | None = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, func: Callable[[], float]):
+        """抓取時才呼叫 func 取值，適合佇列深度等已存在的狀態"""
+        self._func = func
+
+    def value(self) -> float:
+        return self._func() if self._func else self._value
+
+
+class _HistogramChild:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self._shards = _Shards(lambda: Histogram(bounds))
+
+    def observe(self, value: float):
+        self._shards.get().observe(value)
+
+    def value(self) -> Histogram:
+        merged = Histogram(self.bounds)
+        for shard in list(self._shards.all):
+            merged.merge(shard)
+        return merged
+
+
+class _Metric:
+    """
+    指標家族；labels() 取得（必要時建立）某組 label 值的子指標
+    - 熱路徑應先取得子指標並保存，之後的更新只動自己執行緒的分片
+    - 沒有 label 的指標可直接呼叫 inc() / set() / observe()
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要 label: {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> list[tuple[dict, object]]:
+        return [
+            (dict(zip(self.labelnames, key)), child.value())
+            for key, child in list(self._children.items())
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set_function(self, func: Callable[[], float]):
+        self.labels().set_function(func)
+
+
+class HistogramMetric(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), bounds=LATENCY_BOUNDS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(bounds)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        )
+        for k, v in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _histogram_lines(name: str, labels: dict, hist: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.bounds + [float("inf")], hist.counts):
+        cumulative += count
+        le = _format_labels({**labels, "le": _format_value(bound)})
+        lines.append(f"{name}_bucket{le} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist.sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+    return lines
+
+
+class MetricsRegistry:
+    """
+    Prometheus 文字格式的指標註冊表
+    - counter() / gauge() / histogram() 以名稱取得或建立指標，重複呼叫回傳同一個
+    - register(collector) 登記抓取時才執行的函式，回傳 Family 的 iterable；
+      佇列深度、session 數等已存在的狀態以此讀取，不必在熱路徑另外更新
+    - render() 只讀取各分片與既有統計，不會讓寫入端等待
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指標 {name} 已註冊為 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(
+        self, name: str, help: str, labelnames=(), bounds=LATENCY_BOUNDS
+    ) -> HistogramMetric:
+        return self._get(HistogramMetric, name, help, labelnames, bounds)
+
+    def register(self, collector: Callable[[], Iterable[Family]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister(self, collector: Callable[[], Iterable[Family]]):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        families: dict[str, list] = {}
+        for metric in list(self._metrics.values()):
+            families[metric.name] = [metric.kind, metric.help, metric.samples()]
+        for collector in list(self._collectors):
+            try:
+                for name, kind, help, samples in collector():
+                    families.setdefault(name, [kind, help, []])[2].extend(samples)
+            except Exception as e:
+                logger.error(f"指標收集失敗: {e}")
+
+        lines = []
+        for name, (kind, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind == "histogram":
+                    lines.extend(_histogram_lines(name, labels, value))
+                else:
+                    label_str = _format_labels(labels)
+                    lines.append(f"{name}{label_str} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 抓取很頻繁，不寫 access log
+
+
+def start_http_server(
+    port: int, host: str = "localhost", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """在背景執行緒提供 GET /metrics，回傳 server 供呼叫端 shutdown()"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    logger.info(f"指標端點已啟動於 http://{host}:{port}/metrics")
+    return server
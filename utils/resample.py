@@ -0,0 +1,76 @@
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin
+
+
+class StreamResampler:
+    """
+    有狀態的多相 (polyphase) 重取樣器
+    - 以 src_rate / dst_rate 的最簡整數比 up / down 實作，濾波器為 Kaiser 窗的低通 FIR，
+      截止頻率取兩者 Nyquist 較低者，避免降頻時混疊
+    - 跨區塊保留濾波器歷史與相位，任意切塊送入的結果與一次處理整段相同
+    - 每個輸出樣本以 numpy 一次算完（無 Python 迴圈）
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, zero_crossings: int = 8):
+        g = gcd(int(src_rate), int(dst_rate))
+        self.src_rate = int(src_rate)
+        self.dst_rate = int(dst_rate)
+        self.up = self.dst_rate // g
+        self.down = self.src_rate // g
+        if self.up == self.down:
+            return
+
+        # 濾波器長度依較大的倍率決定，並補到 up 的整數倍方便切成多相
+        taps = 2 * zero_crossings * max(self.up, self.down)
+        taps += -taps % self.up
+        h = firwin(taps, 0.95 / max(self.up, self.down), window=("kaiser", 8.0))
+        h = (h * self.up).astype(np.float32)
+        self.taps = taps // self.up  # 每相的長度
+        # phases[p, j] = h[j * up + p]
+        self._phases = h.reshape(self.taps, self.up).T.copy()
+        self._offsets = np.arange(self.taps - 1, -1, -1)
+        self._hist = np.zeros(self.taps - 1, dtype=np.float32)
+        self._next = 0  # 下一個輸出在升頻域的位置（相對本區塊第一個輸入）
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """輸入一維 float32，回傳重取樣後的一維 float32"""
+        if self.passthrough:
+            return x
+        span = len(x) * self.up
+        count = max(0, -(-(span - self._next) // self.down))
+        buf = np.concatenate((self._hist, x))
+        if count:
+            n = self._next + self.down * np.arange(count)
+            base, phase = np.divmod(n, self.up)
+            window = buf[base[:, None] + self._offsets]
+            y = np.einsum("kt,kt->k", window, self._phases[phase])
+        else:
+            y = np.empty(0, dtype=np.float32)
+        self._next += count * self.down - span
+        self._hist = buf[len(buf) - (self.taps - 1) :]
+        return y.astype(np.float32, copy=False)
+
+
+class StreamConverter:
+    """
+    錄音區塊 (n, channels) → 目標取樣率的單聲道 (m, 1) float32
+    down-mix 與重取樣在同一步完成，重取樣狀態跨區塊保留
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.resampler = StreamResampler(src_rate, dst_rate)
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        if block.ndim == 2:
+            if block.shape[1] == 1:
+                block = block[:, 0]
+            else:
+                block = block.mean(axis=1, dtype=np.float32)
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        return self.resampler.process(block)[:, np.newaxis]
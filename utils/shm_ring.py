@@ -0,0 +1,205 @@
+import select
+import socket
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .audio_format import AudioFrameDecoder
+
+# ----- 共享記憶體標頭（uint64 x 8，資料區從 64 bytes 開始） -----
+_WRITE = 0  # 累計寫入樣本數（只有寫入端修改）
+_READ = 1  # 累計讀出樣本數（只有讀取端修改）
+_DROPPED = 2  # 空間不足而丟棄的幀數（寫入端）
+_WAITING = 3  # 讀取端正在等待門鈴
+_PORT = 4  # 門鈴 UDP 埠
+_CAPACITY = 5  # 環狀緩衝樣本數
+_HEARTBEAT = 6  # 讀取端最後一次活動時間（毫秒）
+_HEADER_BYTES = 64
+
+
+class ShmAudioRing:
+    """
+    以 multiprocessing.shared_memory 實作的單一生產者 / 單一消費者 float32 環狀緩衝
+    - 讀寫索引為單調遞增的 uint64，各自只由一端寫入，因此不需要鎖
+    - 讀取端沒資料時才設定 _WAITING，寫入端看到後送一個 UDP 門鈴喚醒；
+      讀取端持續忙碌時整條路徑沒有任何 syscall
+    - 門鈴可能因記憶體重排而漏響，讀取端一律帶 timeout 等待，最差只延遲一個 timeout
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self._hdr = np.ndarray(
+            (8,), dtype=np.uint64, buffer=shm.buf[:_HEADER_BYTES]
+        )
+        self.capacity = int(self._hdr[_CAPACITY])
+        self._data = np.ndarray(
+            (self.capacity,), dtype=np.float32, buffer=shm.buf[_HEADER_BYTES:]
+        )
+        self._bell: socket.socket | None = None
+
+    # ----------- 建立 / 連接 -----------
+    @classmethod
+    def create(cls, name: str, capacity: int) -> "ShmAudioRing":
+        """讀取端建立環狀緩衝（同名的殘留區段會先移除）"""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_HEADER_BYTES + capacity * 4
+        )
+        hdr = np.ndarray((8,), dtype=np.uint64, buffer=shm.buf[:_HEADER_BYTES])
+        hdr[:] = 0
+        hdr[_CAPACITY] = capacity
+        ring = cls(shm, owner=True)
+
+        ring._bell = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ring._bell.bind(("127.0.0.1", 0))
+        ring._bell.setblocking(False)
+        ring._hdr[_PORT] = ring._bell.getsockname()[1]
+        ring.heartbeat()
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmAudioRing":
+        """寫入端連接既有的環狀緩衝，不存在時丟出 FileNotFoundError"""
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # POSIX 上 attach 也會被 resource_tracker 登記，結束時誤刪讀取端的區段
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        ring = cls(shm, owner=False)
+        ring._bell = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ring._bell.setblocking(False)
+        return ring
+
+    # ----------- 寫入端 -----------
+    def write(self, samples: np.ndarray) -> bool:
+        """寫入一幀，空間不足時丟棄整幀並回傳 False"""
+        n = len(samples)
+        w = int(self._hdr[_WRITE])
+        if n > self.capacity - (w - int(self._hdr[_READ])):
+            self._hdr[_DROPPED] += 1
+            return False
+        pos = w % self.capacity
+        first = min(n, self.capacity - pos)
+        self._data[pos : pos + first] = samples[:first]
+        self._data[: n - first] = samples[first:]
+        self._hdr[_WRITE] = w + n  # 資料寫完才公開索引
+        if self._hdr[_WAITING]:
+            self._hdr[_WAITING] = 0
+            try:
+                self._bell.sendto(b"\0", ("127.0.0.1", int(self._hdr[_PORT])))
+            except OSError:
+                pass
+        return True
+
+    def reader_alive(self, timeout: float = 3.0) -> bool:
+        return time.time() * 1000 - int(self._hdr[_HEARTBEAT]) < timeout * 1000
+
+    # ----------- 讀取端 -----------
+    def available(self) -> int:
+        return int(self._hdr[_WRITE]) - int(self._hdr[_READ])
+
+    def read_into(self, out: np.ndarray) -> int:
+        """直接複製到呼叫端的陣列（最多 len(out) 個樣本），回傳實際讀出數"""
+        self.heartbeat()
+        r = int(self._hdr[_READ])
+        n = min(int(self._hdr[_WRITE]) - r, len(out))
+        pos = r % self.capacity
+        first = min(n, self.capacity - pos)
+        out[:first] = self._data[pos : pos + first]
+        out[first:n] = self._data[: n - first]
+        self._hdr[_READ] = r + n
+        return n
+
+    def wait(self, timeout: float) -> bool:
+        """等待新資料或 timeout，回傳是否有資料可讀"""
+        self.heartbeat()
+        self._hdr[_WAITING] = 1
+        if not self.available():
+            ready, _, _ = select.select([self._bell], [], [], timeout)
+            if ready:
+                try:
+                    while self._bell.recv(64):
+                        pass
+                except OSError:
+                    pass
+        self._hdr[_WAITING] = 0
+        return self.available() > 0
+
+    def heartbeat(self):
+        self._hdr[_HEARTBEAT] = int(time.time() * 1000)
+
+    @property
+    def dropped(self) -> int:
+        return int(self._hdr[_DROPPED])
+
+    def close(self):
+        if self._bell:
+            self._bell.close()
+        # 釋放 numpy view 後才能關閉 mmap
+        self._hdr = self._data = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ShmAudioWriter:
+    """
+    web server 端：把瀏覽器的音訊轉成 float32 後直接寫進 main.py 建立的環狀緩衝
+    - 與 ReconnectableClient 相同的 send_bytes / close 介面
+    - 尚未連上或讀取端停止回應時丟棄音訊，每 retry_interval 秒重新連接
+    """
+
+    def __init__(
+        self, name: str, retry_interval: float = 3, sample_rate: int = 16000
+    ):
+        self.name = name
+        self.retry_interval = retry_interval
+        self.decoder = AudioFrameDecoder(sample_rate)
+        self.ring: ShmAudioRing | None = None
+        self._next_try = 0.0
+
+    def _ensure_ring(self) -> bool:
+        if self.ring is not None:
+            if self.ring.reader_alive():
+                return True
+            print(f"[ShmAudioWriter] 讀取端停止回應，重新連接 {self.name}")
+            self.ring.close()
+            self.ring = None
+        now = time.monotonic()
+        if now < self._next_try:
+            return False
+        self._next_try = now + self.retry_interval
+        try:
+            self.ring = ShmAudioRing.attach(self.name)
+            print(f"[ShmAudioWriter] 已連接共享記憶體 {self.name}")
+            return True
+        except FileNotFoundError:
+            print(f"[ShmAudioWriter] 找不到 {self.name}，稍後重試…")
+            return False
+
+    def send_bytes(self, data: bytes):
+        if self._ensure_ring():
+            self.ring.write(self.decoder.decode(data))
+
+    def submit(self, data: bytes) -> bool:
+        # 寫入共享記憶體不會阻塞，可直接在事件迴圈呼叫
+        self.send_bytes(data)
+        return True
+
+    def close(self):
+        if self.ring:
+            self.ring.close()
+            self.ring = None
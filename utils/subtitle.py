@@ -0,0 +1,31 @@
+import json
+
+SUBTITLE_EXT = {"srt": ".srt", "vtt": ".vtt", "jsonl": ".jsonl"}
+
+
+def format_timestamp(seconds: float, sep: str = ",") -> str:
+    """秒數轉 HH:MM:SS,mmm（WebVTT 使用 "." 分隔毫秒）"""
+    ms = max(0, int(round(seconds * 1000)))
+    h, ms = divmod(ms, 3_600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
+def file_header(fmt: str) -> str:
+    return "WEBVTT\n\n" if fmt == "vtt" else ""
+
+
+def format_entry(fmt: str, index: int, start: float, end: float, text: str) -> str:
+    """把一段定稿字幕轉成指定格式的文字（含結尾換行）"""
+    if fmt == "jsonl":
+        record = {"index": index, "start": round(start, 3), "end": round(end, 3)}
+        record["text"] = text
+        return json.dumps(record, ensure_ascii=False) + "\n"
+    sep = "." if fmt == "vtt" else ","
+    stamp = f"{format_timestamp(start, sep)} --> {format_timestamp(end, sep)}"
+    # 字幕內容不可有空行，否則會被視為下一段
+    body = "\n".join(line for line in text.splitlines() if line.strip())
+    if fmt == "vtt":
+        return f"{stamp}\n{body}\n\n"
+    return f"{index}\n{stamp}\n{body}\n\n"
@@ -0,0 +1,137 @@
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from .events import TextEvent
+
+# 延遲直方圖的桶上限（毫秒），最後一桶為無限大
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+LATENCY_BOUNDS = tuple(b / 1000 for b in LATENCY_BUCKETS_MS)
+
+
+class CapturedBlock(np.ndarray):
+    """帶有錄音時間 (time.monotonic()) 的音訊區塊，切片後仍保留"""
+
+    captured: float | None = None
+
+    def __array_finalize__(self, obj):
+        self.captured = getattr(obj, "captured", None)
+
+
+def stamp(block: np.ndarray, captured: float | None = None) -> CapturedBlock:
+    """在音訊區塊標上錄音時間（只建立 view，不複製資料）"""
+    out = block.view(CapturedBlock)
+    out.captured = time.monotonic() if captured is None else captured
+    return out
+
+
+class Trace:
+    """
+    一則字幕從錄音到顯示的時間紀錄
+    - captured：字幕所含最新一段音訊的錄音時間
+    - marks：各階段的 (進入, 離開) 時間，依經過的順序排列
+    """
+
+    __slots__ = ("captured", "marks")
+
+    def __init__(self, captured: float):
+        self.captured = captured
+        self.marks: dict[str, list[float]] = {}
+
+    def enter(self, stage: str, t: float | None = None):
+        self.marks[stage] = [time.monotonic() if t is None else t, 0.0]
+
+    def exit(self, stage: str, t: float | None = None):
+        mark = self.marks.get(stage)
+        if mark is not None:
+            mark[1] = time.monotonic() if t is None else t
+
+
+def with_trace(event: str, trace: Trace) -> TextEvent:
+    """把 trace 附到字幕上（一般字串會轉成 TextEvent）"""
+    if not isinstance(event, TextEvent):
+        event = TextEvent(event)
+    event.trace = trace
+    return event
+
+
+class Histogram:
+    """
+    固定桶的直方圖（預設為延遲，單位秒）
+    - observe() 只有一次 bisect 與兩個加法，不上鎖；
+      同一個直方圖只由單一執行緒寫入，讀取端容許些微不一致
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        """把相同桶界的另一個直方圖加進來"""
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        """以桶內線性內插估計分位數（秒）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= target and c:
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else lo * 2 or 1.0
+                return lo + (hi - lo) * (target - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.quantile(0.5) * 1000, 1),
+            "p95_ms": round(self.quantile(0.95) * 1000, 1),
+            "mean_ms": round(self.sum / self.count * 1000, 1) if self.count else 0.0,
+        }
+
+
+class LatencyTracer:
+    """
+    彙整每則字幕的 Trace
+    - "<階段>"：該階段的處理時間
+    - "wait:<階段>"：進入該階段前的排隊時間（第一段為錄音佇列）
+    - "e2e"：錄音到顯示完成
+    record() 只在輸出執行緒呼叫
+    """
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+
+    def _hist(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        return hist
+
+    def record(self, trace: Trace, done: float | None = None):
+        done = time.monotonic() if done is None else done
+        prev = trace.captured
+        for stage, (enter, leave) in trace.marks.items():
+            if not leave:
+                continue
+            self._hist(f"wait:{stage}").observe(max(0.0, enter - prev))
+            self._hist(stage).observe(max(0.0, leave - enter))
+            prev = leave
+        self._hist("e2e").observe(max(0.0, done - trace.captured))
+
+    def stats(self) -> dict:
+        return {name: h.summary() for name, h in list(self.histograms.items())}
@@ -1,6 +1,5 @@
 # web/server.py
 import asyncio
-import threading
 from pathlib import Path
 
 import uvicorn
@@ -8,6 +7,12 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
+from utils import metrics
+from utils.common import load_config
+from utils.shm_ring import ShmAudioWriter
+from web.utils.caption_hub import CaptionHub, caption_address
+from web.utils.ingest import AudioForwarder
+from web.utils.sessions import DEFAULT_SESSION, SESSION_ID_RE, SingleSessionManager
 from web.utils.simple import ReconnectableClient
 
 # ------------------------------
@@ -15,7 +20,8 @@ from web.utils.simple import ReconnectableClient
 # ------------------------------
 SAMPLE_RATE = 16000  # 與瀏覽器端相同
 AUDIO_FRAME_MS = 20  # 每 20ms 一幀音訊
-caption_websockets = []  # 所有字幕 WebSocket 連線
+AUDIO_QUEUE_FRAMES = 50  # 等待送往 IPC 的音訊幀上限，超過時丟棄最舊的
+caption_hub = CaptionHub()  # IPC 模式下所有字幕 WebSocket 連線與目前字幕狀態
 
 app = FastAPI()
 html_path = Path(__file__).parent / "static" / "index.html"
@@ -31,49 +37,144 @@ async def get_root():
     return HTMLResponse(html_path.read_text(encoding="utf-8"))
 
 
-@app.on_event("startup")
-async def on_startup():
-    global audio_conn, text_conn, caption_thread_running
-    audio_conn = ReconnectableClient(("localhost", 6000))
-    text_conn = ReconnectableClient(("localhost", 6001))
+# ------------------------------
+# Prometheus 指標：不掛在對外的 web app 上，另以 web_config.metrics_port 開獨立端點
+# ------------------------------
+def collect_metrics():
+    """抓取時讀取 session 數、字幕廣播與音訊轉送的統計"""
+    stats = sessions.stats()
+    yield (
+        "stt_web_sessions",
+        "gauge",
+        "目前的 session 數",
+        [({}, stats["sessions"])],
+    )
+    yield (
+        "stt_web_sessions_max",
+        "gauge",
+        "session 數上限",
+        [({}, stats["max_sessions"])],
+    )
+    yield (
+        "stt_web_sessions_rejected_total",
+        "counter",
+        "因 session 已滿而拒絕的連線數",
+        [({}, stats["rejected"])],
+    )
 
-    loop = asyncio.get_running_loop()
-    caption_thread_running = True
+    hubs = [({"session": s.id}, s.hub.stats()) for s in sessions.active()]
+    yield (
+        "stt_caption_clients",
+        "gauge",
+        "字幕 WebSocket 連線數",
+        [(label, h["clients"]) for label, h in hubs],
+    )
+    yield (
+        "stt_caption_coalesced_total",
+        "counter",
+        "觀眾跟不上而被合併成 keyframe 的訊息數",
+        [(label, h["coalesced"]) for label, h in hubs],
+    )
+    yield (
+        "stt_caption_slow_disconnects_total",
+        "counter",
+        "送出逾時而被關閉的字幕連線數",
+        [(label, h["slow_disconnects"]) for label, h in hubs],
+    )
 
-    def caption_listener():
-        while caption_thread_running:
-            if text_conn.poll(timeout=1):
-                text = text_conn.recv()
-                future = asyncio.run_coroutine_threadsafe(broadcast_caption(text), loop)
-                try:
-                    future.result()
-                except Exception as e:
-                    print("字幕傳送失敗：", e)
+    if audio_forwarder:
+        fwd = audio_forwarder.stats()
+        yield (
+            "stt_web_audio_dropped_total",
+            "counter",
+            "送往 IPC 前丟棄的音訊幀數",
+            [({}, fwd["dropped"])],
+        )
+        yield (
+            "stt_web_audio_queue_depth",
+            "gauge",
+            "等待送往 IPC 的音訊幀數",
+            [({}, fwd["queued"])],
+        )
 
-    threading.Thread(target=caption_listener, daemon=True).start()
+
+@app.on_event("startup")
+async def on_startup():
+    global sessions, audio_conn, audio_forwarder, background_tasks, metrics_server
+    config = load_config(None)
+    loop = asyncio.get_running_loop()
+    audio_conn = audio_forwarder = metrics_server = None
+    metrics.REGISTRY.register(collect_metrics)
+
+    # 指標端點與 main.py 相同，預設只綁定本機
+    web_cfg = config.get("web_config", {})
+    metrics_port = int(web_cfg.get("metrics_port", 0))
+    if metrics_port:
+        metrics_server = metrics.start_http_server(
+            metrics_port, web_cfg.get("metrics_host", "localhost")
+        )
+
+    if web_cfg.get("mode") == "inprocess":
+        # 引擎直接在本程序執行，不需另外啟動 main.py；每個 ?session= 各自一條管線
+        from web.utils.sessions import SessionManager
+
+        sessions = SessionManager(config, loop)
+        background_tasks = [asyncio.create_task(sessions.reap_loop())]
+        return
+
+    input_cfg = config.get("input_config", {})
+    if input_cfg.get("transport") == "shm":
+        # 寫入共享記憶體不會阻塞，不需要另外的傳送執行緒
+        audio_conn = ShmAudioWriter(input_cfg.get("shm_name", "stt_audio"))
+        sessions = SingleSessionManager(audio_conn, caption_hub)
+    else:
+        audio_conn = ReconnectableClient(
+            (input_cfg.get("host", "localhost"), int(input_cfg.get("port", 6000)))
+        )
+        audio_forwarder = AudioForwarder(audio_conn, AUDIO_QUEUE_FRAMES)
+        audio_forwarder.start()
+        sessions = SingleSessionManager(audio_forwarder, caption_hub)
+
+    # 原生 async 讀取字幕來源，不再需要背景 thread
+    background_tasks = [
+        asyncio.create_task(caption_hub.follow(caption_address(config)))
+    ]
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    global caption_thread_running
-    caption_thread_running = False  # 停止背景 thread
-    audio_conn.close()
-    text_conn.close()
+    metrics.REGISTRY.unregister(collect_metrics)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.to_thread(sessions.close)
+    if audio_forwarder:
+        await audio_forwarder.close()
+    if audio_conn:
+        audio_conn.close()
+    if metrics_server:
+        metrics_server.shutdown()
     print("[Server] 清理完成，準備關閉")
 
 
-# ------------------------------
-# 廣播字幕到所有 WebSocket Client
-# ------------------------------
-async def broadcast_caption(text: str):
-    disconnected = []
-    for ws in caption_websockets:
-        try:
-            await ws.send_text(text)
-        except Exception:
-            disconnected.append(ws)
-    for ws in disconnected:
-        caption_websockets.remove(ws)
+async def acquire_session(ws: WebSocket):
+    """
+    取得連線的 session，無法取得時關閉連線並回傳 None
+    - 名稱不合法，或 IPC 模式指定了 default 以外的 session：1008
+    - session 已滿：1013
+    """
+    session_id = ws.query_params.get("session")
+    if session_id is not None and not SESSION_ID_RE.fullmatch(session_id):
+        await ws.close(code=1008)  # 1008: Policy Violation，session 名稱不合法
+        return None
+    if session_id not in (None, DEFAULT_SESSION) and not sessions.multi_session:
+        # IPC 模式只有一條音訊與字幕管線，不能讓不同 session 無聲地共用
+        print(f"[Session] IPC 模式不支援多個 session，拒絕 {session_id}")
+        await ws.close(code=1008, reason="multiple sessions require inprocess mode")
+        return None
+    session = await sessions.acquire(session_id)
+    if session is None:
+        await ws.close(code=1013)  # 1013: Try Again Later，session 已滿
+    return session
 
 
 # ------------------------------
@@ -81,16 +182,21 @@ async def broadcast_caption(text: str):
 # ------------------------------
 @app.websocket("/ws/audio")
 async def websocket_audio(ws: WebSocket):
+    session = await acquire_session(ws)
+    if session is None:
+        return
     await ws.accept()
-    print("[Audio WebSocket] 已連線")
+    print(f"[Audio WebSocket] 已連線 ({session.id})")
     try:
         while True:
             audio_data = await ws.receive_bytes()
-            audio_conn.send_bytes(audio_data)
+            session.backend.submit(audio_data)  # 不在事件迴圈做阻塞的 I/O
     except WebSocketDisconnect:
-        print("[Audio WebSocket] 已斷線")
+        print(f"[Audio WebSocket] 已斷線 ({session.id})")
     except Exception as e:
         print(f"[Audio WebSocket] 錯誤：{e}")
+    finally:
+        sessions.release(session)
 
 
 # ------------------------------
@@ -98,19 +204,13 @@ async def websocket_audio(ws: WebSocket):
 # ------------------------------
 @app.websocket("/ws/caption")
 async def websocket_caption(ws: WebSocket):
-    await ws.accept()
-    caption_websockets.append(ws)
-    print("[Caption WebSocket] 已連線")
+    session = await acquire_session(ws)
+    if session is None:
+        return
     try:
-        while True:
-            # 收到 client 傳來的資料僅為 keep-alive，忽略內容
-            await ws.receive_text()
-    except WebSocketDisconnect:
-        caption_websockets.remove(ws)
-        print("[Caption WebSocket] 已斷線")
-    except Exception as e:
-        caption_websockets.remove(ws)
-        print(f"[Caption WebSocket] 錯誤：{e}")
+        await session.hub.serve(ws)
+    finally:
+        sessions.release(session)
 
 
 # ------------------------------
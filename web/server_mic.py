@@ -5,6 +5,7 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
+from web.utils.ingest import AudioForwarder
 from web.utils.simple import ReconnectableClient
 
 # ------------------------------
@@ -12,6 +13,7 @@ from web.utils.simple import ReconnectableClient
 # ------------------------------
 SAMPLE_RATE = 16000  # 與瀏覽器端相同
 AUDIO_FRAME_MS = 20  # 每 20ms 一幀音訊
+AUDIO_QUEUE_FRAMES = 50  # 等待送往 IPC 的音訊幀上限，超過時丟棄最舊的
 caption_websockets = []  # 所有字幕 WebSocket 連線
 
 app = FastAPI()
@@ -30,12 +32,15 @@ async def get_root():
 
 @app.on_event("startup")
 async def on_startup():
-    global audio_conn, caption_thread_running
+    global audio_conn, audio_forwarder
     audio_conn = ReconnectableClient(("localhost", 6000))
+    audio_forwarder = AudioForwarder(audio_conn, AUDIO_QUEUE_FRAMES)
+    audio_forwarder.start()
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await audio_forwarder.close()
     audio_conn.close()
     print("[Server] 清理完成，準備關閉")
 
@@ -49,7 +54,7 @@ async def websocket_audio(ws: WebSocket):
     try:
         while True:
             audio_data = await ws.receive_bytes()
-            audio_conn.send_bytes(audio_data)
+            audio_forwarder.submit(audio_data)  # 不在事件迴圈做阻塞的 pipe I/O
     except WebSocketDisconnect:
         print("[Audio WebSocket] 已斷線")
     except Exception as e:
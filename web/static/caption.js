@@ -0,0 +1,49 @@
+// 字幕增量協定解碼（對應 utils/caption_delta.py）
+class CaptionDecoder {
+    constructor() {
+        this.reset();
+    }
+
+    reset() {
+        this.seg = null;
+        this.text = '';
+    }
+
+    // 回傳目前字幕；與伺服器不同步時回傳 null，等待下一個 keyframe
+    apply(msg) {
+        switch (msg.type) {
+            case 'caption':
+                this.text = msg.text || '';
+                return this.text;
+            case 'key':
+                this.seg = msg.seg;
+                this.text = msg.text;
+                return this.text;
+        }
+        if (this.seg === null || msg.seg !== this.seg) {
+            if (msg.type === 'delta' && msg.pos === 0 && this.seg !== null) {
+                // 新段落的第一個 delta，可直接接上
+                this.seg = msg.seg;
+                this.text = msg.text;
+                return this.text;
+            }
+            return null;
+        }
+        if (msg.type === 'commit') {
+            this.seg += 1;
+            this.text = '';
+            return this.text;
+        }
+        if (msg.type === 'delta') {
+            // trim：滑動視窗截掉的開頭字數
+            const text = this.text.slice(msg.trim || 0);
+            if (msg.pos > text.length) {
+                this.seg = null; // 掉包，等待 keyframe
+                return null;
+            }
+            this.text = text.slice(0, msg.pos) + msg.text;
+            return this.text;
+        }
+        return null;
+    }
+}
@@ -1,26 +1,45 @@
-const TARGET_RATE = 16000;
+// 以瀏覽器原生取樣率送出 int16，抗混疊重取樣交給伺服器端 (utils/audio_format.py)
+// 幀格式：16 bytes header + PCM
+//   "AUD1" | sample_rate (uint32) | encoding (uint8, 1 = int16) | channels (uint8) | 保留 (uint16) | payload bytes (uint32)
+const FRAME_SEC = 0.02;     // 每 20 ms 一幀
+const HEADER_BYTES = 16;
+const ENCODING_INT16 = 1;
 
 class PCMWriter extends AudioWorkletProcessor {
     constructor() {
         super();
-        this.inputRate = sampleRate;                // 通常 48000
-        this.buf = [];
-        this.ratio = this.inputRate / TARGET_RATE;  // 3  (48k ➜ 16k)
+        this.frameSize = Math.round(sampleRate * FRAME_SEC);  // 48k ➜ 960 個取樣
+        this.buf = new Int16Array(this.frameSize);
+        this.pos = 0;
     }
 
     process(inputs) {
         const input = inputs[0][0];
         if (!input) return true;
 
-        // ---------- 簡單下採樣 (drop samples) ----------
-        for (let i = 0; i < input.length; i += this.ratio) {
-            this.buf.push(input[i]);
-            if (this.buf.length >= TARGET_RATE * 0.02) {  // 20 ms = 320 個 16k 取樣
-                const chunk = new Float32Array(this.buf.splice(0, TARGET_RATE * 0.02));
-                this.port.postMessage(chunk);           // 傳回主執行緒
+        for (let i = 0; i < input.length; i++) {
+            const s = Math.max(-1, Math.min(1, input[i]));
+            this.buf[this.pos++] = s < 0 ? s * 0x8000 : s * 0x7fff;
+            if (this.pos === this.frameSize) {
+                this.port.postMessage(this.frame());  // 傳回主執行緒
+                this.pos = 0;
             }
         }
         return true;
     }
+
+    frame() {
+        const payload = this.frameSize * 2;
+        const out = new Uint8Array(HEADER_BYTES + payload);
+        const view = new DataView(out.buffer);
+        out.set([0x41, 0x55, 0x44, 0x31]);  // "AUD1"
+        view.setUint32(4, sampleRate, true);
+        view.setUint8(8, ENCODING_INT16);
+        view.setUint8(9, 1);
+        view.setUint16(10, 0, true);
+        view.setUint32(12, payload, true);
+        new Int16Array(out.buffer, HEADER_BYTES).set(this.buf);
+        return out;
+    }
 }
 registerProcessor('pcm-writer', PCMWriter);
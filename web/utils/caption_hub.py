@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from utils import metrics
+from utils.caption_delta import CaptionDeltaDecoder
+from utils.framing import FRAME_HEADER, decode_payload
+
+# 只在事件迴圈上更新
+_FANOUT_LAG = metrics.histogram(
+    "stt_caption_fanout_lag_seconds", "字幕從 publish 到送達各觀眾的時間"
+)
+
+
+def caption_address(config: dict) -> tuple[str, int]:
+    """main.py 的 SocketOutputEngine 所在位置（與其讀取同一份 output_config）"""
+    output_cfg = config.get("output_config", {})
+    host = output_cfg.get("host", "localhost")
+    if host in ("", "0.0.0.0", "::"):
+        host = "localhost"  # 發布端綁定所有介面時，從本機連線
+    return host, int(output_cfg.get("port", 6001))
+
+
+async def read_frames(address, retry_interval: float = 3):
+    """
+    以 asyncio 直接讀取 SocketOutputEngine 的封包（不需背景執行緒）
+    格式與 multiprocessing.connection 相同：4 bytes 長度 (-1 時後接 8 bytes) + 內容
+    斷線時自動重連
+    """
+    host, port = address
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            print(f"[CaptionHub] 連線失敗：{e} {retry_interval} 秒後重試…")
+            await asyncio.sleep(retry_interval)
+            continue
+        print(f"[CaptionHub] 已連線到 {address}")
+        try:
+            while True:
+                (size,) = FRAME_HEADER.unpack(await reader.readexactly(4))
+                if size == -1:
+                    size = int.from_bytes(await reader.readexactly(8), "big")
+                yield await reader.readexactly(size)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"[CaptionHub] 連線中斷：{e or type(e).__name__}，重新連線…")
+        finally:
+            writer.close()
+
+
+class _CaptionClient:
+    """單一字幕連線：待送訊息槽 + 專屬 writer task"""
+
+    def __init__(self, ws: WebSocket, max_pending: int):
+        self.ws = ws
+        self.pending: deque[str] = deque(maxlen=max_pending)
+        self.wake = asyncio.Event()
+        self.since = 0.0  # 目前待送訊息中最早一則的 publish 時間
+
+    def push(self, data: str):
+        if not self.pending:
+            self.since = time.monotonic()
+        self.pending.append(data)
+        self.wake.set()
+
+    async def run(self, hub: "CaptionHub"):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            if not self.pending:
+                continue
+            if len(self.pending) > 1:
+                # 跟不上時以最新狀態取代積壓的增量訊息
+                hub.coalesced += len(self.pending) - 1
+                data = hub.keyframe_json()
+            else:
+                data = self.pending[0]
+            self.pending.clear()
+            since = self.since
+            try:
+                await asyncio.wait_for(self.ws.send_text(data), hub.send_timeout)
+                _FANOUT_LAG.observe(time.monotonic() - since)
+            except Exception:
+                hub.slow_disconnects += 1
+                try:
+                    await self.ws.close()
+                except Exception:
+                    pass
+                return
+
+
+class CaptionHub:
+    """
+    字幕廣播中心
+    - publish() 只把訊息放進各連線的槽並喚醒，不等待任何 send，延遲不隨觀眾數成長
+    - 每個連線有自己的 writer task，慢的觀眾只會收到合併後的 keyframe，不影響其他人
+    - 送出超過 send_timeout 的連線直接關閉
+    """
+
+    def __init__(self, max_pending: int = 16, send_timeout: float = 5.0):
+        self.max_pending = max(2, max_pending)
+        self.send_timeout = send_timeout
+        self.state = CaptionDeltaDecoder()  # 目前字幕狀態，供新連線與合併時的 keyframe 使用
+        self.coalesced = 0
+        self.slow_disconnects = 0
+        self._clients: set[_CaptionClient] = set()
+        self._key_json: str | None = None
+
+    def keyframe_json(self) -> str:
+        if self._key_json is None:
+            self._key_json = json.dumps(self.state.keyframe(), ensure_ascii=False)
+        return self._key_json
+
+    def publish(self, message: dict):
+        # 增量訊息原樣轉發，瀏覽器端以 caption.js 還原
+        self.state.apply(message)
+        self._key_json = None
+        data = json.dumps(message, ensure_ascii=False)
+        for client in self._clients:
+            client.push(data)
+
+    async def follow(self, address):
+        """持續讀取字幕來源並廣播，於 startup 以 task 執行"""
+        async for payload in read_frames(address):
+            try:
+                self.publish(decode_payload(payload))
+            except ValueError as e:
+                print("字幕解析失敗：", e)
+
+    async def serve(self, ws: WebSocket):
+        await ws.accept()
+        client = _CaptionClient(ws, self.max_pending)
+        client.push(self.keyframe_json())
+        self._clients.add(client)
+        writer = asyncio.create_task(client.run(self))
+        print("[Caption WebSocket] 已連線")
+        try:
+            while True:
+                # 收到 client 傳來的資料僅為 keep-alive，忽略內容
+                await ws.receive_text()
+        except WebSocketDisconnect:
+            print("[Caption WebSocket] 已斷線")
+        except Exception as e:
+            print(f"[Caption WebSocket] 錯誤：{e}")
+        finally:
+            self._clients.discard(client)
+            writer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "coalesced": self.coalesced,
+            "slow_disconnects": self.slow_disconnects,
+        }
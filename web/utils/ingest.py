@@ -0,0 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AudioForwarder:
+    """
+    將 WebSocket 收到的音訊轉交給 IPC 連線
+    - 事件迴圈只做 put_nowait，永遠不會因 pipe 阻塞而卡住其他連線
+    - 專屬執行緒負責 send_bytes，一次把佇列中累積的幀合併送出
+    - 佇列滿時丟棄最舊的幀（即時字幕寧可跳過也不要延遲）並計數
+    """
+
+    def __init__(self, client, max_frames: int = 50, max_batch: int = 8):
+        self.client = client
+        self.max_frames = max_frames
+        self.max_batch = max_batch
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="audio-ipc"
+        )
+
+    def start(self):
+        """需在事件迴圈內呼叫（例如 startup 事件）"""
+        self._queue = asyncio.Queue(maxsize=self.max_frames)
+        self._task = asyncio.create_task(self._sender())
+
+    def submit(self, data: bytes) -> bool:
+        """放入一幀音訊，回傳 False 表示有舊幀被丟棄"""
+        self.received += 1
+        kept = True
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+            kept = False
+            if self.dropped % 100 == 1:
+                print(f"[AudioForwarder] IPC 傳送跟不上，已丟棄 {self.dropped} 幀")
+        self._queue.put_nowait(data)
+        return kept
+
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            frames = [await self._queue.get()]
+            while len(frames) < self.max_batch and not self._queue.empty():
+                frames.append(self._queue.get_nowait())
+            try:
+                await loop.run_in_executor(
+                    self._executor, self.client.send_bytes, b"".join(frames)
+                )
+                self.sent += len(frames)
+            except Exception as e:
+                print(f"[AudioForwarder] 傳送失敗：{e}")
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
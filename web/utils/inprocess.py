@@ -0,0 +1,57 @@
+import asyncio
+
+from engines.output import CallbackOutputEngine
+from engines.pipeline import SpeechPipeline
+from engines.voice_input import MemoryInputEngine
+from utils.caption_delta import CaptionDeltaEncoder
+
+
+class InProcessBackend:
+    """
+    在 web server 程序內直接執行 SpeechPipeline，取代連到 main.py 的 6000 / 6001 兩條 IPC
+    - /ws/audio 的音訊直接推入 MemoryInputEngine
+    - 字幕經 CallbackOutputEngine 編成增量訊息，交給事件迴圈上的 CaptionHub 廣播
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        hub,
+        loop: asyncio.AbstractEventLoop,
+        scheduler=None,
+        session: str = "default",
+        translator=None,
+    ):
+        self.hub = hub
+        self.loop = loop
+        self.encoder = CaptionDeltaEncoder(
+            config["output_config"].get("keyframe_interval", 50)
+        )
+        self.input_engine = MemoryInputEngine(config["input_config"])
+        self.output_engine = CallbackOutputEngine({}, self._on_caption)
+        self.pipeline = SpeechPipeline.from_config(
+            config,
+            self.input_engine,
+            self.output_engine,
+            scheduler,
+            session,
+            translator,
+        )
+
+    def _on_caption(self, text: str):
+        # 於 pipeline 的輸出執行緒呼叫，廣播一律排回事件迴圈執行
+        for message in self.encoder.encode(text):
+            self.loop.call_soon_threadsafe(self.hub.publish, message)
+
+    def start(self):
+        self.input_engine.start()
+        self.pipeline.start()
+
+    def submit(self, data: bytes) -> bool:
+        self.input_engine.push(data)
+        return True
+
+    def stop(self):
+        self.pipeline.stop()
+        self.input_engine.stop()
+        self.output_engine.stop()
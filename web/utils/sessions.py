@@ -0,0 +1,195 @@
+import asyncio
+import re
+import threading
+import time
+
+from utils.common import deep_update
+
+SESSION_ID_RE = re.compile(r"[\w-]{1,64}")
+DEFAULT_SESSION = "default"
+
+
+class Session:
+    """一個說話者：自己的音訊緩衝、轉錄狀態與字幕頻道"""
+
+    def __init__(self, session_id: str, backend, hub):
+        self.id = session_id
+        self.backend = backend  # 需提供 submit(bytes)
+        self.hub = hub
+        self.clients = 0
+        self.idle_since = time.monotonic()
+
+
+class SessionManager:
+    """
+    依 ?session= 參數把連線分派到各自的 session
+    - 每個 session 有獨立的 SpeechPipeline，STT 模型與翻譯引擎由所有 session 共用
+    - 解碼經 DecodeScheduler 排隊，同時解碼數受 max_concurrent_decodes 限制
+    - session 數達 max_sessions 時拒絕新的 session（admission control）
+    - 只有 inprocess 模式支援多個 session
+    - 沒有任何連線超過 session_idle_timeout 秒的 session 會被回收
+    """
+
+    multi_session = True
+
+    def __init__(self, config: dict, loop: asyncio.AbstractEventLoop):
+        from engines.transcribe import DecodeScheduler
+
+        web_cfg = config.get("web_config", {})
+        self.max_sessions = max(1, int(web_cfg.get("max_sessions", 4)))
+        self.idle_timeout = float(web_cfg.get("session_idle_timeout", 60))
+        self.scheduler = DecodeScheduler(
+            int(web_cfg.get("max_concurrent_decodes", 1))
+        )
+        self.loop = loop
+        self.sessions: dict[str, Session] = {}
+        self._pending: dict[str, asyncio.Future] = {}  # 建立中的 session，已佔用名額
+        self.rejected = 0
+        self._lock = asyncio.Lock()
+
+        trans_cfg = config.get("translate_config", {})
+        if self.max_sessions > 1 and trans_cfg.get("engine_type") in ("nllb", "m2m"):
+            # 多 session 時改走共用的批次翻譯服務，避免每個 session 各載一份模型
+            batch_size = max(2, int(trans_cfg.get("batch_size", 1)))
+            config = deep_update(
+                config, {"translate_config": {"batch_size": batch_size}}
+            )
+        self.config = config
+        self.translator = None
+        self._translator_lock = threading.Lock()
+
+    def _shared_translator(self):
+        # 第一個 session 建立時才載入，之後的 session 共用同一個翻譯引擎
+        with self._translator_lock:
+            if self.translator is None:
+                from engines.pipeline import SpeechPipeline
+
+                self.translator = SpeechPipeline.create_translator(self.config)
+            return self.translator
+
+    async def acquire(self, session_id: str | None) -> Session | None:
+        """取得（必要時建立）session；名稱不合法或已滿時回傳 None"""
+        session_id = session_id or DEFAULT_SESSION
+        if not SESSION_ID_RE.fullmatch(session_id):
+            return None
+
+        # 鎖內只保留名額，建立管線（載入模型可能需要數秒）在鎖外進行，
+        # 不會擋住其他 session 的連線；同名的連線等待同一次建立
+        async with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.clients += 1
+                return session
+            pending = self._pending.get(session_id)
+            creating = pending is None
+            if creating:
+                if len(self.sessions) + len(self._pending) >= self.max_sessions:
+                    self.rejected += 1
+                    print(f"[Session] 已達上限，拒絕 {session_id}")
+                    return None
+                pending = self._pending[session_id] = self.loop.create_future()
+
+        if not creating:
+            session = await asyncio.shield(pending)
+            if session is not None:
+                session.clients += 1
+            return session
+
+        session = None
+        try:
+            session = await asyncio.to_thread(self._create, session_id)
+        finally:
+            async with self._lock:
+                del self._pending[session_id]
+                if session is not None:
+                    self.sessions[session_id] = session
+                    count = f"{len(self.sessions)}/{self.max_sessions}"
+                    print(f"[Session] 建立 {session_id}（{count}）")
+            pending.set_result(session)  # 建立失敗時等待者取得 None
+        session.clients += 1
+        return session
+
+    def _create(self, session_id: str) -> Session:
+        from web.utils.caption_hub import CaptionHub
+        from web.utils.inprocess import InProcessBackend
+
+        hub = CaptionHub()
+        backend = InProcessBackend(
+            self.config,
+            hub,
+            self.loop,
+            self.scheduler,
+            session_id,
+            self._shared_translator(),
+        )
+        backend.start()
+        self.scheduler.join()
+        return Session(session_id, backend, hub)
+
+    def release(self, session: Session):
+        session.clients -= 1
+        if session.clients <= 0:
+            session.idle_since = time.monotonic()
+
+    async def reap_loop(self, interval: float = 5):
+        """定期回收閒置的 session，於 startup 以 task 執行"""
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            async with self._lock:
+                idle = [
+                    s
+                    for s in self.sessions.values()
+                    if s.clients <= 0 and now - s.idle_since >= self.idle_timeout
+                ]
+                for session in idle:
+                    del self.sessions[session.id]
+            for session in idle:
+                await asyncio.to_thread(session.backend.stop)
+                self.scheduler.leave()
+                print(f"[Session] 回收閒置的 {session.id}")
+
+    def active(self) -> list[Session]:
+        return list(self.sessions.values())
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "rejected": self.rejected,
+            **self.scheduler.stats(),
+        }
+
+    def close(self):
+        for session in self.sessions.values():
+            session.backend.stop()
+            self.scheduler.leave()
+        self.sessions.clear()
+
+
+class SingleSessionManager:
+    """
+    IPC 模式：只有一條連到 main.py 的管線，所有連線共用同一個 session
+    字幕只有一個頻道，無法依 ?session= 分開，指定其他 session 的連線由 server 拒絕
+    """
+
+    multi_session = False
+
+    def __init__(self, backend, hub):
+        self.session = Session(DEFAULT_SESSION, backend, hub)
+
+    async def acquire(self, session_id: str | None) -> Session:
+        self.session.clients += 1
+        return self.session
+
+    def release(self, session: Session):
+        session.clients -= 1
+
+    def active(self) -> list[Session]:
+        return [self.session]
+
+    def stats(self) -> dict:
+        return {"sessions": 1, "max_sessions": 1, "rejected": 0}
+
+    def close(self):
+        pass
@@ -2,12 +2,16 @@ import threading
 import time
 from multiprocessing.connection import Client, Connection
 
+from utils.ingest_server import session_hello
+
 
 class ReconnectableClient:
-    def __init__(self, address, authkey=None, retry_interval=3):
+    def __init__(self, address, authkey=None, retry_interval=3, session=None):
         self.address = address
         self.authkey = authkey
         self.retry_interval = retry_interval
+        # 連到 SocketInputEngine 時，每次連線先宣告 session，重連後接續同一條串流
+        self.session = session
         self.conn: Connection | None = None
         self.running = True
         self.lock = threading.Lock()
@@ -19,6 +23,8 @@ class ReconnectableClient:
             if self.conn is None:
                 try:
                     conn = Client(self.address, authkey=self.authkey)
+                    if self.session:
+                        conn.send_bytes(session_hello(self.session))
                     with self.lock:
                         self.conn = conn
                     print(f"[ReconnectableClient] 已連線到 {self.address}")
@@ -49,6 +55,16 @@ class ReconnectableClient:
                     self.conn = None
         return False
 
+    def recv_bytes(self):
+        with self.lock:
+            if self.conn:
+                try:
+                    return self.conn.recv_bytes()
+                except Exception:
+                    print("[ReconnectableClient] recv 失敗，重設連線")
+                    self.conn = None
+        return None
+
     def recv(self):
         with self.lock:
             if self.conn: